@@ -0,0 +1,262 @@
+import heapq
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from models import db, Product, Category
+from cache import analytics_cache
+from rollups import day_start, day_end
+from sharding import current_store
+from archive import archived_partitions
+from money import to_amount
+
+# Sales analytics over arbitrary date ranges: top sellers, ABC classes,
+# hour x weekday heatmap, basket sizes and category breakdown.
+#
+# The line items of a range are fetched once, as plain tuples from a raw DBAPI
+# cursor (no ORM objects, no Row wrappers), and turned into columns. Every metric
+# is then a couple of whole-column passes: factorize a key column into dense codes
+# and bincount a weight column over them, the same shape as numpy.unique/bincount,
+# kept in the standard library since NumPy is not a dependency. Revenue is summed in
+# integer cents (see money.py) and converted to currency units in the results. Results
+# are cached per (metric, range, parameters); see ANALYTICS_CACHE_TTL.
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# Hours and weekdays are UTC, like every stored timestamp; strftime('%w') counts from Sunday
+_LINES_SQL = """
+    SELECT d.transaction_id, d.product_id, COALESCE(d.quantity, 0), COALESCE(d.subtotal, 0), p.category_id,
+           CAST(strftime('%H', t.date_time) AS INTEGER), (CAST(strftime('%w', t.date_time) AS INTEGER) + 6) % 7
+    FROM "transaction" t
+    JOIN transaction_detail d ON d.transaction_id = t.transaction_id
+    LEFT JOIN product p ON p.product_id = d.product_id
+    WHERE t.date_time >= ? AND t.date_time < ?
+"""
+# Archive files hold no catalog: categories of archived lines are looked up separately
+_ARCHIVED_LINES_SQL = """
+    SELECT d.transaction_id, d.product_id, COALESCE(d.quantity, 0), COALESCE(d.subtotal, 0),
+           CAST(strftime('%H', t.date_time) AS INTEGER), (CAST(strftime('%w', t.date_time) AS INTEGER) + 6) % 7
+    FROM "transaction" t
+    JOIN transaction_detail d ON d.transaction_id = t.transaction_id
+    WHERE t.date_time >= ? AND t.date_time < ?
+"""
+
+
+class AnalyticsError(ValueError):
+    """Bad metric or parameter; the message is safe to return to the client."""
+
+
+class SalesColumns:
+    """Line items of a date range as parallel columns."""
+
+    FIELDS = ('transaction_id', 'product_id', 'quantity', 'revenue', 'category_id', 'hour', 'weekday')
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) or [()] * len(self.FIELDS)
+        for name, column in zip(self.FIELDS, columns):
+            setattr(self, name, column)
+        self.size = len(rows)
+
+
+def _fetch(connection, sql, params):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def load_columns(start, end):
+    """Every line item sold start..end inclusive, archived ones too; bypasses the ORM (and the per-request metrics)."""
+    params = (str(day_start(start)), str(day_end(end)))
+    rows = _fetch(db.session.connection().connection, _LINES_SQL, params)
+    archived = []
+    with archived_partitions(start, end) as connections:
+        for connection in connections:
+            archived += _fetch(connection, _ARCHIVED_LINES_SQL, params)
+    if archived:
+        categories = dict(db.session.query(Product.product_id, Product.category_id))
+        rows += [(tid, pid, quantity, revenue, categories.get(pid), hour, weekday)
+                 for tid, pid, quantity, revenue, hour, weekday in archived]
+    return SalesColumns(rows)
+
+
+# ---------------- Column kernels ----------------
+
+def factorize(values):
+    """(uniques, codes) with codes[i] the position of values[i] in uniques."""
+    positions = {}
+    codes = [positions.setdefault(value, len(positions)) for value in values]
+    return list(positions), codes
+
+
+def bincount(codes, size, weights=None):
+    """Per-code count, or per-code sum of weights."""
+    totals = [0] * size
+    if weights is None:
+        for code in codes:
+            totals[code] += 1
+    else:
+        for code, weight in zip(codes, weights):
+            totals[code] += weight
+    return totals
+
+
+def _share(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))] if ordered else 0
+
+
+# ---------------- Metrics ----------------
+
+def top_products(columns, by='revenue', limit=10):
+    product_ids, codes = factorize(columns.product_id)
+    units = bincount(codes, len(product_ids), columns.quantity)
+    revenue = bincount(codes, len(product_ids), columns.revenue)
+    ranked = heapq.nlargest(limit, range(len(product_ids)), key=(revenue if by == 'revenue' else units).__getitem__)
+    names = dict(db.session.query(Product.product_id, Product.product_name)
+                 .filter(Product.product_id.in_([product_ids[i] for i in ranked])))
+    total = sum(revenue)
+    return {
+        'by': by,
+        'products': [
+            {
+                'product_id': product_ids[i],
+                'product_name': names.get(product_ids[i]),
+                'units': units[i],
+                'revenue': to_amount(revenue[i]),
+                'revenue_share': _share(revenue[i], total)
+            }
+            for i in ranked
+        ]
+    }
+
+
+def abc_classes(columns):
+    """Pareto classes by revenue: A up to ANALYTICS_ABC_A of cumulative revenue, B up to ANALYTICS_ABC_B, C the rest."""
+    a_limit = current_app.config.get('ANALYTICS_ABC_A', 0.8)
+    b_limit = current_app.config.get('ANALYTICS_ABC_B', 0.95)
+    product_ids, codes = factorize(columns.product_id)
+    revenue = bincount(codes, len(product_ids), columns.revenue)
+    total = sum(revenue)
+    classes = {name: {'products': 0, 'revenue': 0} for name in 'ABC'}
+    products = []
+    cumulative = 0
+    for i in sorted(range(len(product_ids)), key=revenue.__getitem__, reverse=True):
+        # A product belongs to the class its first unit of revenue falls in
+        share = cumulative / total if total else 1.0
+        name = 'A' if share < a_limit else 'B' if share < b_limit else 'C'
+        cumulative += revenue[i]
+        classes[name]['products'] += 1
+        classes[name]['revenue'] += revenue[i]
+        products.append({'product_id': product_ids[i], 'class': name, 'revenue': to_amount(revenue[i])})
+    for summary in classes.values():
+        summary['revenue_share'] = _share(summary['revenue'], total)
+        summary['revenue'] = to_amount(summary['revenue'])
+    return {'thresholds': {'A': a_limit, 'B': b_limit}, 'classes': classes, 'products': products}
+
+
+def heatmap(columns):
+    """7 x 24 grids (Monday first, UTC hours) of revenue and transaction counts."""
+    cells = [weekday * 24 + hour for weekday, hour in zip(columns.weekday, columns.hour)]
+    revenue = bincount(cells, 7 * 24, columns.revenue)
+    # Every line of a transaction shares its cell: count each transaction once
+    transaction_ids, codes = factorize(columns.transaction_id)
+    transaction_cells = [0] * len(transaction_ids)
+    for code, cell in zip(codes, cells):
+        transaction_cells[code] = cell
+    transactions = bincount(transaction_cells, 7 * 24)
+    return {
+        'weekdays': list(WEEKDAYS),
+        'hours': list(range(24)),
+        'revenue': [[to_amount(value) for value in revenue[day * 24:(day + 1) * 24]] for day in range(7)],
+        'transactions': [transactions[day * 24:(day + 1) * 24] for day in range(7)]
+    }
+
+
+def basket_sizes(columns):
+    transaction_ids, codes = factorize(columns.transaction_id)
+    units = sorted(bincount(codes, len(transaction_ids), columns.quantity))
+    lines = bincount(codes, len(transaction_ids))
+    value = bincount(codes, len(transaction_ids), columns.revenue)
+    count = len(transaction_ids)
+    return {
+        'transactions': count,
+        'mean_units': round(sum(units) / count, 2) if count else 0.0,
+        'median_units': _percentile(units, 50),
+        'p90_units': _percentile(units, 90),
+        'mean_lines': round(sum(lines) / count, 2) if count else 0.0,
+        'mean_value': round(sum(value) / count / 100, 2) if count else 0.0,
+        'distribution': [{'units': size, 'transactions': n} for size, n in sorted(Counter(units).items())]
+    }
+
+
+def category_breakdown(columns):
+    category_ids, codes = factorize(columns.category_id)
+    units = bincount(codes, len(category_ids), columns.quantity)
+    revenue = bincount(codes, len(category_ids), columns.revenue)
+    names = dict(db.session.query(Category.category_id, Category.category_name))
+    total = sum(revenue)
+    rows = [
+        {
+            'category_id': category_id,
+            'category_name': names.get(category_id, 'Uncategorized'),
+            'units': units[i],
+            'revenue': to_amount(revenue[i]),
+            'revenue_share': _share(revenue[i], total)
+        }
+        for i, category_id in enumerate(category_ids)
+    ]
+    return sorted(rows, key=lambda row: row['revenue'], reverse=True)
+
+
+METRICS = {
+    'top': lambda columns, by, limit: top_products(columns, by, limit),
+    'abc': lambda columns, by, limit: abc_classes(columns),
+    'heatmap': lambda columns, by, limit: heatmap(columns),
+    'baskets': lambda columns, by, limit: basket_sizes(columns),
+    'categories': lambda columns, by, limit: category_breakdown(columns),
+}
+
+
+def _ttl(end):
+    # A range that includes today still changes with every sale; older days only through offline syncs
+    if end >= datetime.utcnow().date():
+        return current_app.config.get('ANALYTICS_CACHE_TTL', 60)
+    return current_app.config.get('ANALYTICS_HISTORY_CACHE_TTL', 3600)
+
+
+def validate_args(start, end, metrics=None, by='revenue'):
+    """The metric names to compute; raises AnalyticsError on anything the endpoint should reject."""
+    metrics = list(metrics or METRICS)
+    unknown = [name for name in metrics if name not in METRICS]
+    if unknown:
+        raise AnalyticsError(f"Unknown metric {unknown[0]}; expected one of {', '.join(METRICS)}")
+    if by not in ('revenue', 'units'):
+        raise AnalyticsError("'by' must be revenue or units")
+    max_days = current_app.config.get('ANALYTICS_MAX_DAYS')
+    if max_days and (end - start).days + 1 > max_days:
+        raise AnalyticsError(f'Range must not exceed {max_days} days')
+    return metrics
+
+
+def sales_analytics(start, end, metrics=None, by='revenue', limit=10):
+    """{metric: result} for start..end inclusive; line items are loaded at most once per call."""
+    metrics = validate_args(start, end, metrics, by)
+    columns = []
+
+    def compute(name):
+        if not columns:
+            columns.append(load_columns(start, end))
+        return METRICS[name](columns[0], by, limit)
+
+    result = {'start': str(start), 'end': str(end)}
+    for name in metrics:
+        # by/limit only shape the top list; the other metrics share one entry per range
+        key = (current_store(), name, start, end) + ((by, limit) if name == 'top' else ())
+        result[name] = analytics_cache.get_or_set(key, lambda: compute(name), ttl=_ttl(end))
+    return result
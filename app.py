@@ -1,18 +1,40 @@
 from flask import Flask, request, jsonify
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, Product, InventoryLog, User
-from config import Config
+from config import get_config
 from routes import initialize_routes
+from rollups import rollups_cli
+from product_io import products_cli
+from ledger import ledger_cli
+from jobs import jobs_cli
+from forecast import forecast_cli
+from journal import journal_cli
+from stores import stores_cli
+from archive import archive_cli
+from sqlite_tuning import configure_sqlite
+from sharding import configure_stores
+from auth import auth, AuthError
+from product_search import exclude_search_tables, normalize_code
+from money import to_cents
 
 app = Flask(__name__)
-app.config.from_object(Config)
+app.config.from_object(get_config())
 
+configure_stores(app)  # one database bind per store, before the engines are created
 db.init_app(app)
-migrate = Migrate(app, db)
+configure_sqlite(app)
+migrate = Migrate(app, db, include_name=exclude_search_tables)
 
 # Register all API routes
 initialize_routes(app)
+app.cli.add_command(rollups_cli)
+app.cli.add_command(products_cli)
+app.cli.add_command(ledger_cli)
+app.cli.add_command(jobs_cli)
+app.cli.add_command(forecast_cli)
+app.cli.add_command(journal_cli)
+app.cli.add_command(stores_cli)
+app.cli.add_command(archive_cli)
 
 @app.route('/')
 def index():
@@ -32,7 +54,7 @@ def register():
     if User.query.filter_by(username=username).first():
         return jsonify({"message": "Username already exists"}), 400
 
-    hashed_pw = generate_password_hash(password)
+    hashed_pw = auth.hash_password(password)
     new_user = User(username=username, password=hashed_pw, role=role)
     db.session.add(new_user)
     db.session.commit()
@@ -49,23 +71,36 @@ def login_user():
     if not username or not password:
         return jsonify({"message": "Username and password required"}), 400
 
-    user = User.query.filter_by(username=username).first()
-    if not user or not check_password_hash(user.password, password):
-        return jsonify({"message": "Invalid username or password"}), 401
+    try:
+        user = auth.authenticate(username, password)
+    except AuthError as e:
+        return jsonify({"message": str(e)}), e.status, e.headers
 
+    # Terminals send the token as "Authorization: Bearer <token>" and refresh it before it expires
     return jsonify({
         "message": f"Welcome {user.role}!",
         "user_id": user.user_id,
         "username": user.username,
-        "role": user.role
+        "role": user.role,
+        "token": auth.issue_token(user),
+        "expires_in": app.config['AUTH_TOKEN_TTL']
     }), 200
 
+# 🔑 Refresh an API token (no password, no hashing)
+@app.route('/api/token', methods=['POST'])
+def refresh_token():
+    identity = auth.bearer_identity()
+    user = identity and db.session.get(User, identity['user_id'])
+    if not user:
+        return jsonify({"message": "Invalid or expired token"}), 401
+    return jsonify({"token": auth.issue_token(user), "expires_in": app.config['AUTH_TOKEN_TTL']}), 200
+
 # 📦 Add product
 @app.route('/api/add_product', methods=['POST'])
 def add_product():
     product_name = request.form['product_name']
     category_id = request.form['category_id']
-    price = float(request.form['price'])
+    price = to_cents(request.form['price'], 'price')
     stock_quantity = int(request.form['stock_quantity'])
     unit = request.form['unit']
 
@@ -74,11 +109,13 @@ def add_product():
         category_id=category_id,
         price=price,
         stock_quantity=stock_quantity,
-        unit=unit
+        unit=unit,
+        sku=normalize_code(request.form.get('sku')),
+        barcode=normalize_code(request.form.get('barcode'))
     )
     db.session.add(new_product)
     db.session.commit()
-    print(f"Product added: {new_product.product_id}")
+    app.logger.info("Product added: %s", new_product.product_id)
 
     if stock_quantity > 0:
         log = InventoryLog(
@@ -89,7 +126,7 @@ def add_product():
         )
         db.session.add(log)
         db.session.commit()
-        print(f"Inventory log added: {log.log_id}")
+        app.logger.info("Inventory log added: %s", log.log_id)
 
     return jsonify({"message": "Product added successfully!"})
 
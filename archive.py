@@ -0,0 +1,314 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from urllib.request import pathname2url
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Column, Index, MetaData, Table, and_, bindparam, create_engine, func, insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Transaction, TransactionDetail, Payment, InventoryLog, StockSnapshot, ArchivedPeriod
+from ledger import take_snapshots
+from stock import run_with_retry
+from sharding import current_store, store_context
+from money import convert_to_cents
+
+# Period-end archival.
+#
+# Sales (transaction, transaction_detail, payment) and inventory logs dated before
+# the last ARCHIVE_AFTER_MONTHS whole months are moved, a month at a time, into one
+# SQLite file per month in ARCHIVE_DIR, so the hot tables stay a bounded size however
+# old the store is. The DailySales/DailyProductSales rollups stay, so the dashboard
+# and range reports are unchanged; reports that need the raw rows of an archived
+# month (analytics) read the archive files too, see archived_partitions.
+#
+# A month is copied into its file and committed first, then deleted from the hot
+# tables, so a crash in between only means the copy is repeated (and skipped) on the
+# next run. Every log is covered by a ledger snapshot before it moves, and the moved
+# logs of each product are replaced by one 'Archived' balance row that keeps the
+# highest moved log_id, so the ledger sum and snapshot marks stay what they were.
+#
+# Archiving frees pages, not disk space: reclaim_space() runs an incremental vacuum
+# (auto_vacuum=INCREMENTAL, see SQLITE_PRAGMAS) in short steps after every run, or,
+# for a database created before that pragma, one full VACUUM that also converts it.
+#
+# Archive files written before amounts were stored in cents are converted the first
+# time this process writes to or reads from them (see upgrade_file).
+
+ARCHIVE_SCHEMA = 'archive'
+BALANCE = 'Archived'
+
+_transaction = Transaction.__table__
+_detail = TransactionDetail.__table__
+_payment = Payment.__table__
+_log = InventoryLog.__table__
+_snapshot = StockSnapshot.__table__
+_period = ArchivedPeriod.__table__
+
+_archive_metadata = MetaData()
+
+
+def _archive_table(table, *indexed):
+    # Same columns, no foreign keys: users and products stay in the hot database
+    return Table(table.name, _archive_metadata,
+                 *[Column(c.name, c.type, primary_key=c.primary_key) for c in table.columns],
+                 *[Index(f'ix_{table.name}_{name}', name) for name in indexed], schema=ARCHIVE_SCHEMA)
+
+
+ARCHIVED_TABLES = {
+    _transaction: _archive_table(_transaction, 'date_time'),
+    _detail: _archive_table(_detail, 'transaction_id'),
+    _payment: _archive_table(_payment, 'transaction_id'),
+    _log: _archive_table(_log, 'product_id', 'date_time'),
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def cutoff(today=None):
+    """First day kept in the hot tables: the start of the month ARCHIVE_AFTER_MONTHS before this one."""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - current_app.config.get('ARCHIVE_AFTER_MONTHS', 12)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def hot_since():
+    """First day the hot tables hold every sale for, or None when nothing has been archived."""
+    return db.session.query(func.max(ArchivedPeriod.period_end)).scalar()
+
+
+def archive_path(file_name):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], file_name)
+
+
+_upgraded = set()  # archive files known to be in the current format
+
+
+def upgrade_file(path):
+    """Bring an existing archive file to the current format (integer cents); checked once per process."""
+    if path in _upgraded or not os.path.exists(path):
+        return
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        convert_to_cents(engine)
+    finally:
+        engine.dispose()
+    _upgraded.add(path)
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _selections(end):
+    """Per hot table, the rows a move up to end takes."""
+    sale_ids = select(_transaction.c.transaction_id).where(_transaction.c.date_time < end)
+    mark = select(func.max(_snapshot.c.last_log_id)).where(
+        _snapshot.c.product_id == _log.c.product_id).scalar_subquery()
+    return {
+        _transaction: _transaction.c.date_time < end,
+        _detail: _detail.c.transaction_id.in_(sale_ids),
+        _payment: _payment.c.transaction_id.in_(sale_ids),
+        # Only logs a snapshot already counts; balance rows stay hot
+        _log: and_(_log.c.date_time < end, func.coalesce(_log.c.change_type, '') != BALANCE, _log.c.log_id <= mark),
+    }
+
+
+def _oldest(end):
+    """Oldest date_time still in the hot tables before end, or None."""
+    where = _selections(end)
+    found = [db.session.query(func.min(table.c.date_time)).filter(where[table]).scalar()
+             for table in (_transaction, _log)]
+    return min((at for at in found if at is not None), default=None)
+
+
+def archive_month(month):
+    """Move the rows dated before the end of month into month's archive file; returns (sales, logs) moved."""
+    end = _midnight(next_month(month))
+    file_name = f"{current_store() or 'pos'}-{month:%Y-%m}.db"
+    os.makedirs(current_app.config['ARCHIVE_DIR'], exist_ok=True)
+    where = _selections(end)
+    moved_logs = or_(where[_log], _log.c.change_type == BALANCE)
+
+    upgrade_file(archive_path(file_name))
+    with db.session.get_bind(mapper=Transaction.__mapper__).connect() as conn:
+        conn.exec_driver_sql(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (archive_path(file_name),))
+        try:
+            _archive_metadata.create_all(conn)
+            for table, archived in ARCHIVED_TABLES.items():
+                # OR IGNORE: rows copied by a run that died before deleting them are already there
+                conn.execute(insert(archived).prefix_with('OR IGNORE').from_select(
+                    [c.name for c in table.columns], select(*table.columns).where(where[table])))
+            conn.commit()
+
+            for table, archived in ARCHIVED_TABLES.items():
+                key = table.primary_key.columns[0]
+                missing = conn.execute(select(func.count()).select_from(table).where(
+                    where[table], key.not_in(select(archived.c[key.name])))).scalar()
+                if missing:
+                    raise ArchiveError(f'{missing} {table.name} rows did not reach {file_name}')
+
+            first_at, last_at, counts = None, None, {}
+            for table in (_transaction, _log):
+                low, high, counts[table] = conn.execute(select(
+                    func.min(table.c.date_time), func.max(table.c.date_time), func.count()).where(where[table])).one()
+                first_at = min(filter(None, (first_at, low)), default=None)
+                last_at = max(filter(None, (last_at, high)), default=None)
+            sales, logs = counts[_transaction], counts[_log]
+            balances = conn.execute(select(
+                _log.c.product_id, func.sum(_log.c.quantity_change), func.max(_log.c.log_id), func.max(_log.c.date_time)
+            ).where(moved_logs).group_by(_log.c.product_id)).all()
+
+            for table in (_detail, _payment, _transaction):
+                conn.execute(table.delete().where(where[table]))
+            conn.execute(_log.delete().where(moved_logs))
+            if balances:
+                conn.execute(insert(_log), [
+                    {'log_id': log_id, 'product_id': product_id, 'change_type': BALANCE, 'quantity_change': quantity,
+                     'remarks': f'Balance of the logs archived through {month:%Y-%m}', 'date_time': at}
+                    for product_id, quantity, log_id, at in balances
+                ])
+                # A snapshot below a balance row would count the archived logs twice
+                conn.execute(_snapshot.delete().where(
+                    _snapshot.c.product_id == bindparam('pid'), _snapshot.c.last_log_id < bindparam('mark')
+                ), [{'pid': product_id, 'mark': log_id} for product_id, _, log_id, _ in balances])
+
+            stmt = sqlite_insert(_period).values(
+                month=f'{month:%Y-%m}', file_name=file_name, period_end=next_month(month), first_at=first_at,
+                last_at=last_at, transactions=sales, inventory_logs=logs, archived_at=datetime.utcnow())
+            conn.execute(stmt.on_conflict_do_update(index_elements=['month'], set_={
+                # Late-synced sales of an archived month are moved into the same file by a later run
+                'first_at': func.min(func.coalesce(_period.c.first_at, stmt.excluded.first_at),
+                                     func.coalesce(stmt.excluded.first_at, _period.c.first_at)),
+                'last_at': func.max(func.coalesce(_period.c.last_at, stmt.excluded.last_at),
+                                    func.coalesce(stmt.excluded.last_at, _period.c.last_at)),
+                'transactions': _period.c.transactions + stmt.excluded.transactions,
+                'inventory_logs': _period.c.inventory_logs + stmt.excluded.inventory_logs,
+                'archived_at': stmt.excluded.archived_at,
+            }))
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql(f'DETACH DATABASE {ARCHIVE_SCHEMA}')
+    return sales, logs
+
+
+def archive_closed_periods(today=None):
+    """Archive every month before cutoff() that still has rows in the hot tables; returns [(month, sales, logs)]."""
+    run_with_retry(take_snapshots)  # so every log that moves is already counted by a snapshot
+    end = _midnight(cutoff(today))
+    archived = []
+    oldest = _oldest(end)
+    while oldest is not None:
+        month = oldest.date().replace(day=1)
+        sales, logs = run_with_retry(lambda: archive_month(month))
+        archived.append((f'{month:%Y-%m}', sales, logs))
+        db.session.commit()  # end the read transaction so the next look sees the deletes
+        following = _oldest(end)
+        if following is not None and following < _midnight(next_month(month)):
+            raise ArchiveError(f'{month:%Y-%m} still has rows in the hot tables after archiving')
+        oldest = following
+    return archived
+
+
+def reclaim_space():
+    """Return the pages archival freed to the filesystem; returns {'mode', 'freed_pages', 'page_count'}."""
+    config = current_app.config
+    step = config.get('ARCHIVE_VACUUM_STEP_PAGES', 1000)
+    with db.session.get_bind(mapper=Transaction.__mapper__).connect() as conn:
+        def pragma(name):
+            return conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+        mode, free, pages = pragma('auto_vacuum'), pragma('freelist_count'), pragma('page_count')
+        freed = 0
+        if mode == 2:
+            # Incremental: short steps, so checkouts get the write lock in between. executescript, since
+            # the pragma frees one page per sqlite3_step and a cursor's execute() only steps once.
+            while free:
+                conn.connection.executescript(f'PRAGMA incremental_vacuum({step})')
+                freed, free = freed + min(free, step), pragma('freelist_count')
+            action = 'incremental'
+        elif pages and free / pages >= config.get('ARCHIVE_VACUUM_FREE_RATIO', 0.2):
+            # Once per database: rebuilds the file and switches it to incremental vacuuming from then on
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+            freed, action = free, 'full'
+        else:
+            action = 'none'
+        if freed and pragma('journal_mode') == 'wal':
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')  # the file only shrinks at a checkpoint
+        return {'mode': action, 'freed_pages': freed, 'page_count': pragma('page_count')}
+
+
+@contextmanager
+def archived_partitions(start, end):
+    """Read-only DBAPI connections to the archive files holding rows dated start..end inclusive, oldest first."""
+    periods = db.session.query(ArchivedPeriod.file_name).filter(
+        ArchivedPeriod.first_at < _midnight(end + timedelta(days=1)),
+        ArchivedPeriod.last_at >= _midnight(start)
+    ).order_by(ArchivedPeriod.month).all()
+    connections = []
+    try:
+        for (file_name,) in periods:
+            upgrade_file(archive_path(file_name))
+            uri = f'file:{pathname2url(archive_path(file_name))}?mode=ro'
+            connections.append(sqlite3.connect(uri, uri=True, check_same_thread=False))
+        yield connections
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def serialize_period(period):
+    return {
+        'month': period.month,
+        'file_name': period.file_name,
+        'first_at': period.first_at,
+        'last_at': period.last_at,
+        'transactions': period.transactions,
+        'inventory_logs': period.inventory_logs,
+        'archived_at': period.archived_at
+    }
+
+
+archive_cli = AppGroup('archive', help='Period-end archival of old sales and inventory logs.')
+store_option = click.option('--store', help='Store database to work on (default: the head office).')
+
+
+@archive_cli.command('run')
+@store_option
+@click.option('--no-vacuum', is_flag=True, help='Leave the freed pages in the database file.')
+def run_command(store, no_vacuum):
+    """Archive every closed month older than ARCHIVE_AFTER_MONTHS, then reclaim the space."""
+    with store_context(store):
+        for month, sales, logs in archive_closed_periods():
+            click.echo(f'{month}: {sales} sales, {logs} inventory logs archived.')
+        if not no_vacuum:
+            click.echo('Vacuum: {mode}, {freed_pages} pages freed, {page_count} pages left.'.format(**reclaim_space()))
+
+
+@archive_cli.command('list')
+@store_option
+def list_command(store):
+    """Show the archived months."""
+    with store_context(store):
+        for period in ArchivedPeriod.query.order_by(ArchivedPeriod.month):
+            click.echo(f'{period.month}  {period.transactions:>9} sales  {period.inventory_logs:>9} logs  '
+                       f'{period.file_name}')
+        click.echo(f'Hot tables complete since {hot_since() or "the beginning"}.')
+
+
+@archive_cli.command('vacuum')
+@store_option
+def vacuum_command(store):
+    """Reclaim free pages now."""
+    with store_context(store):
+        click.echo('Vacuum: {mode}, {freed_pages} pages freed, {page_count} pages left.'.format(**reclaim_space()))
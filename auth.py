@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, request, session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from models import db, User
+
+# Password logins and terminal API tokens.
+#
+# Every login attempt takes a token from its client address's bucket, and every failed
+# one from its username's bucket, before any password is hashed; an empty bucket is a
+# 429 with Retry-After, so a brute-force burst costs a dictionary lookup per attempt.
+# A username whose bucket is empty is not locked for everyone: each address then gets
+# its own bucket for that username, so the cashier at the till still gets in while the
+# address guessing the password is refused.
+# Hashing itself is capped at AUTH_MAX_CONCURRENT_HASHES at a time so a login rush
+# (a shift change) queues behind a few hashes instead of taking every core from checkout.
+#
+# Hashes use the AUTH_HASH_PROFILE method; a stored hash of the same algorithm with fewer
+# iterations is replaced on the next successful login (never one that costs more, so
+# switching to a cheaper profile does not weaken existing hashes).
+#
+# Terminals exchange a password for a signed, short-lived bearer token once and are then
+# authenticated without hashing or a query. The token carries the role at issue time;
+# admin endpoints require 'admin'. Deleting a user, or changing their role or password
+# (including the upgrade at login), revokes the tokens issued to them before the commit,
+# in the process that made the change; other processes keep accepting them until they
+# expire, so AUTH_TOKEN_TTL is the revocation window across workers.
+
+HASH_PROFILES = {
+    'fast': 'pbkdf2:sha256:50000',       # tests and benchmark fixtures only
+    'standard': 'pbkdf2:sha256:600000',  # Werkzeug's default
+    'strong': 'pbkdf2:sha256:1200000',
+}
+TOKEN_SALT = 'pos-api-token'
+REVOKED_USERS = 'revoked_users'  # session.info key: user ids whose tokens the commit revokes
+
+
+def hash_cost(method):
+    """(algorithm, iterations) of a hash method, or of a stored hash; iterations is None for non-pbkdf2 methods."""
+    parts = method.split('$', 1)[0].split(':')
+    if parts[0] != 'pbkdf2':
+        return parts[0], None
+    digest = parts[1] if len(parts) > 1 else 'sha256'
+    return f'pbkdf2:{digest}', int(parts[2]) if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+
+
+class AuthError(Exception):
+
+    def __init__(self, message, status=401, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        return {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+
+
+class RateLimiter:
+    """Token buckets in memory, per process: burst tokens per key, refilled at rate per second."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill); least recently used first
+        self._lock = threading.Lock()
+
+    def _level(self, key, rate, burst, now):
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def retry_after(self, key, rate, burst):
+        """Seconds until key has a token (0 if it has one now), without taking it."""
+        with self._lock:
+            tokens = self._level(key, rate, burst, time.monotonic())
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    def take(self, key, rate, burst):
+        """Take a token; returns 0, or the seconds to wait when the bucket is empty (nothing taken)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._level(key, rate, burst, now)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # a forgotten key starts again with a full bucket
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class Auth:
+
+    def __init__(self):
+        self.limiter = RateLimiter()
+        self._hashing = threading.BoundedSemaphore(2)
+        self._revoked = {}  # user_id -> time.time() of the last revoking commit
+
+    def init_app(self, app):
+        app.extensions['auth'] = self
+        self._hashing = threading.BoundedSemaphore(app.config.get('AUTH_MAX_CONCURRENT_HASHES', 2))
+
+    # ---------------- Passwords ----------------
+
+    def hash_method(self):
+        return HASH_PROFILES[current_app.config.get('AUTH_HASH_PROFILE', 'standard')]
+
+    def hash_password(self, password):
+        return generate_password_hash(password, method=self.hash_method())
+
+    def needs_rehash(self, stored):
+        """True when stored uses the profile's algorithm with fewer iterations than the profile."""
+        algorithm, iterations = hash_cost(stored)
+        target, target_iterations = hash_cost(self.hash_method())
+        return algorithm == target and iterations is not None and iterations < target_iterations
+
+    def _check(self, stored, password):
+        if not self._hashing.acquire(timeout=current_app.config.get('AUTH_HASH_WAIT', 2.0)):
+            raise AuthError('Too many logins in progress, try again', 503, retry_after=1)
+        try:
+            return check_password_hash(stored, password)
+        finally:
+            self._hashing.release()
+
+    def _throttle(self, key, rate, burst, consume=True):
+        if not current_app.config.get('AUTH_THROTTLE_ENABLED', True):
+            return
+        wait = self.limiter.take(key, rate, burst) if consume else self.limiter.retry_after(key, rate, burst)
+        if wait:
+            raise AuthError('Too many login attempts, try again later', 429, retry_after=int(wait) + 1)
+
+    def _locked(self, key, rate, burst):
+        return current_app.config.get('AUTH_THROTTLE_ENABLED', True) and self.limiter.retry_after(key, rate, burst) > 0
+
+    def authenticate(self, username, password):
+        """The User for these credentials; raises AuthError when they are wrong or the caller is throttled."""
+        config = current_app.config
+        user_rate, user_burst = config.get('AUTH_USER_RATE', 1 / 60), config.get('AUTH_USER_BURST', 5)
+        user_key = ('user', username.lower())
+        address_key = ('user', username.lower(), request.remote_addr)
+        self._throttle(('ip', request.remote_addr), config.get('AUTH_IP_RATE', 1.0), config.get('AUTH_IP_BURST', 60))
+        if self._locked(user_key, user_rate, user_burst):
+            # Only failures count against a user; once locked, only against this address
+            self._throttle(address_key, user_rate, user_burst, consume=False)
+
+        user = User.query.filter_by(username=username).first()
+        if not user or not self._check(user.password, password):
+            self.limiter.take(user_key, user_rate, user_burst)
+            self.limiter.take(address_key, user_rate, user_burst)
+            raise AuthError('Invalid username or password')
+        self.limiter.reset(user_key)
+        self.limiter.reset(address_key)
+
+        if self.needs_rehash(user.password):
+            # Stored with a cheaper cost profile: rehash while the plain password is at hand
+            user.password = self.hash_password(password)
+            db.session.commit()
+        return user
+
+    # ---------------- API tokens ----------------
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(current_app.secret_key, salt=TOKEN_SALT)
+
+    def issue_token(self, user):
+        # 'issued' to the microsecond: the signature's own timestamp is whole seconds, too coarse to
+        # tell a token issued just before a revocation from one issued just after it
+        return self._serializer().dumps({'user_id': user.user_id, 'role': user.role, 'issued': time.time()})
+
+    def verify_token(self, token):
+        """{'user_id', 'role'} from an unrevoked token this app issued less than AUTH_TOKEN_TTL seconds ago, or None."""
+        try:
+            identity, issued = self._serializer().loads(
+                token, max_age=current_app.config.get('AUTH_TOKEN_TTL', 900), return_timestamp=True)
+        except (SignatureExpired, BadSignature):
+            return None
+        if identity.pop('issued', issued.timestamp()) <= self._revoked.get(identity['user_id'], 0):
+            return None
+        return identity
+
+    def revoke_tokens(self, user_ids):
+        """Reject the tokens issued to these users until now."""
+        now = time.time()
+        for user_id in user_ids:
+            self._revoked[user_id] = now
+
+    def bearer_identity(self):
+        """{'user_id', 'role'} from a valid 'Authorization: Bearer <token>' header, or None."""
+        header = request.headers.get('Authorization', '')
+        return self.verify_token(header[7:].strip()) if header.startswith('Bearer ') else None
+
+    def current_user_id(self):
+        """The signed-in user: the admin session cookie, else a bearer token."""
+        if 'user_id' in session:
+            return session['user_id']
+        identity = self.bearer_identity()
+        return identity['user_id'] if identity else None
+
+    def current_admin_id(self):
+        """The signed-in admin: an admin's session cookie, else a bearer token issued to an admin."""
+        if 'user_id' in session:
+            return session['user_id'] if session.get('role') == 'admin' else None
+        identity = self.bearer_identity()
+        return identity['user_id'] if identity and identity['role'] == 'admin' else None
+
+
+auth = Auth()
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_credential_changes(session, flush_context, instances):
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, User) and (obj in session.deleted or any(
+                inspect(obj).attrs[name].history.has_changes() for name in ('password', 'role'))):
+            session.info.setdefault(REVOKED_USERS, set()).add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _revoke_after_commit(session):
+    revoked = session.info.pop(REVOKED_USERS, None)
+    if revoked:
+        auth.revoke_tokens(revoked)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_revocations(session):
+    session.info.pop(REVOKED_USERS, None)
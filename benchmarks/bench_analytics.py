@@ -0,0 +1,87 @@
+"""Sales analytics: ORM row-by-row vs columnar, cold and cached.
+
+    python benchmarks/bench_analytics.py [--products 2000] [--months 3] [--sales-per-day 300]
+
+Generates a store (see datagen.py), then times every analytics metric over the whole
+history: first a row-by-row ORM loop computing the same per-product and per-hour totals,
+then analytics.sales_analytics cold and from the cache. Exits non-zero if the columnar
+results disagree with the daily rollups.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from common import make_app
+from datagen import generate
+from models import db, Transaction, TransactionDetail
+from analytics import sales_analytics
+from cache import analytics_cache
+from rollups import day_start, day_end, sales_summary, top_products
+
+
+def orm_row_by_row(start, end):
+    revenue, units, cells = {}, {}, {}
+    details = db.session.query(TransactionDetail).join(Transaction).filter(
+        Transaction.date_time >= day_start(start), Transaction.date_time < day_end(end))
+    for detail in details:
+        when = detail.transaction.date_time
+        revenue[detail.product_id] = revenue.get(detail.product_id, 0) + detail.subtotal
+        units[detail.product_id] = units.get(detail.product_id, 0) + detail.quantity
+        cell = (when.weekday(), when.hour)
+        cells[cell] = cells.get(cell, 0) + detail.subtotal
+    return sorted(revenue.items(), key=lambda item: item[1], reverse=True)[:10], cells
+
+
+def timed_ms(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--sales-per-day', type=int, default=300)
+    args = parser.parse_args()
+
+    app = make_app()
+    summary = generate(app, products=args.products, months=args.months, sales_per_day=args.sales_per_day)
+    start, end = date.fromisoformat(summary['start']), date.fromisoformat(summary['end'])
+    failures = []
+    with app.app_context():
+        orm_ms, _ = timed_ms(lambda: orm_row_by_row(start, end))
+        db.session.expire_all()
+        analytics_cache.invalidate()
+        cold_ms, result = timed_ms(lambda: sales_analytics(start, end))
+        warm_ms, _ = timed_ms(lambda: sales_analytics(start, end))
+        by_units = sales_analytics(start, end, ['top'], by='units', limit=10)['top']['products']
+
+        transactions = sales_summary(start, end)[1]
+        if result['baskets']['transactions'] != transactions:
+            failures.append(f"baskets count {result['baskets']['transactions']} transactions, rollups {transactions}")
+        expected = [quantity for _, quantity, _ in top_products(start, end, 10)]
+        if [row['units'] for row in by_units] != expected:
+            failures.append(f"top by units {[row['units'] for row in by_units]}, rollups {expected}")
+        grid_total = sum(map(sum, result['heatmap']['transactions']))
+        if grid_total != transactions:
+            failures.append(f'heatmap counts {grid_total} transactions, rollups {transactions}')
+        if sum(row['products'] for row in result['abc']['classes'].values()) != len(result['abc']['products']):
+            failures.append('ABC class sizes do not add up')
+
+    print(f"{summary['transactions']} transactions, {summary['line_items']} line items over {summary['days']} days")
+    for label, ms in (('ORM row by row (top + heatmap only)', orm_ms),
+                      ('columnar, all metrics, cold', cold_ms),
+                      ('columnar, all metrics, cached', warm_ms)):
+        print(f'{label:<38} {ms:>9.1f} ms')
+    os.remove(app.config['BENCH_DB_PATH'])
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
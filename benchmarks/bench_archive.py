@@ -0,0 +1,132 @@
+"""Period-end archival: hot-table size and query latency before and after archiving old months.
+
+    python benchmarks/bench_archive.py [--months 15] [--keep 6] [--sales-per-day 150] [--no-auto-vacuum]
+
+Generates a store (see datagen.py) with --months of history, times a few history-sized
+queries, archives everything older than --keep months and reclaims the space, then
+times them again. --no-auto-vacuum creates the database without auto_vacuum, like a
+file from before it was configured, so the one-off full VACUUM path runs instead of
+the incremental one. Exits non-zero if the rollup reports, analytics of an archived
+month or the inventory ledger change, if an archived month is left in the hot tables,
+or if a second run archives anything.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import make_app, timed
+from datagen import generate
+from config import Config
+from models import db, Transaction, TransactionDetail, InventoryLog
+from archive import archive_closed_periods, reclaim_space, cutoff, hot_since, next_month
+from analytics import sales_analytics, METRICS
+from ledger import ledger_query, find_drift
+from rollups import range_report, rebuild_rollups
+
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def measure(app, client, label, archived_month):
+    with app.app_context():
+        counts = {model.__tablename__: db.session.query(model).count()
+                  for model in (Transaction, TransactionDetail, InventoryLog)}
+    queries = {
+        'transactions page': lambda: client.get('/admin/data/transactions'),
+        'drift check': lambda: client.get('/inventory/drift'),
+        'admin dashboard': lambda: client.get('/admin'),
+        'archived analytics': lambda: client.get(
+            f'/reports/analytics?start={archived_month}&end={next_month(archived_month) - timedelta(days=1)}'),
+    }
+    print(f"\n{label}: {file_size(app.config['BENCH_DB_PATH']) / 2**20:.1f} MiB, "
+          + ', '.join(f'{n} {t}' for t, n in counts.items()))
+    for name, fn in queries.items():
+        rate, p50, p99 = timed(fn, 5)
+        print(f'  {name:<20} p50 {p50:>8.1f} ms  p99 {p99:>8.1f} ms')
+    return counts
+
+
+def snapshot(app, archived_month):
+    with app.app_context():
+        last_day = next_month(archived_month) - timedelta(days=1)
+        return {
+            'report': range_report(date(2000, 1, 1), date.today()),
+            'analytics': sales_analytics(archived_month, last_day, list(METRICS), 'revenue', 10),
+            'ledger': [tuple(row) for row in ledger_query()],
+            'ledger_recent': [tuple(row) for row in ledger_query(before=cutoff() + timedelta(days=40))],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--months', type=int, default=15)
+    parser.add_argument('--keep', type=int, default=6)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--sales-per-day', type=int, default=150)
+    parser.add_argument('--no-auto-vacuum', action='store_true')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='pos-bench-archive-')
+    pragmas = dict(Config.SQLITE_PRAGMAS)
+    if args.no_auto_vacuum:
+        pragmas.pop('auto_vacuum')
+    app = make_app(METRICS_ENABLED=False, DASHBOARD_CACHE_TTL=0, ANALYTICS_CACHE_TTL=0,
+                   ANALYTICS_HISTORY_CACHE_TTL=0, ANALYTICS_MAX_DAYS=10000, SQLITE_PRAGMAS=pragmas,
+                   ARCHIVE_DIR=directory, ARCHIVE_AFTER_MONTHS=args.keep)
+    generate(app, products=args.products, months=args.months, sales_per_day=args.sales_per_day)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['role'] = 1, 'admin'
+    failures = []
+    with app.app_context():
+        archived_month = (cutoff() - timedelta(days=1)).replace(day=1)  # the last month that will be archived
+
+    before = measure(app, client, 'before', archived_month)
+    expected = snapshot(app, archived_month)
+
+    with app.app_context():
+        started = time.perf_counter()
+        archived = archive_closed_periods()
+        archive_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        vacuum = reclaim_space()
+        vacuum_seconds = time.perf_counter() - started
+        print(f'\narchived {len(archived)} months ({sum(s for _, s, _ in archived)} sales, '
+              f'{sum(l for _, _, l in archived)} logs) in {archive_seconds:.1f} s; '
+              f"vacuum {vacuum['mode']}: {vacuum['freed_pages']} pages in {vacuum_seconds:.1f} s")
+        archive_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f'archive files: {len(os.listdir(directory))}, {archive_bytes / 2**20:.1f} MiB')
+        oldest = db.session.query(db.func.min(Transaction.date_time)).scalar()
+        if oldest is not None and oldest.date() < cutoff():
+            failures.append(f'hot tables still hold sales from {oldest:%Y-%m-%d}, before {cutoff()}')
+        if hot_since() != cutoff():
+            failures.append(f'hot since {hot_since()}, expected {cutoff()}')
+        if archive_closed_periods():
+            failures.append('a second run archived more months')
+        rebuild_rollups()  # must leave the archived days' rollups alone
+        if find_drift():
+            failures.append(f'{len(find_drift())} products drift after archiving')
+
+    after = measure(app, client, 'after', archived_month)
+    actual = snapshot(app, archived_month)
+    for name in expected:
+        if actual[name] != expected[name]:
+            failures.append(f'{name} changed by archiving')
+    if after['transaction'] >= before['transaction']:
+        failures.append('no sales left the hot tables')
+
+    os.remove(app.config['BENCH_DB_PATH'])
+    shutil.rmtree(directory)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Logins under attack: checkout latency during a password-guessing burst, with and without throttling.
+
+    python benchmarks/bench_auth.py [--seconds 5] [--attack-rate 20] [--cashiers 30]
+
+For each hash profile, times one login (including the upgrade of a cheaper hash to the
+standard profile). Then an attacker thread posts --attack-rate wrong passwords a second
+to /login while the main thread times checkouts: without an attack, then with
+AUTH_THROTTLE_ENABLED off and on. Finally --cashiers threads log in at once from one
+address (a shift change). Exits non-zero if throttling lets the attack keep hashing or
+locks the victim out of their own till, the shift change is refused, a cheaper hash is
+not upgraded at login (or a costlier one is replaced), or bearer tokens are not accepted
+for admins in place of the session cookie and refused for cashiers and deleted users,
+or a cashier's session cookie opens the admin endpoints.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from common import make_app, seed_catalog, timed
+from models import db, User
+from auth import auth, hash_cost, HASH_PROFILES
+
+ATTACKER = {'REMOTE_ADDR': '203.0.113.66'}
+STORE = {'REMOTE_ADDR': '192.0.2.10'}
+
+
+def add_user(app, username, password, method, role='cashier'):
+    with app.app_context():
+        db.session.add(User(username=username, password=generate_password_hash(password, method=method),
+                            role=role))
+        db.session.commit()
+
+
+def login(client, username, password, environ):
+    return client.post('/login', data={'username': username, 'password': password}, environ_base=environ).status_code
+
+
+def attack_run(label, attack_rate, throttled, seconds, failures):
+    app = make_app(METRICS_ENABLED=False, AUTH_THROTTLE_ENABLED=throttled)
+    auth.limiter.clear()
+    user_id, product_ids = seed_catalog(app, products=50)
+    add_user(app, 'victim', 'correct horse', HASH_PROFILES['standard'])
+    statuses = {}
+    stop = threading.Event()
+
+    def attacker():
+        client = app.test_client()
+        guess = 0
+        while attack_rate and not stop.wait(max(0.0, started + guess / attack_rate - time.perf_counter())):
+            status = login(client, 'victim', f'guess-{guess}', ATTACKER)
+            statuses[status] = statuses.get(status, 0) + 1
+            guess += 1
+
+    client = app.test_client()
+    payload = {'user_id': user_id, 'payment_method': 'cash', 'total_amount': 30.0,
+               'items': [{'product_id': pid, 'quantity': 1, 'price': 10.0} for pid in product_ids[:3]]}
+
+    def sale():
+        assert client.post('/transactions', json=payload).status_code == 200
+
+    thread = threading.Thread(target=attacker)
+    started = time.perf_counter()
+    thread.start()
+    samples = []
+    while time.perf_counter() - started < seconds:
+        samples.append(timed(sale, 20))
+    victim = login(client, 'victim', 'correct horse', STORE)  # a locked username still opens at the till
+    stop.set()
+    thread.join()
+    elapsed = time.perf_counter() - started
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    rate = sum(s[0] for s in samples) / len(samples)
+    p99 = max(s[2] for s in samples)
+    hashed = statuses.get(401, 0)
+    attempts = sum(statuses.values())
+    print(f'{label:<12} {attempts / elapsed:>10.0f} {hashed / elapsed:>9.1f} {rate:>10.1f} {p99:>9.2f}')
+    if throttled and hashed > 5 + seconds:
+        failures.append(f'throttled attack still hashed {hashed} passwords in {seconds} s')
+    if victim != 302:
+        failures.append(f'{label}: the victim\'s own login returned {victim}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--attack-rate', type=float, default=20)
+    parser.add_argument('--cashiers', type=int, default=30)
+    args = parser.parse_args()
+    failures = []
+
+    app = make_app(METRICS_ENABLED=False, AUTH_HASH_PROFILE='standard')
+    print(f"{'profile':<10} {'method':<24} {'login ms':>9}")
+    for profile, method in HASH_PROFILES.items():
+        add_user(app, profile, 'secret', method)
+        client = app.test_client()
+        started = time.perf_counter()
+        status = login(client, profile, 'secret', STORE)
+        print(f'{profile:<10} {method:<24} {(time.perf_counter() - started) * 1000:>9.1f}')
+        if status != 302:
+            failures.append(f'{profile} login returned {status}')
+    with app.app_context():
+        stored = {u.username: u.password.split('$', 1)[0] for u in User.query}
+        expected = {profile: max(method, HASH_PROFILES['standard'], key=lambda m: hash_cost(m)[1])
+                    for profile, method in HASH_PROFILES.items()}
+        if stored != expected:
+            failures.append(f'hashes after login {stored}, expected {expected}')
+
+    # Terminal token in place of the session cookie: admins only on admin endpoints, revoked on delete
+    add_user(app, 'admin', 'secret', HASH_PROFILES['fast'], role='admin')
+    with app.test_request_context():
+        token = auth.issue_token(User.query.filter_by(username='admin').one())
+        cashier_token = auth.issue_token(User.query.filter_by(role='cashier').first())
+        iterations = 10000
+        started = time.perf_counter()
+        for _ in range(iterations):
+            auth.verify_token(token)
+        verify_us = (time.perf_counter() - started) / iterations * 1e6
+    client = app.test_client()
+
+    def admin_status(bearer):
+        return client.get('/admin/data/payments', headers={'Authorization': f'Bearer {bearer}'}).status_code
+
+    with_token, forged, cashier = admin_status(token), admin_status(f'{token[:-2]}xx'), admin_status(cashier_token)
+    # A cashier signed in through the admin login form
+    cashier_client = app.test_client()
+    login(cashier_client, 'standard', 'secret', STORE)
+    cashier_session = (cashier_client.get('/admin/data/payments').status_code, cashier_client.get('/admin').status_code)
+    if cashier_session != (401, 302):
+        failures.append(f'cashier session on admin endpoints: {cashier_session} (expected 401, 302)')
+    with app.app_context():
+        db.session.delete(User.query.filter_by(username='admin').one())
+        db.session.commit()
+    deleted = admin_status(token)
+    print(f'token verification: {verify_us:.1f} us, no query')
+    if (with_token, forged, cashier, deleted) != (200, 401, 401, 401):
+        failures.append(f'bearer token: valid {with_token}, forged {forged}, cashier {cashier}, '
+                        f'deleted user {deleted} (expected 200, 401, 401, 401)')
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    print(f"\n{'attack':<12} {'tries/s':>10} {'hashes/s':>9} {'sales/s':>10} {'p99 ms':>9}")
+    attack_run('no attack', 0, True, args.seconds, failures)
+    attack_run('unthrottled', args.attack_rate, False, args.seconds, failures)
+    attack_run('throttled', args.attack_rate, True, args.seconds, failures)
+
+    # Shift change: every cashier of a store logs in at once through the same router
+    app = make_app(METRICS_ENABLED=False)
+    auth.limiter.clear()
+    for i in range(args.cashiers):
+        add_user(app, f'cashier-{i}', 'secret', HASH_PROFILES['standard'])
+    results = []
+
+    def cashier(i):
+        results.append(login(app.test_client(), f'cashier-{i}', 'secret', STORE))
+
+    threads = [threading.Thread(target=cashier, args=(i,)) for i in range(args.cashiers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f'\nshift change: {results.count(302)}/{args.cashiers} cashiers in {time.perf_counter() - started:.2f} s')
+    if results.count(302) != args.cashiers:
+        failures.append(f'shift change statuses: {sorted(set(results))}')
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
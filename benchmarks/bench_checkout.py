@@ -0,0 +1,94 @@
+"""Checkout throughput: the single-commit pipeline vs the original three-commit handler.
+
+    python benchmarks/bench_checkout.py [--iterations 200]
+"""
+import argparse
+import os
+
+from flask import request, jsonify
+
+from common import make_app, seed_catalog, timed
+from models import db, Product, Transaction, TransactionDetail, Payment, InventoryLog
+
+
+def register_legacy_checkout(app):
+    # Verbatim copy of the pre-pipeline create_transaction handler, kept only for comparison
+    @app.route('/bench/legacy-transactions', methods=['POST'])
+    def legacy_create_transaction():
+        data = request.get_json()
+        try:
+            transaction = Transaction(
+                user_id=data['user_id'],
+                payment_method=data['payment_method'],
+                total_amount=data['total_amount']
+            )
+            db.session.add(transaction)
+            db.session.commit()
+
+            for item in data['items']:
+                detail = TransactionDetail(
+                    transaction_id=transaction.transaction_id,
+                    product_id=item['product_id'],
+                    quantity=item['quantity'],
+                    price=item['price'],
+                    subtotal=item['quantity'] * item['price']
+                )
+                db.session.add(detail)
+                product = Product.query.get(item['product_id'])
+                if not product:
+                    return jsonify({'error': f"Product ID {item['product_id']} not found"}), 400
+                if product.stock_quantity < item['quantity']:
+                    return jsonify({'error': f"Not enough stock for product {product.product_name}"}), 400
+                product.stock_quantity -= item['quantity']
+                log = InventoryLog(
+                    product_id=product.product_id,
+                    change_type='Sale',
+                    quantity_change=-item['quantity'],
+                    remarks=f'Sold {item["quantity"]} during transaction {transaction.transaction_id}'
+                )
+                db.session.add(log)
+            db.session.commit()
+
+            payment = Payment(
+                transaction_id=transaction.transaction_id,
+                method=data['payment_method'],
+                amount=data['total_amount']
+            )
+            db.session.add(payment)
+            db.session.commit()
+            return jsonify({'message': 'Transaction created successfully', 'transaction_id': transaction.transaction_id})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+
+def basket(user_id, product_ids, size):
+    items = [{'product_id': pid, 'quantity': 1, 'price': 10.0} for pid in product_ids[:size]]
+    return {'user_id': user_id, 'payment_method': 'cash', 'total_amount': 10.0 * size, 'items': items}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'path':<10} {'basket':>6} {'sales/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in (1, 10, 100):
+        for path, url in (('legacy', '/bench/legacy-transactions'), ('pipeline', '/transactions')):
+            app = make_app()
+            register_legacy_checkout(app)
+            user_id, product_ids = seed_catalog(app, products=100)
+            client = app.test_client()
+            payload = basket(user_id, product_ids, size)
+
+            def sale():
+                response = client.post(url, json=payload)
+                assert response.status_code == 200, response.get_json()
+
+            rate, p50, p99 = timed(sale, args.iterations)
+            print(f"{path:<10} {size:>6} {rate:>10.1f} {p50:>8.2f} {p99:>8.2f}")
+            os.remove(app.config['BENCH_DB_PATH'])
+
+
+if __name__ == '__main__':
+    main()
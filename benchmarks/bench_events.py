@@ -0,0 +1,158 @@
+"""Live updates over /events versus terminals polling the list endpoints.
+
+    python benchmarks/bench_events.py [--sales 300] [--clients 20] [--terminals 20]
+
+Times what --terminals polling terminals cost the server per sale (each re-reads
+GET /products, /transactions and /reports/daily to see it), then checkout with the event
+bus off and on while --clients streams are open, and how long an event takes to reach
+them. Exits non-zero if a stream misses or repeats a sale, a reconnect with
+Last-Event-ID does not resume exactly after it, or a client that stops reading (or
+resumes across changes made while no stream was open) is not told to reset.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from common import make_app, seed_catalog, timed, percentile
+from events import event_bus
+
+
+def parse(chunk):
+    """[(id, event, data)] of the events in an SSE chunk."""
+    events = []
+    for block in chunk.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class Subscriber(threading.Thread):
+    """Reads one stream until it has seen `sales` sale events."""
+
+    def __init__(self, client, sales, headers=None):
+        super().__init__(daemon=True)
+        self.response = client.get('/events', headers=headers or {}, buffered=False)
+        self.sales = sales
+        self.received = []  # (transaction_id, event id, perf_counter at arrival)
+        self.resets = 0
+
+    def run(self):
+        for chunk in self.response.response:
+            now = time.perf_counter()
+            for event_id, name, data in parse(chunk.decode() if isinstance(chunk, bytes) else chunk):
+                if name == 'sale':
+                    self.received.append((data['transaction_id'], event_id, now))
+                elif name == 'reset':
+                    self.resets += 1
+            if len(self.received) >= self.sales:
+                break
+        self.response.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sales', type=int, default=300)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--terminals', type=int, default=20)
+    parser.add_argument('--products', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = make_app(METRICS_ENABLED=False, EVENTS_HEARTBEAT_SECONDS=0.2, EVENTS_BUFFER_SIZE=1000)
+    user_id, product_ids = seed_catalog(app, products=args.products)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['role'] = user_id, 'admin'
+    failures = []
+    count = [0]
+
+    def sale():
+        product_id = product_ids[count[0] % len(product_ids)]
+        count[0] += 1
+        response = client.post('/transactions', json={
+            'user_id': user_id, 'payment_method': 'cash', 'total_amount': 20.0,
+            'items': [{'product_id': product_id, 'quantity': 2, 'price': 10.0}]
+        })
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['transaction_id']
+
+    def poll():
+        for url in ('/products', '/transactions?limit=50', '/reports/daily'):
+            assert client.get(url).status_code == 200
+
+    # Polling: every terminal re-reads the lists after each sale (the product list snapshot is stale by then)
+    event_bus.enabled = False
+    rate, p50, p99 = timed(lambda: (sale(), [poll() for _ in range(args.terminals)]), max(args.sales // 10, 10))
+    print(f'polling, {args.terminals} terminals: {1000 / rate:>8.1f} ms of server time per sale')
+
+    for enabled, streams in ((False, 0), (True, 0), (True, args.clients)):
+        event_bus.enabled = enabled
+        subscribers = [Subscriber(client, args.sales) for _ in range(streams)]
+        for subscriber in subscribers:
+            subscriber.start()
+        started = {}
+
+        def timed_sale():
+            t0 = time.perf_counter()
+            started[sale()] = t0
+
+        rate, p50, p99 = timed(timed_sale, args.sales)
+        for subscriber in subscribers:
+            subscriber.join(30)
+        label = f'events on, {streams} streams' if enabled else 'events off'
+        print(f'checkout, {label:<22} {rate:>8.1f} sales/s  p50 {p50:>6.2f} ms  p99 {p99:>6.2f} ms')
+        if not streams:
+            continue
+        latencies = [(arrived - started[tid]) * 1000 for s in subscribers for tid, _, arrived in s.received]
+        print(f'sale event at the streams, from the start of the sale request: '
+              f'p50 {percentile(latencies, 50):.2f} ms  p99 {percentile(latencies, 99):.2f} ms')
+        expected = sorted(started)
+        for subscriber in subscribers:
+            if [tid for tid, _, _ in subscriber.received] != expected:
+                failures.append(f'a stream saw {len(subscriber.received)} sales, expected {len(expected)} in order')
+                break
+
+    # Resume: reconnect after the 100th sale of the last run and get exactly the rest
+    middle = subscribers[0].received[100] if len(subscribers[0].received) > 100 else None
+    if middle:
+        resumed = Subscriber(client, len(expected) - 101, headers={'Last-Event-ID': middle[1]})
+        resumed.start()
+        resumed.join(10)
+        if [tid for tid, _, _ in resumed.received] != expected[101:] or resumed.resets:
+            failures.append('reconnecting with Last-Event-ID did not resume right after it')
+
+    # A client that stops reading falls behind the buffer and is told to reset; nobody waits for it
+    stalled = client.get('/events', buffered=False)
+    chunks = iter(stalled.response)
+    next(chunks)  # retry: line; the cursor is now at the newest event
+    stall = app.config['EVENTS_BUFFER_SIZE'] + 10
+    rate, _, p99 = timed(sale, stall)
+    print(f'checkout with one stalled stream: {rate:.1f} sales/s  p99 {p99:.2f} ms')
+    if not any(name == 'reset' for _, name, _ in parse(next(chunks).decode())):
+        failures.append(f'a stream {stall} events behind was not reset')
+    stalled.close()
+
+    # With no stream open nothing is collected, so a client resuming from before such a sale must reset
+    time.sleep(0.5)
+    before = event_bus.event_id(event_bus.latest())
+    sale()
+    resumed = client.get('/events', headers={'Last-Event-ID': before}, buffered=False)
+    chunks = iter(resumed.response)
+    next(chunks)
+    if not any(name == 'reset' for _, name, _ in parse(next(chunks).decode())):
+        failures.append('a stream resuming across a sale made with no stream open was not reset')
+    resumed.close()
+
+    time.sleep(0.5)  # streams notice their closed responses at the next heartbeat
+    os.remove(app.config['BENCH_DB_PATH'])
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
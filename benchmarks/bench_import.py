@@ -0,0 +1,108 @@
+"""Bulk catalog import vs one POST /products per item.
+
+    python benchmarks/bench_import.py [--products 20000] [--legacy 1000]
+
+The per-item path is only timed for --legacy products (it commits twice per
+product) and reported as products/s so the two are comparable. Also checks that an
+import runs a handful of statements per chunk rather than one per row, that a row
+rejected for a conflict leaves no new category behind, and that a file that is not
+UTF-8 is reported as a row error instead of failing the request.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+from sqlalchemy import event
+
+from common import make_app
+from models import db, Product, Category, InventoryLog
+
+
+def supplier_csv(products):
+    lines = ['product_name,category_name,price,stock_quantity,unit,sku,barcode']
+    for i in range(products):
+        lines.append(f'Item {i},Aisle {i % 40},{1 + i % 97}.50,{i % 50},pcs,SKU-{i:06d},{4000000000000 + i:013d}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--legacy', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app()
+    client = app.test_client()
+    started = time.perf_counter()
+    for i in range(args.legacy):
+        response = client.post('/products', json={
+            'product_name': f'Item {i}', 'price': 1.5, 'stock_quantity': i % 50, 'sku': f'SKU-{i:06d}'
+        })
+        assert response.status_code == 200, response.get_json()
+    legacy_rate = args.legacy / (time.perf_counter() - started)
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    app = make_app()
+    client = app.test_client()
+    body = supplier_csv(args.products)
+    started = time.perf_counter()
+    response = client.post('/products/import', data={'file': (io.BytesIO(body), 'supplier.csv')})
+    elapsed = time.perf_counter() - started
+    result = response.get_json()
+    assert result['inserted'] == args.products and not result['errors'], result
+
+    started = time.perf_counter()
+    response = client.post('/products/import', data={'file': (io.BytesIO(body), 'supplier.csv')})
+    update_elapsed = time.perf_counter() - started
+    assert response.get_json()['updated'] == args.products
+
+    started = time.perf_counter()
+    exported = client.get('/products/export').data
+    export_elapsed = time.perf_counter() - started
+    with app.app_context():
+        assert db.session.query(Product).count() == args.products
+        assert db.session.query(InventoryLog).count() == sum(1 for i in range(args.products) if i % 50)
+
+    print(f"{'path':<22} {'products/s':>12}")
+    print(f"{'POST /products':<22} {legacy_rate:>12.1f}")
+    print(f"{'import (insert)':<22} {args.products / elapsed:>12.1f}")
+    print(f"{'import (update)':<22} {args.products / update_elapsed:>12.1f}")
+    print(f"{'export csv':<22} {args.products / export_elapsed:>12.1f}  ({len(exported) // 1024} KiB)")
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    failures = []
+    app = make_app(METRICS_ENABLED=False)
+    client = app.test_client()
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *_: statements.append(1))
+    response = client.post('/products/import', data={'file': (io.BytesIO(supplier_csv(300)), 'supplier.csv')})
+    print(f'\nimport of 300 new products: {len(statements)} statements')
+    if response.get_json()['inserted'] != 300 or len(statements) > 30:
+        failures.append(f"300-row import: {response.get_json()['inserted']} inserted in {len(statements)} statements")
+
+    # SKU-000001 and the barcode of Item 2 belong to different products: the row is rejected
+    conflict = ('product_name,category_name,price,sku,barcode\n'
+                f'Clash,Orphan aisle,1.00,SKU-000001,{4000000000002:013d}\n').encode()
+    result = client.post('/products/import?format=csv', data=conflict, content_type='text/csv').get_json()
+    with app.app_context():
+        orphans = db.session.query(Category).filter_by(category_name='Orphan aisle').count()
+    if result['error_count'] != 1 or orphans:
+        failures.append(f'conflicting row: {result}, {orphans} categories created for it')
+
+    response = client.post('/products/import?format=csv', content_type='text/csv',
+                           data=b'product_name,price\nOk,1.00\n\xff\xfe,2.00\n')
+    if response.status_code != 200 or response.get_json()['error_count'] != 1:
+        failures.append(f'file that is not UTF-8: {response.status_code} {response.get_data(as_text=True)[:200]}')
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Checkout latency while a heavy export runs inline vs as a background job.
+
+    python benchmarks/bench_jobs.py [--products 50000] [--sales 200]
+
+A cashier thread rings up sales while another client exports the catalog,
+either streamed inline by the request thread or queued with ?async=1. The
+number that matters is how long the export holds a request thread; the job
+itself still shares the CPU with checkout (JOB_WORKERS bounds how much).
+"""
+import argparse
+import os
+import tempfile
+import threading
+
+from sqlalchemy import insert
+
+from common import make_app, seed_catalog, timed
+from models import db, Product
+from jobs import job_runner
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--sales', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'export':<8} {'sales/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'export request ms':>18}")
+    for mode in ('inline', 'async'):
+        app = make_app(JOB_WORKERS=1, JOB_POLL_INTERVAL=0.1, JOB_RESULTS_DIR=tempfile.mkdtemp())
+        user_id, product_ids = seed_catalog(app, products=10)
+        with app.app_context():
+            db.session.execute(insert(Product), [
+                {'product_name': f'Bulk {i}', 'price': 100, 'stock_quantity': 1} for i in range(args.products)
+            ])
+            db.session.commit()
+        cashier, exporter = app.test_client(), app.test_client()
+        sale = {'user_id': user_id, 'payment_method': 'cash', 'total_amount': 10.0,
+                'items': [{'product_id': product_ids[0], 'quantity': 1, 'price': 10.0}]}
+        export_ms = []
+
+        def export():
+            rate, p50, _ = timed(lambda: exporter.get('/products/export' + ('?async=1' if mode == 'async' else '')).data, 1)
+            export_ms.append(p50)
+
+        exporter_thread = threading.Thread(target=export)
+        exporter_thread.start()
+        rate, p50, p99 = timed(lambda: cashier.post('/transactions', json=sale), args.sales)
+        exporter_thread.join()
+        if mode == 'async':
+            with app.app_context():
+                job_runner.wait(1, timeout=120)
+        print(f"{mode:<8} {rate:>10.1f} {p50:>8.2f} {p99:>8.2f} {export_ms[0]:>18.1f}")
+        os.remove(app.config['BENCH_DB_PATH'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Drift check cost with and without ledger snapshots.
+
+    python benchmarks/bench_ledger.py [--products 500] [--logs 200000] [--delta 1000]
+
+Writes --logs inventory rows, times a full-replay drift check, checkpoints, adds
+--delta more rows and times the drift check again (it now replays only the delta).
+Exits non-zero if either check reports drift, since the seeded data is consistent, or
+if editing a product in the admin UI moves its stock without a log (or at all, when the
+stock field was left as it was shown).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import insert, update, func
+
+from common import make_app
+from models import db, Product, Category, InventoryLog
+from ledger import find_drift, take_snapshots
+
+
+def write_logs(product_ids, count, rng):
+    deltas = {}
+    rows = []
+    for _ in range(count):
+        product_id = rng.choice(product_ids)
+        change = rng.choice((-3, -2, -1, -1, 5, 10))
+        deltas[product_id] = deltas.get(product_id, 0) + change
+        rows.append({'product_id': product_id, 'change_type': 'Bench', 'quantity_change': change})
+    for i in range(0, len(rows), 10000):
+        db.session.execute(insert(InventoryLog), rows[i:i + 10000])
+    for product_id, delta in deltas.items():
+        db.session.execute(update(Product).where(Product.product_id == product_id)
+                           .values(stock_quantity=Product.stock_quantity + delta))
+    db.session.commit()
+
+
+def timed_drift(repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        drift = find_drift()
+    return (time.perf_counter() - started) / repeat * 1000, drift
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--logs', type=int, default=200000)
+    parser.add_argument('--delta', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app()
+    rng = random.Random(5)
+    failures = 0
+    with app.app_context():
+        db.session.execute(insert(Product), [
+            {'product_name': f'Item {i}', 'price': 100, 'stock_quantity': 0} for i in range(args.products)
+        ])
+        product_ids = [pid for (pid,) in db.session.query(Product.product_id)]
+        write_logs(product_ids, args.logs, rng)
+
+        full_ms, drift = timed_drift()
+        failures += len(drift)
+        started = time.perf_counter()
+        taken = take_snapshots()
+        snapshot_ms = (time.perf_counter() - started) * 1000
+        write_logs(product_ids, args.delta, rng)
+        delta_ms, drift = timed_drift()
+        failures += len(drift)
+        log_count = db.session.query(func.count(InventoryLog.log_id)).scalar()
+
+        # Product edits: the form shows the stock as it was; a sale lands before each is saved
+        shown = {pid: stock for pid, stock in db.session.query(Product.product_id, Product.stock_quantity)
+                 .filter(Product.product_id.in_(product_ids[:2]))}
+        write_logs(product_ids[:2], 2, rng)
+        expected = {pid: stock for pid, stock in db.session.query(Product.product_id, Product.stock_quantity)
+                    .filter(Product.product_id.in_(product_ids[:2]))}
+        expected[product_ids[1]] += 7
+        category = Category(category_name='Edited')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.category_id
+    client = app.test_client()
+    for product_id, change in ((product_ids[0], 0), (product_ids[1], 7)):
+        client.post('/admin/products/edit', data={
+            'product_id': product_id, 'product_name': f'Edited {product_id}', 'category_id': category_id, 'price': '1.00',
+            'unit': 'pcs', 'stock_quantity': shown[product_id] + change, 'stock_quantity_was': shown[product_id]})
+    with app.app_context():
+        stock = dict(db.session.query(Product.product_id, Product.stock_quantity)
+                     .filter(Product.product_id.in_(product_ids[:2])))
+        if stock != expected:
+            print(f'product edits left stock at {stock}, expected {expected}')
+            failures += 1
+        failures += len(find_drift())
+
+    print(f'{log_count} logs, {args.products} products')
+    for label, ms in (('drift check, full replay', full_ms),
+                      (f'take snapshots ({taken} products)', snapshot_ms),
+                      (f'drift check, {args.delta} logs since', delta_ms)):
+        print(f'{label:<36} {ms:>9.1f} ms')
+    os.remove(app.config['BENCH_DB_PATH'])
+    if failures:
+        print(f'unexpected drift on {failures} products')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Scanner lookups and name search against a large catalog.
+
+    python benchmarks/bench_lookup.py [--products 50000] [--iterations 5000]
+
+Measures the code index on its own, the /products/lookup endpoint through the
+test client (warm catalog cache), and /products/search for typical typed prefixes.
+"""
+import argparse
+import os
+import random
+
+from sqlalchemy import insert
+
+from common import make_app, timed
+from models import db, Category, Product
+from product_search import code_index
+
+WORDS = ['apple', 'banana', 'bread', 'butter', 'cheese', 'coffee', 'cola', 'eggs', 'flour', 'juice',
+         'milk', 'noodles', 'orange', 'pasta', 'rice', 'salt', 'soap', 'sugar', 'tea', 'water']
+
+
+def seed(app, products):
+    rng = random.Random(7)
+    with app.app_context():
+        category = Category(category_name='Bench')
+        db.session.add(category)
+        db.session.flush()
+        db.session.execute(insert(Product), [
+            {
+                'product_name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+                'category_id': category.category_id,
+                'price': 100, 'stock_quantity': 100, 'unit': 'pcs',
+                'sku': f'SKU-{i:06d}', 'barcode': f'{4000000000000 + i * 7:013d}'
+            }
+            for i in range(products)
+        ])
+        db.session.commit()
+        db.session.execute(db.text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app()
+    seed(app, args.products)
+    rng = random.Random(11)
+    barcodes = [f'{4000000000000 + rng.randrange(args.products) * 7:013d}' for _ in range(args.iterations)]
+    skus = [f'SKU-{rng.randrange(args.products):06d}' for _ in range(args.iterations)]
+    client = app.test_client()
+
+    def report(name, fn, codes):
+        it = iter(codes)
+        rate, p50, p99 = timed(lambda: fn(next(it)), len(codes))
+        print(f"{name:<18} {rate:>10.1f} {p50:>8.3f} {p99:>8.3f}")
+
+    print(f"{'path':<18} {'ops/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    with app.app_context():
+        code_index.build()
+        for code in barcodes + skus:  # warm the catalog cache like a terminal that has scanned for a while
+            code_index.lookup(code)
+        report('index barcode', code_index.lookup, barcodes)
+        report('index sku', code_index.lookup, skus)
+
+    def http_lookup(code):
+        response = client.get('/products/lookup', query_string={'code': code})
+        assert response.status_code == 200, response.get_json()
+
+    report('GET lookup', http_lookup, barcodes)
+
+    def http_search(q):
+        response = client.get('/products/search', query_string={'q': q, 'limit': 20})
+        assert response.status_code == 200 and response.get_json(), q
+
+    queries = [rng.choice(WORDS)[:rng.randint(3, 5)] for _ in range(max(1, args.iterations // 10))]
+    report('GET search', http_search, queries)
+    os.remove(app.config['BENCH_DB_PATH'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Overhead of the request metrics middleware, and a check of what it reports.
+
+    python benchmarks/bench_metrics.py [--iterations 2000]
+
+Times GET /products/<id> and POST /transactions with METRICS_ENABLED off and on,
+then checks /metrics: checkout must report its SQL statements, and a deliberately
+lazy-loading route (one category query per transaction detail) must be counted as N+1.
+Exits non-zero if a check fails.
+"""
+import argparse
+import os
+import re
+import sys
+
+from flask import jsonify
+
+from common import make_app, seed_catalog, timed
+from models import TransactionDetail
+
+
+def register_lazy_route(app):
+    @app.route('/bench/lazy-details')
+    def lazy_details():
+        details = TransactionDetail.query.limit(50).all()
+        return jsonify([d.transaction.payment_method for d in details])
+
+
+def run(iterations, enabled):
+    app = make_app(METRICS_ENABLED=enabled, METRICS_SLOW_REQUEST_LOG=False)
+    register_lazy_route(app)
+    user_id, product_ids = seed_catalog(app, products=50)
+    client = app.test_client()
+    sale = {'user_id': user_id, 'payment_method': 'cash', 'total_amount': 20.0,
+            'items': [{'product_id': product_ids[0], 'quantity': 1, 'price': 10.0},
+                      {'product_id': product_ids[1], 'quantity': 1, 'price': 10.0}]}
+    results = {
+        'GET /products/<id>': timed(lambda: client.get(f'/products/{product_ids[0]}'), iterations),
+        'POST /transactions': timed(lambda: client.post('/transactions', json=sale), iterations // 4),
+    }
+    client.get('/bench/lazy-details')
+    exposition = client.get('/metrics').get_data(as_text=True)
+    os.remove(app.config['BENCH_DB_PATH'])
+    return results, exposition
+
+
+def sample(exposition, name, **labels):
+    selector = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    match = re.search(rf'^{re.escape(name)}\{{{re.escape(selector)}\}} (\S+)$', exposition, re.M)
+    return float(match.group(1)) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    off, _ = run(args.iterations, False)
+    on, exposition = run(args.iterations, True)
+    print(f"{'path':<20} {'metrics':>8} {'ops/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for path in off:
+        for label, results in (('off', off), ('on', on)):
+            rate, p50, p99 = results[path]
+            print(f"{path:<20} {label:>8} {rate:>10.1f} {p50:>8.3f} {p99:>8.3f}")
+
+    checks = {
+        'checkout requests counted': sample(exposition, 'pos_http_requests_total',
+                                            endpoint='create_transaction', method='POST', status='200'),
+        'checkout SQL statements recorded': sample(exposition, 'pos_http_request_sql_queries_sum',
+                                                   endpoint='create_transaction'),
+        'lazy route flagged as N+1': sample(exposition, 'pos_http_n_plus_one_total', endpoint='lazy_details'),
+        'product GET response size recorded': sample(exposition, 'pos_http_response_size_bytes_sum',
+                                                     endpoint='get_product_by_id'),
+    }
+    failures = 0
+    for name, value in checks.items():
+        ok = bool(value)
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5} {name} ({value})")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Integer-cents money: SUM cost and exactness against the old float columns, and checkout reconciliation.
+
+    python benchmarks/bench_money.py [--rows 500000] [--sales 500]
+
+Sums --rows random line amounts stored as REAL currency units (the old schema) and as
+INTEGER cents: the plain float SUM, the exact total the float column needs (every value
+converted to Decimal in Python), and the integer SUM. Then records --sales random sales
+at catalog prices with line and sale discounts through POST /transactions. Exits
+non-zero if the integer SUM is not exact, a sale at a price other than the catalog's is
+accepted, or if the line subtotals, payments, sale totals and both rollups do not
+all add up to the same number of cents and to the total computed client-side with Decimal.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from decimal import Decimal
+
+from common import make_app, seed_catalog, timed
+from models import db, Product, Transaction, TransactionDetail, Payment, DailySales, DailyProductSales
+
+
+def best_ms(fn, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare_sums(rows, failures):
+    rng = random.Random(7)
+    cents = [rng.randint(1, 500000) for _ in range(rows)]
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE float_lines (subtotal FLOAT)')
+    conn.execute('CREATE TABLE cents_lines (subtotal INTEGER)')
+    conn.executemany('INSERT INTO float_lines VALUES (?)', ((c / 100,) for c in cents))
+    conn.executemany('INSERT INTO cents_lines VALUES (?)', ((c,) for c in cents))
+    exact = sum(cents)
+
+    float_ms, float_sum = best_ms(lambda: conn.execute('SELECT SUM(subtotal) FROM float_lines').fetchone()[0])
+    decimal_ms, decimal_sum = best_ms(lambda: sum(
+        Decimal(str(value)) for (value,) in conn.execute('SELECT subtotal FROM float_lines')))
+    cents_ms, cents_sum = best_ms(lambda: conn.execute('SELECT SUM(subtotal) FROM cents_lines').fetchone()[0])
+    conn.close()
+
+    print(f'{rows} line amounts, exact total {Decimal(exact) / 100}')
+    print(f'  REAL SUM in SQL               {float_ms:>8.1f} ms  {float_sum!r} (off by {abs(Decimal(repr(float_sum)) - Decimal(exact) / 100)})')
+    print(f'  REAL rows to Decimal, Python  {decimal_ms:>8.1f} ms  {decimal_sum}')
+    print(f'  INTEGER SUM in SQL            {cents_ms:>8.1f} ms  {cents_sum / 100:.2f}')
+    if cents_sum != exact:
+        failures.append(f'integer SUM {cents_sum} != {exact}')
+
+
+def random_sale(rng, user_id, prices):
+    """(payload, expected total as Decimal) with catalog prices, line discounts and a sale discount."""
+    items, subtotal = [], Decimal(0)
+    for product_id in rng.sample(sorted(prices), rng.randint(1, 5)):
+        price = Decimal(prices[product_id]) / 100
+        quantity = rng.randint(1, 4)
+        discount = Decimal(rng.randint(0, int(price * quantity * 10))) / 100 if rng.random() < 0.3 else Decimal(0)
+        items.append({'product_id': product_id, 'quantity': quantity, 'price': str(price), 'discount': str(discount)})
+        subtotal += price * quantity - discount
+    discount = (subtotal * rng.choice((0, 0, 5, 10)) / 100).quantize(Decimal('0.01'))
+    total = subtotal - discount
+    return {'user_id': user_id, 'payment_method': 'cash', 'total_amount': str(total), 'discount': str(discount),
+            'items': items}, total
+
+
+def reconcile(sales, failures):
+    app = make_app(METRICS_ENABLED=False, EVENTS_ENABLED=False)
+    user_id, product_ids = seed_catalog(app, products=50)
+    client = app.test_client()
+    rng = random.Random(11)
+    prices = {product_id: rng.randint(1, 99999) for product_id in product_ids}
+    with app.app_context():
+        for product_id, price in prices.items():
+            db.session.get(Product, product_id).price = price
+        db.session.commit()
+    payloads = [random_sale(rng, user_id, prices) for _ in range(sales)]
+    expected = sum(total for _, total in payloads)
+    queue = list(payloads)
+
+    def sale():
+        payload, _ = queue.pop()
+        response = client.post('/transactions', json=payload)
+        if response.status_code != 200:
+            failures.append(f"sale rejected: {response.get_json()['error']}")
+
+    rate, p50, p99 = timed(sale, sales)
+    print(f'\ncheckout with server-side pricing: {rate:.1f} sales/s  p50 {p50:.2f} ms  p99 {p99:.2f} ms')
+    off = dict(payloads[0][0], total_amount=str(payloads[0][1] + Decimal('0.01')))
+    if client.post('/transactions', json=off).status_code != 400:
+        failures.append('a total one cent off was accepted')
+    # A terminal charging its own price, with a total that matches it
+    item = dict(payloads[0][0]['items'][0], quantity=1, discount='0', price='0.01')
+    tampered = {'user_id': user_id, 'payment_method': 'cash', 'total_amount': '0.01', 'items': [item]}
+    if client.post('/transactions', json=tampered).status_code != 400:
+        failures.append('a sale at a price other than the catalog price was accepted')
+
+    with app.app_context():
+        sums = {
+            'sale totals': db.session.query(db.func.sum(Transaction.total_amount)).scalar(),
+            'payments': db.session.query(db.func.sum(Payment.amount)).scalar(),
+            'line subtotals': db.session.query(db.func.sum(TransactionDetail.subtotal)).scalar(),
+            'daily rollup': db.session.query(db.func.sum(DailySales.total_sales)).scalar(),
+            'product rollup': db.session.query(db.func.sum(DailyProductSales.revenue)).scalar(),
+        }
+    for name, cents in sums.items():
+        print(f'  {name:<15} {Decimal(cents) / 100}')
+        if Decimal(cents) / 100 != expected:
+            failures.append(f'{name} add up to {Decimal(cents) / 100}, expected {expected}')
+    os.remove(app.config['BENCH_DB_PATH'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--sales', type=int, default=500)
+    args = parser.parse_args()
+    failures = []
+    compare_sums(args.rows, failures)
+    reconcile(args.sales, failures)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
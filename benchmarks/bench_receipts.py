@@ -0,0 +1,98 @@
+"""Receipt rendering: single reprints cold and cached, and an end-of-day batch.
+
+    python benchmarks/bench_receipts.py [--products 2000] [--sales-per-day 300] [--reprints 500]
+
+Generates a store (see datagen.py), times GET /transactions/<id>/receipt for random
+sales with an empty cache and again once they are cached, then streams every receipt
+of the last day through GET /receipts. Exits non-zero if a receipt total disagrees
+with its transaction, the batch is missing receipts, a sale recorded before VAT (no
+vat_amount) cannot be printed, or a cached receipt keeps a product's old name after it
+is renamed.
+"""
+import argparse
+import os
+import random
+import sys
+
+from common import make_app, timed
+from datagen import generate
+from models import db, Product, Transaction, TransactionDetail
+from cache import receipt_cache
+from money import format_amount
+from receipts import FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--sales-per-day', type=int, default=300)
+    parser.add_argument('--reprints', type=int, default=500)
+    args = parser.parse_args()
+
+    app = make_app(METRICS_ENABLED=False)
+    summary = generate(app, products=args.products, months=1, sales_per_day=args.sales_per_day)
+    client = app.test_client()
+    rng = random.Random(5)
+    failures = []
+    with app.app_context():
+        sales = dict(db.session.query(Transaction.transaction_id, Transaction.total_amount))
+        day_sales = db.session.query(Transaction).filter(
+            db.func.date(Transaction.date_time) == summary['end']).count()
+    ids = rng.sample(sorted(sales), min(args.reprints, len(sales)))
+
+    for fmt in ('text', 'html'):
+        receipt_cache.invalidate()
+        queue = list(ids)
+
+        def reprint():
+            transaction_id = queue.pop() if queue else rng.choice(ids)
+            response = client.get(f'/transactions/{transaction_id}/receipt?format={fmt}')
+            assert response.status_code == 200
+            if format_amount(sales[transaction_id]) not in response.get_data(as_text=True):
+                failures.append(f'receipt {transaction_id} does not show its total {format_amount(sales[transaction_id])}')
+
+        cold = timed(reprint, len(ids))
+        warm = timed(reprint, len(ids))
+        for label, (rate, p50, p99) in (('cold', cold), ('cached', warm)):
+            print(f'{fmt:<5} {label:<7} {rate:>10.1f} receipts/s  p50 {p50:>6.2f} ms  p99 {p99:>6.2f} ms')
+
+    receipt_cache.invalidate()
+    for fmt in ('text', 'escpos'):
+        response = client.get(f"/receipts?start={summary['end']}&end={summary['end']}&format={fmt}")
+        body = response.get_data()
+        printed = body.count(b'Receipt #')
+        print(f'end of day ({fmt}): {printed} receipts, {len(body) / 1024:.0f} KiB')
+        if printed != day_sales:
+            failures.append(f'end of day ({fmt}) printed {printed} of {day_sales} receipts')
+
+    # A sale from before VAT (vat_amount NULL) whose lines and total were rounded apart by the cents migration
+    legacy_id = ids[1]
+    with app.app_context():
+        legacy = db.session.get(Transaction, legacy_id)
+        legacy.vat_amount, legacy.total_amount = None, legacy.total_amount + 1
+        db.session.commit()
+    receipt_cache.invalidate()
+    for fmt in FORMATS:
+        status = client.get(f'/transactions/{legacy_id}/receipt?format={fmt}').status_code
+        if status != 200:
+            failures.append(f'receipt {legacy_id} without vat_amount ({fmt}) returned {status}')
+
+    # A cached receipt prints the product's new name once the rename commits
+    transaction_id = ids[0]
+    client.get(f'/transactions/{transaction_id}/receipt')
+    with app.app_context():
+        detail = TransactionDetail.query.filter_by(transaction_id=transaction_id).first()
+        db.session.get(Product, detail.product_id).product_name = 'Renamed product'
+        db.session.commit()
+    if 'Renamed product' not in client.get(f'/transactions/{transaction_id}/receipt').get_data(as_text=True):
+        failures.append(f'receipt {transaction_id} still shows the old product name after a rename')
+
+    os.remove(app.config['BENCH_DB_PATH'])
+    for failure in failures[:10]:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
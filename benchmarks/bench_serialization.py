@@ -0,0 +1,151 @@
+"""List serialization: ORM entities + dicts vs column tuples, stdlib json vs orjson, records vs columnar.
+
+    python benchmarks/bench_serialization.py [--products 5000] [--months 1] [--sales-per-day 300]
+
+Generates a store (see datagen.py), then encodes the whole inventory log (with product
+names) and the product catalog each way and prints rows/second and bytes per row.
+Exits non-zero if GET /inventory, /transactions or /products return anything different
+from the previous ORM-based handlers, or if a columnar page does not match its records.
+"""
+import argparse
+import os
+import sys
+import time
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import joinedload, selectinload
+
+from common import make_app
+from datagen import generate
+from models import db, Product, Transaction, InventoryLog
+from serialization import FastJSONProvider, orjson, records, columnar
+from catalog import PRODUCT_COLUMNS, product_rows, serialize_product
+from money import to_amount
+
+
+# Verbatim copies of the handlers' previous per-entity serializers, kept only for comparison
+def legacy_inventory_log(l):
+    return {
+        'log_id': l.log_id,
+        'product_id': l.product_id,
+        'product_name': l.product.product_name if l.product else None,
+        'change_type': l.change_type,
+        'quantity_change': l.quantity_change,
+        'remarks': l.remarks,
+        'date_time': l.date_time
+    }
+
+
+def legacy_transaction(t):
+    return {
+        'transaction_id': t.transaction_id,
+        'user_id': t.user_id,
+        'payment_method': t.payment_method,
+        'total_amount': to_amount(t.total_amount),
+        'discount_amount': to_amount(t.discount_amount),
+        'vat_amount': to_amount(t.vat_amount),
+        'date_time': t.date_time,
+        'items': [{
+            'product_id': d.product_id,
+            'quantity': d.quantity,
+            'price': to_amount(d.price),
+            'discount': to_amount(d.discount),
+            'subtotal': to_amount(d.subtotal)
+        } for d in t.details]
+    }
+
+
+INVENTORY_COLUMNS = (InventoryLog.log_id, InventoryLog.product_id, Product.product_name, InventoryLog.change_type,
+                     InventoryLog.quantity_change, InventoryLog.remarks, InventoryLog.date_time)
+
+
+def inventory_tuples():
+    return db.session.query(*INVENTORY_COLUMNS).outerjoin(
+        Product, Product.product_id == InventoryLog.product_id).order_by(InventoryLog.log_id).all()
+
+
+def measure(fn, repeat=3):
+    """Best of repeat runs: (seconds, encoded bytes)."""
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(body)
+
+
+def compare_endpoints(app, failures):
+    client = app.test_client()
+    with app.app_context():
+        expected = {
+            '/inventory?limit=1000': [legacy_inventory_log(l) for l in InventoryLog.query.options(
+                joinedload(InventoryLog.product)).order_by(InventoryLog.log_id).limit(1000)],
+            '/transactions?limit=1000': [legacy_transaction(t) for t in Transaction.query.options(
+                selectinload(Transaction.details)).order_by(Transaction.transaction_id).limit(1000)],
+            '/products': [dict(serialize_product(p), price=to_amount(p.price))
+                          for p in Product.query.order_by(Product.product_id)],
+        }
+        # Through the stdlib provider, so dates come out exactly as the old responses had them
+        expected = {url: app.json.loads(DefaultJSONProvider(app).dumps(rows)) for url, rows in expected.items()}
+    for url, rows in expected.items():
+        got = client.get(url).get_json()
+        if got != rows:
+            failures.append(f'{url} differs from the ORM handler')
+        table = client.get(url + ('&' if '?' in url else '?') + 'format=columnar').get_json()
+        if [dict(zip(table['columns'], values)) for values in zip(*table['data'])] != rows:
+            failures.append(f'{url} columnar does not match its records')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--months', type=int, default=1)
+    parser.add_argument('--sales-per-day', type=int, default=300)
+    args = parser.parse_args()
+
+    app = make_app(METRICS_ENABLED=False)
+    generate(app, products=args.products, months=args.months, sales_per_day=args.sales_per_day)
+    failures = []
+    compare_endpoints(app, failures)
+
+    stdlib, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+    compact = {'separators': (',', ':')}  # what jsonify sends outside debug mode
+    with app.app_context():
+        logs = db.session.query(InventoryLog).count()
+        products = db.session.query(Product).count()
+        cases = [
+            ('inventory', logs, 'ORM entities + dicts, json', lambda: stdlib.dumps([
+                legacy_inventory_log(l) for l in InventoryLog.query.options(
+                    joinedload(InventoryLog.product)).order_by(InventoryLog.log_id)], **compact)),
+            ('inventory', logs, 'column tuples + dicts, json',
+             lambda: stdlib.dumps(records(INVENTORY_COLUMNS, inventory_tuples()), **compact)),
+            ('inventory', logs, 'column tuples + dicts, orjson',
+             lambda: fast.dumps(records(INVENTORY_COLUMNS, inventory_tuples()))),
+            ('inventory', logs, 'column tuples, columnar, orjson',
+             lambda: fast.dumps(columnar(INVENTORY_COLUMNS, inventory_tuples()))),
+            ('products', products, 'ORM entities + dicts, json', lambda: stdlib.dumps([
+                serialize_product(p) for p in Product.query.order_by(Product.product_id)], **compact)),
+            ('products', products, 'column tuples + dicts, json', lambda: stdlib.dumps(
+                records(PRODUCT_COLUMNS, product_rows().order_by(Product.product_id).all()), **compact)),
+            ('products', products, 'column tuples + dicts, orjson', lambda: fast.dumps(
+                records(PRODUCT_COLUMNS, product_rows().order_by(Product.product_id).all()))),
+            ('products', products, 'column tuples, columnar, orjson', lambda: fast.dumps(
+                columnar(PRODUCT_COLUMNS, product_rows().order_by(Product.product_id).all()))),
+        ]
+        print(f"{'list':<10} {'rows':>7}  {'path':<34} {'rows/s':>10} {'bytes/row':>10}")
+        for name, rows, label, fn in cases:
+            seconds, size = measure(fn)
+            print(f'{name:<10} {rows:>7}  {label:<34} {rows / seconds:>10.0f} {size / rows:>10.1f}')
+    if orjson is None:
+        print('orjson is not installed: the orjson rows used the stdlib encoder')
+    os.remove(app.config['BENCH_DB_PATH'])
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
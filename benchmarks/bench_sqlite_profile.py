@@ -0,0 +1,93 @@
+"""Mixed read/write throughput with the default SQLite setup vs the tuned profile.
+
+Each worker process is an independent app (like one server worker) doing
+checkouts and dashboard/list reads against the same database file.
+
+    python benchmarks/bench_sqlite_profile.py [--workers 4] [--seconds 10] [--write-ratio 0.2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+from common import make_app, seed_catalog, percentile
+from models import db
+from sqlite_tuning import current_pragmas
+
+PROFILES = {
+    # What config.py used to give: rollback journal, synchronous=FULL, 5s driver timeout
+    'default': {'SQLITE_PRAGMAS': {}, 'SQLALCHEMY_ENGINE_OPTIONS': {}},
+    'tuned': {},
+}
+
+READS = ['/transactions?limit=50', '/inventory?limit=50', '/reports/daily', '/reports/monthly', '/products']
+
+
+def worker(db_path, profile, user_id, product_ids, seconds, write_ratio, seed, results):
+    app = make_app(db_path, **PROFILES[profile])
+    client = app.test_client()
+    rng = random.Random(seed)
+    reads, writes, errors, latencies = 0, 0, 0, []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        if rng.random() < write_ratio:
+            items = [{'product_id': pid, 'quantity': 1, 'price': 10.0} for pid in rng.sample(product_ids, 3)]
+            response = client.post('/transactions', json={
+                'user_id': user_id, 'payment_method': 'cash', 'total_amount': 30.0, 'items': items})
+            writes += 1
+        else:
+            response = client.get(rng.choice(READS))
+            reads += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if response.status_code != 200:
+            errors += 1
+    results.put((reads, writes, errors, latencies))
+
+
+def run(profile, args):
+    app = make_app(**PROFILES[profile])
+    db_path = app.config['BENCH_DB_PATH']
+    user_id, product_ids = seed_catalog(app, products=500)
+    with app.app_context():
+        pragmas = current_pragmas()
+        db.session.remove()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(db_path, profile, user_id, product_ids, args.seconds,
+                                              args.write_ratio, seed, results))
+             for seed in range(args.workers)]
+    for p in procs:
+        p.start()
+    reads = writes = errors = 0
+    latencies = []
+    for _ in procs:
+        r, w, e, l = results.get()
+        reads, writes, errors = reads + r, writes + w, errors + e
+        latencies.extend(l)
+    for p in procs:
+        p.join()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    total = reads + writes
+    print(f"{profile:<8} journal={pragmas['journal_mode']:<8} sync={pragmas['synchronous']} "
+          f"ops/s={total / args.seconds:>8.1f} reads={reads:>6} writes={writes:>5} errors={errors:>4} "
+          f"p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+    for profile in PROFILES:
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Parallel checkout from several stores: one shared database vs one database per store.
+
+    python benchmarks/bench_stores.py [--stores 8] [--sales 300] [--basket 5]
+
+Each store is a process posting --sales checkouts (one till each, X-Store-Id and
+X-Terminal-Id set). First every store writes to the same SQLite file, then each store
+to its own (STORES, see sharding.py). Prints chain-wide throughput and latency for
+both, then consolidates the store rollups into the head office and exits non-zero if
+the consolidated report or any store's sales disagree with what the tills recorded, or
+if a cashier added at the head office after `stores init` cannot sell and log in at a
+store (or still can once deleted).
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+from common import make_app, seed_catalog, percentile
+from models import db, User, Product, Transaction
+from sharding import store_context
+from stores import init_store, consolidate, store_report
+
+
+def till(db_path, config, store_id, user_id, product_ids, sales, basket, ready, start, results):
+    app = make_app(db_path, **config)
+    client = app.test_client()
+    headers = {'X-Store-Id': store_id, 'X-Terminal-Id': f'{store_id}-till-1'}
+    payload = {'user_id': user_id, 'payment_method': 'cash', 'total_amount': basket * 10.0,
+               'items': [{'product_id': pid, 'quantity': 1, 'price': 10.0} for pid in product_ids[:basket]]}
+    client.get('/products', headers=headers)  # warm the catalog cache and the connection pool
+    ready.put(store_id)
+    start.wait()
+    latencies = []
+    for _ in range(sales):
+        t0 = time.perf_counter()
+        response = client.post('/transactions', json=payload, headers=headers)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(response.get_json())
+    results.put((store_id, latencies, time.perf_counter()))
+
+
+def run(label, db_path, config, store_ids, user_id, product_ids, args):
+    ctx = multiprocessing.get_context('spawn')
+    ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+    workers = [ctx.Process(target=till, args=(db_path, config, store_id, user_id, product_ids,
+                                              args.sales, args.basket, ready, start, results))
+               for store_id in store_ids]
+    for w in workers:
+        w.start()
+    for _ in workers:
+        ready.get()
+    started = time.perf_counter()
+    start.set()
+    latencies, finished = [], started
+    for _ in workers:
+        _, worker_latencies, worker_finished = results.get()
+        latencies += worker_latencies
+        finished = max(finished, worker_finished)
+    for w in workers:
+        w.join()
+    rate = len(latencies) / (finished - started)
+    print(f'{label:<18} {rate:>10.1f} {percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f}')
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', type=int, default=8)
+    parser.add_argument('--sales', type=int, default=300)
+    parser.add_argument('--basket', type=int, default=5)
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args()
+    store_ids = [f'store-{i}' for i in range(args.stores)]
+    config = {'METRICS_ENABLED': False, 'JOB_WORKERS': 0}
+    failures = []
+
+    print(f"{'databases':<18} {'sales/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    app = make_app(**config)
+    user_id, product_ids = seed_catalog(app, products=args.products)
+    single = run('1 shared', app.config['BENCH_DB_PATH'], config, store_ids, user_id, product_ids, args)
+    with app.app_context():
+        stamped = db.session.query(Transaction.store_id, db.func.count()).group_by(Transaction.store_id).all()
+    if sorted(stamped) != [(s, args.sales) for s in store_ids]:
+        failures.append(f'shared database: sales per store {stamped}')
+    os.remove(app.config['BENCH_DB_PATH'])
+
+    directory = tempfile.mkdtemp(prefix='pos-bench-stores-')
+    sharded_config = dict(config, STORES=store_ids, STORE_DATABASE_DIR=directory)
+    app = make_app(**sharded_config)
+    user_id, product_ids = seed_catalog(app, products=args.products)
+    with app.app_context():
+        for store_id in store_ids:
+            init_store(store_id)
+            with store_context(store_id):
+                db.session.query(Product).update({Product.stock_quantity: 10**9})
+                db.session.commit()
+    sharded = run(f'{args.stores} per store', app.config['BENCH_DB_PATH'], sharded_config, store_ids,
+                  user_id, product_ids, args)
+    print(f'speed-up: {sharded / single:.2f}x on {os.cpu_count()} CPUs')
+
+    with app.app_context():
+        started = time.perf_counter()
+        consolidate()
+        report = store_report(date.min, date.max)
+        print(f'consolidation: {(time.perf_counter() - started) * 1000:.1f} ms for {args.stores} stores')
+        expected = args.sales * args.basket * 10.0
+        for row in report['stores']:
+            if row['transactions'] != args.sales or abs(row['total_sales'] - expected) > 0.01:
+                failures.append(f"{row['store_id']}: {row['transactions']} sales, {row['total_sales']} "
+                                f"(expected {args.sales}, {expected})")
+        if report['transactions'] != args.sales * args.stores or len(report['stores']) != args.stores:
+            failures.append(f"consolidated {report['transactions']} sales from {len(report['stores'])} stores")
+        if db.session.query(Transaction).count():
+            failures.append('store sales were written to the head-office database')
+
+    # Users added and deleted at the head office after `stores init` reach the stores as they commit
+    client = app.test_client()
+    store = {'X-Store-Id': store_ids[-1]}
+    client.post('/users', json={'username': 'late-cashier', 'password': 'secret', 'role': 'cashier'})
+    with app.app_context():
+        late_id = db.session.query(User.user_id).filter_by(username='late-cashier').scalar()
+    sale = {'user_id': late_id, 'payment_method': 'cash', 'total_amount': 10.0,
+            'items': [{'product_id': product_ids[0], 'quantity': 1, 'price': 10.0}]}
+    credentials = {'username': 'late-cashier', 'password': 'secret'}
+    added = (client.post('/transactions', json=sale, headers=store).status_code,
+             client.post('/login', data=credentials, headers=store).status_code)
+    client.post(f'/admin/users/delete/{late_id}')
+    deleted = (client.post('/transactions', json=sale, headers=store).status_code,
+               client.post('/login', data=credentials, headers=store).status_code)
+    print(f'user added after init: sale {added[0]}, login {added[1]}; deleted: sale {deleted[0]}, login {deleted[1]}')
+    if (added, deleted) != ((200, 302), (400, 401)):
+        failures.append(f'store catalog sync: added {added}, deleted {deleted} (expected (200, 302), (400, 401))')
+    os.remove(app.config['BENCH_DB_PATH'])
+    shutil.rmtree(directory)
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Flushing an offline terminal queue: one POST /transactions per sale vs POST /transactions/sync batches.
+
+    python benchmarks/bench_sync.py [--sales 2000] [--batch 200]
+
+Each path is run twice over the same queue; the second run is what a terminal
+retrying after a timeout sends, and must not record anything new.
+"""
+import argparse
+import os
+import time
+import uuid
+
+from common import make_app, seed_catalog
+from models import db, Transaction
+
+
+def queue(user_id, product_ids, sales):
+    return [{
+        'idempotency_key': uuid.uuid4().hex,
+        'user_id': user_id,
+        'payment_method': 'cash',
+        'total_amount': 30.0,
+        'items': [{'product_id': product_ids[(i + j) % len(product_ids)], 'quantity': 1, 'price': 10.0}
+                  for j in range(3)]
+    } for i in range(sales)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sales', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'path':<16} {'run':<8} {'sales/s':>10}")
+    for path in ('single', 'sync'):
+        app = make_app()
+        user_id, product_ids = seed_catalog(app, products=100)
+        client = app.test_client()
+        sales = queue(user_id, product_ids, args.sales)
+        for run in ('first', 'retry'):
+            started = time.perf_counter()
+            if path == 'single':
+                for sale in sales:
+                    response = client.post('/transactions', json=sale,
+                                           headers={'Idempotency-Key': sale['idempotency_key']})
+                    assert response.status_code == 200, response.get_json()
+            else:
+                expected = 'created' if run == 'first' else 'duplicate'
+                for i in range(0, len(sales), args.batch):
+                    response = client.post('/transactions/sync', json={'sales': sales[i:i + args.batch]})
+                    assert all(r['status'] == expected for r in response.get_json()['results'])
+            rate = len(sales) / (time.perf_counter() - started)
+            print(f"{path:<16} {run:<8} {rate:>10.1f}")
+        with app.app_context():
+            assert db.session.query(Transaction).count() == args.sales
+        os.remove(app.config['BENCH_DB_PATH'])
+
+
+if __name__ == '__main__':
+    main()
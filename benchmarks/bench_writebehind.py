@@ -0,0 +1,124 @@
+"""Checkout latency with synchronous vs write-behind inventory logging, plus a crash test.
+
+    python benchmarks/bench_writebehind.py [--iterations 500] [--basket 10]
+
+Times POST /transactions with INVENTORY_WRITE_BEHIND off and on, then flushes and checks
+the ledger has no drift. The crash test runs checkouts in a child process that never
+flushes and dies with os._exit; replaying its journal must leave no drift either.
+Exits non-zero if any check fails.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from sqlalchemy import func, insert
+
+from common import make_app, seed_catalog, timed
+from models import db, User, Product, InventoryLog, TransactionDetail
+from ledger import find_drift
+from journal import inventory_journal, replay_dead_journals
+
+STOCK = 10**6
+
+
+def seed(app, products):
+    user_id, product_ids = seed_catalog(app, products=products, stock=STOCK)
+    with app.app_context():
+        # Opening balances, so the ledger agrees with stock before the first sale
+        db.session.execute(insert(InventoryLog), [
+            {'product_id': pid, 'change_type': 'Restock', 'quantity_change': STOCK, 'remarks': 'Opening stock'}
+            for pid in product_ids
+        ])
+        db.session.commit()
+    return user_id, product_ids
+
+
+def basket(user_id, product_ids, size):
+    items = [{'product_id': pid, 'quantity': 1, 'price': 10.0} for pid in product_ids[:size]]
+    return {'user_id': user_id, 'payment_method': 'cash', 'total_amount': 10.0 * size, 'items': items}
+
+
+def check_ledger(label, failures):
+    drift = find_drift()
+    if drift:
+        failures.append(f'{label}: {len(drift)} products drift, e.g. {drift[0]}')
+    logs = db.session.query(func.count()).filter(InventoryLog.change_type == 'Sale').scalar()
+    details = db.session.query(func.count(TransactionDetail.detail_id)).scalar()
+    if logs != details:
+        failures.append(f'{label}: {logs} sale logs for {details} line items')
+
+
+def crash_child(db_path, journal_dir, sales, size):
+    app = make_app(db_path, INVENTORY_WRITE_BEHIND=True, INVENTORY_JOURNAL_DIR=journal_dir,
+                   INVENTORY_FLUSH_INTERVAL=3600, INVENTORY_JOURNAL_SCAN_INTERVAL=3600, METRICS_ENABLED=False)
+    client = app.test_client()
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench-cashier').one().user_id
+        product_ids = [pid for (pid,) in db.session.query(Product.product_id).order_by(Product.product_id)]
+    for _ in range(sales):
+        response = client.post('/transactions', json=basket(user_id, product_ids, size))
+        assert response.status_code == 200, response.get_json()
+    os._exit(0)  # no atexit flush: everything is left in the journal
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--basket', type=int, default=10)
+    parser.add_argument('--crash-child', nargs=2, metavar=('DB', 'JOURNAL_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.crash_child:
+        crash_child(*args.crash_child, args.iterations, args.basket)
+
+    journal_dir = tempfile.mkdtemp(prefix='pos-journal-')
+    failures = []
+    print(f"{'logging':<14} {'sales/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, write_behind in (('synchronous', False), ('write-behind', True)):
+        app = make_app(INVENTORY_WRITE_BEHIND=write_behind, INVENTORY_JOURNAL_DIR=journal_dir,
+                       INVENTORY_JOURNAL_SCAN_INTERVAL=3600, METRICS_ENABLED=False)
+        user_id, product_ids = seed(app, products=max(100, args.basket))
+        client = app.test_client()
+        payload = basket(user_id, product_ids, args.basket)
+
+        def sale():
+            response = client.post('/transactions', json=payload)
+            assert response.status_code == 200, response.get_json()
+
+        rate, p50, p99 = timed(sale, args.iterations)
+        print(f'{label:<14} {rate:>10.1f} {p50:>8.2f} {p99:>8.2f}')
+        with app.app_context():
+            check_ledger(label, failures)
+            if write_behind:
+                inventory_journal.close()
+        os.remove(app.config['BENCH_DB_PATH'])
+
+    # Crash test: the child journals its sales and dies without flushing
+    app = make_app(INVENTORY_JOURNAL_DIR=journal_dir)
+    seed(app, products=max(100, args.basket))
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--iterations', str(args.iterations // 5),
+                    '--basket', str(args.basket), '--crash-child', app.config['BENCH_DB_PATH'], journal_dir],
+                   check=True)
+    with app.app_context():
+        missing = (db.session.query(func.count(TransactionDetail.detail_id)).scalar() -
+                   db.session.query(func.count()).filter(InventoryLog.change_type == 'Sale').scalar())
+        recovered = replay_dead_journals()
+        print(f'crash test: {missing} sale logs missing after the crash, {recovered} sales replayed')
+        if not missing:
+            failures.append('crash test: the child flushed before dying, nothing to replay')
+        check_ledger('crash test', failures)
+    if os.listdir(journal_dir):
+        failures.append(f'journals left behind: {os.listdir(journal_dir)}')
+    os.remove(app.config['BENCH_DB_PATH'])
+    shutil.rmtree(journal_dir)
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
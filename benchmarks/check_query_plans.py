@@ -0,0 +1,123 @@
+"""EXPLAIN QUERY PLAN guard for the hot read paths.
+
+Drives the real endpoints through the test client, captures every SELECT they
+issue, and re-runs each one under EXPLAIN QUERY PLAN. Exits non-zero if any
+query does a full table scan of a history table.
+
+    python benchmarks/check_query_plans.py
+"""
+import re
+import sys
+from datetime import date
+
+from sqlalchemy import event
+
+from common import make_app, seed_catalog
+from models import db, Product
+from product_search import code_index
+
+# Tables that grow with business history; a bare "SCAN <table>" on these is a regression
+HOT_TABLES = {'transaction', 'transaction_detail', 'payment', 'inventory_log', 'product',
+              'daily_sales', 'daily_product_sales'}
+
+today = date.today().isoformat()
+
+# (description, path, indexes the plan must use, tables allowed to be scanned by this request)
+CHECKS = [
+    ('transactions page', '/transactions?limit=50', set(), set()),
+    ('transactions by date range', f'/transactions?start={today}&end={today}', {'ix_transaction_date_time'}, set()),
+    ('transactions by cashier', '/transactions?user_id=1', {'ix_transaction_user_id'}, set()),
+    ('transactions containing product', '/transactions?product_id=2',
+     {'ix_transaction_detail_product_transaction', 'ix_transaction_detail_transaction_id'}, set()),
+    ('transactions by payment method', '/transactions?payment_method=cash', {'ix_transaction_payment_method'}, set()),
+    ('transactions by payment method, next page', '/transactions?payment_method=cash&after=20',
+     {'ix_transaction_payment_method'}, set()),
+    ('inventory page', '/inventory?limit=50', set(), set()),
+    ('inventory by product', '/inventory?product_id=2', {'ix_inventory_log_product_id'}, set()),
+    ('inventory by change type', '/inventory?change_type=Sale', {'ix_inventory_log_change_type'}, set()),
+    ('inventory by date range', f'/inventory?start={today}&end={today}', {'ix_inventory_log_date_time'}, set()),
+    # a code this worker has not seen yet goes to the database
+    ('scanned code not in index', '/products/lookup?code=4800000000002', {'ix_product_sku', 'ix_product_barcode'}, set()),
+    ('daily report', '/reports/daily', set(), set()),
+    ('monthly report', '/reports/monthly', set(), set()),
+    ('range report', f'/reports/range?start={today}&end={today}', set(), set()),
+    ('product report', f'/reports/products?start={today}&end={today}', set(), set()),
+    ('receipt', '/transactions/1/receipt', {'ix_transaction_detail_transaction_id', 'ix_payment_transaction_id'}, set()),
+    ('end-of-day receipts', f'/receipts?start={today}&end={today}', {'ix_transaction_date_time'}, set()),
+    # the catalog tables are rendered in full, and all-time top products reads the per-day rollup
+    ('admin dashboard', '/admin', {'ix_product_stock_quantity'}, {'product', 'daily_product_sales'}),
+    ('admin transactions tab', '/admin/data/transactions', set(), set()),
+    ('admin inventory tab', '/admin/data/inventory', set(), set()),
+    ('admin details tab', '/admin/data/transaction-details', set(), set()),
+    ('admin payments tab', '/admin/data/payments', set(), set()),
+]
+
+SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+def explain(connection, statement, parameters):
+    """Return (tables fully scanned, index names used) for one statement."""
+    plan = [row[-1].strip() for row in
+            connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()]
+    indexes = {m.group(1) for m in map(INDEX.search, plan) if m}
+    # An unfiltered LIMITed walk in key order (no temp B-tree sort) stops after one page, so it is not
+    # a full scan; with a WHERE the walk may read the whole table looking for a page of matches
+    if ' LIMIT ' in statement and ' WHERE ' not in statement and not any('TEMP B-TREE' in line for line in plan):
+        return [], indexes
+    return [m.group(1) for m in map(SCAN.match, plan) if m], indexes
+
+
+def main():
+    app = make_app()
+    user_id, product_ids = seed_catalog(app, products=20, stock=1000)
+    client = app.test_client()
+    for i in range(30):
+        client.post('/transactions', json={
+            'user_id': user_id, 'payment_method': 'cash' if i % 2 else 'gcash', 'total_amount': 20.0,
+            'items': [{'product_id': product_ids[i % 20], 'quantity': 2, 'price': 10.0}]
+        })
+    with client.session_transaction() as s:
+        s['user_id'], s['role'] = user_id, 'admin'
+    with app.app_context():
+        code_index.build()
+        # written behind the index's back, as another worker would
+        db.session.execute(db.update(Product).where(Product.product_id == product_ids[1]).values(barcode='4800000000002'))
+        db.session.commit()
+
+    captured = []
+    with app.app_context():
+        engine = db.engine
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    failures = 0
+    for description, path, expected, allowed in CHECKS:
+        captured.clear()
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        statements = list(captured)
+        problems = []
+        used = set()
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                scans, indexes = explain(connection, statement, parameters)
+                used |= indexes
+                scans = [t for t in scans if t in HOT_TABLES - allowed]
+                if scans:
+                    problems.append(f"full scan of {', '.join(scans)}: {' '.join(statement.split())}")
+        for index in sorted(expected - used):
+            problems.append(f'expected index {index} was not used')
+        print(f"[{'FAIL' if problems else 'ok'}] {description} ({len(statements)} queries)")
+        for problem in problems:
+            print(f'    {problem}')
+        failures += len(problems)
+    event.remove(engine, 'before_cursor_execute', capture)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Category, Product
+from routes import initialize_routes
+from config import Config
+from sqlite_tuning import configure_sqlite
+from sharding import configure_stores
+from product_search import ensure_search_index
+
+
+def make_app(db_path=None, **config):
+    """Build a fresh app against its own SQLite file so benchmarks never touch pos.db."""
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='pos-bench-')
+        os.close(fd)
+    app = Flask('pos_bench', root_path=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    app.config.from_object(Config)
+    app.config.update(
+        SECRET_KEY='bench',
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + db_path,
+    )
+    app.config.update(config)
+    configure_stores(app)
+    db.init_app(app)
+    configure_sqlite(app)
+    initialize_routes(app)
+    with app.app_context():
+        db.create_all()
+        ensure_search_index()  # created by a migration in real deployments
+    app.config['BENCH_DB_PATH'] = db_path
+    return app
+
+
+def seed_catalog(app, products=200, stock=10**9, price=1000):  # price in cents; the scripts sell at 10.0
+    with app.app_context():
+        cashier = User(username='bench-cashier', password='x', role='cashier')
+        category = Category(category_name='Bench')
+        db.session.add_all([cashier, category])
+        db.session.flush()
+        db.session.add_all([
+            Product(product_name=f'Item {i}', category_id=category.category_id,
+                    price=price, stock_quantity=stock, unit='pcs')
+            for i in range(products)
+        ])
+        db.session.commit()
+        return cashier.user_id, [p.product_id for p in Product.query.order_by(Product.product_id)]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def timed(fn, iterations):
+    """Run fn iterations times; return (ops/sec, p50 ms, p99 ms)."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed, percentile(latencies, 50), percentile(latencies, 99)
@@ -0,0 +1,63 @@
+"""Compare two harness.py result files, e.g. the base and head of a change.
+
+    python benchmarks/compare.py base.json head.json [--threshold 15]
+
+Prints p50/p99 latency and throughput per scenario side by side. Exits non-zero
+if any scenario's p50 grew, or its throughput fell, by more than --threshold percent.
+Only compare runs made on the same machine against the same store.
+"""
+import argparse
+import json
+import sys
+
+
+def change(base, head):
+    return (head - base) / base * 100 if base else 0.0
+
+
+def sections(results):
+    if 'client' in results:
+        yield 'client', results['client']
+    if 'http' in results:
+        yield 'http', results['http']['scenarios']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=15.0, help='Percent.')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print(f"base {(base['meta'].get('commit') or '?')[:10]}  head {(head['meta'].get('commit') or '?')[:10]}")
+
+    regressions = []
+    head_sections = dict(sections(head))
+    for section, base_rows in sections(base):
+        if section not in head_sections:
+            continue
+        head_rows = head_sections[section]
+        print(f"{section} (base, head)")
+        print(f"  {'scenario':<16} {'p50 ms':^25} {'p99 ms':^17} {'ops/s':^27}")
+        for name, old in base_rows.items():
+            new = head_rows.get(name)
+            if not new or 'p50_ms' not in old or 'p50_ms' not in new:
+                continue
+            p50 = change(old['p50_ms'], new['p50_ms'])
+            ops = change(old['ops_per_sec'], new['ops_per_sec'])
+            print(f"  {name:<16} {old['p50_ms']:>8.2f} {new['p50_ms']:>8.2f} {p50:>+6.1f}% "
+                  f"{old['p99_ms']:>8.2f} {new['p99_ms']:>8.2f} "
+                  f"{old['ops_per_sec']:>9.1f} {new['ops_per_sec']:>9.1f} {ops:>+6.1f}%")
+            if p50 > args.threshold or -ops > args.threshold:
+                regressions.append(f'{section}/{name}')
+    if regressions:
+        print(f"regressed beyond {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
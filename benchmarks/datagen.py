@@ -0,0 +1,189 @@
+"""Synthetic store generator: a realistic catalog and sales history in a SQLite file.
+
+    python benchmarks/datagen.py store.db [--products 2000] [--categories 25] [--months 3]
+                                 [--sales-per-day 300] [--seed 1] [--force]
+
+Product popularity is Zipf-skewed, sales follow a weekday and time-of-day curve,
+baskets are mostly small, and every sale writes its line items, payment and 'Sale'
+inventory logs. Products are restocked when they run low, so stock_quantity always
+matches the inventory ledger. Rollups and the search index are rebuilt at the end.
+The same seed always produces the same store.
+
+The admin user is 'bench-admin' with password 'bench'.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, update
+from werkzeug.security import generate_password_hash
+
+from common import make_app
+from models import db, User, Category, Product, Transaction, TransactionDetail, Payment, InventoryLog
+from rollups import rebuild_rollups
+
+ADMIN_USERNAME = 'bench-admin'
+ADMIN_PASSWORD = 'bench'
+
+WORDS = ['apple', 'banana', 'bread', 'butter', 'cheese', 'coffee', 'cola', 'eggs', 'flour', 'juice',
+         'milk', 'noodles', 'orange', 'pasta', 'rice', 'salt', 'soap', 'sugar', 'tea', 'water',
+         'yogurt', 'honey', 'beans', 'crackers', 'chips', 'vinegar', 'pepper', 'lotion', 'tissue', 'candle']
+UNITS = ['pcs', 'pcs', 'pcs', 'kg', 'pack', 'bottle']
+PAYMENT_METHODS = ['cash'] * 5 + ['card'] * 4 + ['mobile']
+WEEKDAY_FACTOR = (0.85, 0.8, 0.85, 0.95, 1.15, 1.4, 1.0)  # Monday first
+HOUR_WEIGHTS = {7: 2, 8: 4, 9: 5, 10: 6, 11: 8, 12: 10, 13: 9, 14: 6, 15: 6, 16: 7, 17: 10, 18: 11, 19: 8, 20: 4, 21: 2}
+REORDER_LEVEL = 10
+CHUNK = 20000
+
+
+def zipf_weights(count, skew=1.1):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def generate(app, products=2000, categories=25, months=3, sales_per_day=300, seed=1, end=None):
+    """Fill an empty schema; returns a summary dict."""
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=30 * months - 1)
+    with app.app_context():
+        cashiers = [{'username': f'cashier-{i}', 'password': 'x', 'role': 'cashier'} for i in range(5)]
+        db.session.execute(insert(User), [
+            {'username': ADMIN_USERNAME, 'password': generate_password_hash(ADMIN_PASSWORD), 'role': 'admin'}
+        ] + cashiers)
+        user_ids = [uid for (uid,) in db.session.query(User.user_id).filter(User.role == 'cashier')]
+
+        db.session.execute(insert(Category), [
+            {'category_name': f'{rng.choice(WORDS).title()} & {rng.choice(WORDS).title()} {i}'} for i in range(categories)
+        ])
+        category_ids = [cid for (cid,) in db.session.query(Category.category_id)]
+
+        opened = datetime.combine(start, datetime.min.time())
+        catalog = []
+        for i in range(products):
+            price = round(min(500.0, math.exp(rng.gauss(1.6, 0.9))) * 100)  # cents
+            catalog.append({
+                'product_name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+                'category_id': rng.choice(category_ids),
+                'price': max(price, 25),
+                'stock_quantity': 0,
+                'unit': rng.choice(UNITS),
+                'sku': f'SKU-{i:06d}',
+                'barcode': f'{4000000000000 + i * 7:013d}',
+                'created_at': opened
+            })
+        db.session.execute(insert(Product), catalog)
+        rows = db.session.query(Product.product_id, Product.price).order_by(Product.product_id).all()
+        product_ids = [pid for pid, _ in rows]
+        prices = dict(rows)
+        # Popularity rank is independent of product_id order
+        ranked = product_ids[:]
+        rng.shuffle(ranked)
+        cum_weights = []
+        total = 0.0
+        for weight in zipf_weights(len(ranked)):
+            total += weight
+            cum_weights.append(total)
+
+        stock = {pid: rng.randint(20, 200) for pid in product_ids}
+        restock_size = {pid: max(stock[pid], 24) for pid in product_ids}
+        db.session.execute(insert(InventoryLog), [
+            {'product_id': pid, 'change_type': 'Initial Stock', 'quantity_change': qty,
+             'remarks': 'Opening stock', 'date_time': opened}
+            for pid, qty in stock.items()
+        ])
+
+        hours = list(HOUR_WEIGHTS)
+        hour_weights = list(HOUR_WEIGHTS.values())
+        transaction_id = (db.session.query(db.func.max(Transaction.transaction_id)).scalar() or 0)
+        pending = {'transaction': [], 'detail': [], 'payment': [], 'log': []}
+        sales = lines = 0
+
+        def flush():
+            for model, key in ((Transaction, 'transaction'), (TransactionDetail, 'detail'),
+                               (Payment, 'payment'), (InventoryLog, 'log')):
+                if pending[key]:
+                    db.session.execute(insert(model), pending[key])
+                    pending[key] = []
+
+        day = start
+        while day <= end:
+            count = max(1, int(rng.gauss(sales_per_day * WEEKDAY_FACTOR[day.weekday()], sales_per_day * 0.1)))
+            times = sorted(
+                datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, seconds=rng.randrange(3600))
+                for hour in rng.choices(hours, hour_weights, k=count)
+            )
+            for sold_at in times:
+                transaction_id += 1
+                basket = min(1 + int(rng.expovariate(0.45)), 15)
+                items = {}
+                for pid in rng.choices(ranked, cum_weights=cum_weights, k=basket):
+                    items[pid] = items.get(pid, 0) + (1 if rng.random() < 0.8 else rng.randint(2, 4))
+                total_amount = 0
+                for pid, quantity in items.items():
+                    if stock[pid] < quantity:
+                        # The night-before delivery arrived just in time
+                        pending['log'].append({'product_id': pid, 'change_type': 'Restock',
+                                               'quantity_change': restock_size[pid], 'remarks': 'Supplier delivery',
+                                               'date_time': sold_at - timedelta(minutes=1)})
+                        stock[pid] += restock_size[pid]
+                    stock[pid] -= quantity
+                    subtotal = prices[pid] * quantity
+                    total_amount += subtotal
+                    pending['detail'].append({'transaction_id': transaction_id, 'product_id': pid, 'quantity': quantity,
+                                              'price': prices[pid], 'subtotal': subtotal})
+                    pending['log'].append({'product_id': pid, 'change_type': 'Sale', 'quantity_change': -quantity,
+                                           'remarks': f'Sold {quantity} during transaction {transaction_id}',
+                                           'date_time': sold_at})
+                method = rng.choice(PAYMENT_METHODS)
+                pending['transaction'].append({'transaction_id': transaction_id, 'user_id': rng.choice(user_ids),
+                                               'payment_method': method, 'total_amount': total_amount,
+                                               'date_time': sold_at})
+                pending['payment'].append({'transaction_id': transaction_id, 'method': method, 'amount': total_amount})
+                sales += 1
+                lines += len(items)
+            # Evening restock of whatever fell below the reorder level
+            for pid in product_ids:
+                if stock[pid] < REORDER_LEVEL:
+                    pending['log'].append({'product_id': pid, 'change_type': 'Restock',
+                                           'quantity_change': restock_size[pid], 'remarks': 'Supplier delivery',
+                                           'date_time': datetime.combine(day, datetime.min.time()) + timedelta(hours=22)})
+                    stock[pid] += restock_size[pid]
+            if len(pending['log']) >= CHUNK:
+                flush()
+            day += timedelta(days=1)
+        flush()
+
+        db.session.execute(update(Product), [{'product_id': pid, 'stock_quantity': qty} for pid, qty in stock.items()])
+        rebuild_rollups()
+        db.session.execute(db.text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+        db.session.commit()
+        return {'products': products, 'categories': categories, 'days': (end - start).days + 1,
+                'transactions': sales, 'line_items': lines, 'start': str(start), 'end': str(end), 'seed': seed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=25)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--sales-per-day', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='Overwrite an existing file.')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    if os.path.exists(path):
+        if not args.force:
+            sys.exit(f'{path} exists; use --force to overwrite it')
+        os.remove(path)
+    app = make_app(path)
+    summary = generate(app, args.products, args.categories, args.months, args.sales_per_day, args.seed)
+    print(', '.join(f'{key} {value}' for key, value in summary.items()))
+
+
+if __name__ == '__main__':
+    main()
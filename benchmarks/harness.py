@@ -0,0 +1,338 @@
+"""Benchmark harness: checkout, catalog reads, reports and dashboard against a generated store.
+
+    python benchmarks/harness.py [--db store.db] [--mode client|http|both] [--iterations 200]
+                                 [--workers 4] [--duration 10] [--url http://host:port] [--output results.json]
+
+client mode drives each scenario on its own through the Flask test client (no network,
+one thread), which isolates the cost of the code under test. http mode starts a threaded
+server and runs --workers load processes against it for --duration seconds, each firing
+the weighted scenario mix over keep-alive connections; pass --url to load a server that
+is already running on --db instead.
+
+Without --db a small store is generated first (see datagen.py); either way the run works
+on a copy, so the checkouts never touch the original file. Results are printed and, with
+--output, written as JSON for benchmarks/compare.py.
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, urlencode
+
+from common import make_app, percentile
+from datagen import ADMIN_USERNAME, ADMIN_PASSWORD, WORDS, generate, zipf_weights
+
+
+# ---------------- Store ----------------
+
+class Store:
+    """What the scenarios need to know about the data, read straight from the SQLite file."""
+
+    def __init__(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            self.user_id = conn.execute("SELECT user_id FROM user WHERE role = 'cashier' LIMIT 1").fetchone()[0]
+            self.products = conn.execute('SELECT product_id, price / 100.0, barcode FROM product ORDER BY product_id').fetchall()
+            last = conn.execute('SELECT max(date_time) FROM "transaction"').fetchone()[0]
+        finally:
+            conn.close()
+        self.last_day = datetime.fromisoformat(last).date() if last else date.today()
+        self.cum_weights = []
+        total = 0.0
+        for weight in zipf_weights(len(self.products)):
+            total += weight
+            self.cum_weights.append(total)
+
+    def popular(self, rng, k=1):
+        return rng.choices(self.products, cum_weights=self.cum_weights, k=k)
+
+    def days_back(self, days):
+        return str(self.last_day - timedelta(days=days - 1)), str(self.last_day)
+
+
+def restock(path, quantity=10**6):
+    """Top up every product in the working copy (logged, so the ledger still balances): a checkout
+    that fails for lack of stock measures the error path, not the sale."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(
+            "INSERT INTO inventory_log (product_id, change_type, quantity_change, remarks, date_time) "
+            "SELECT product_id, 'Restock', ?, 'Benchmark top-up', datetime('now') FROM product", (quantity,))
+        conn.execute('UPDATE product SET stock_quantity = stock_quantity + ?', (quantity,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ---------------- Scenarios ----------------
+# Each takes (client, store, rng) and returns the HTTP status code.
+
+def checkout(client, store, rng):
+    items = {}
+    for product_id, price, _ in store.popular(rng, rng.randint(1, 4)):
+        items[product_id] = {'product_id': product_id, 'quantity': 1, 'price': price}
+    sale = {'user_id': store.user_id, 'payment_method': rng.choice(('cash', 'card')),
+            'total_amount': round(sum(item['price'] for item in items.values()), 2), 'items': list(items.values())}
+    return client.post('/transactions', json=sale).status_code
+
+
+def product(client, store, rng):
+    return client.get(f'/products/{store.popular(rng)[0][0]}').status_code
+
+
+def catalog(client, store, rng):
+    return client.get('/products').status_code
+
+
+def search(client, store, rng):
+    word = rng.choice(WORDS)
+    return client.get('/products/search?' + urlencode({'q': word[:rng.randint(3, len(word))]})).status_code
+
+
+def lookup(client, store, rng):
+    return client.get('/products/lookup?' + urlencode({'code': store.popular(rng)[0][2]})).status_code
+
+
+def report_range(client, store, rng):
+    start, end = store.days_back(rng.choice((7, 30, 90)))
+    return client.get(f'/reports/range?start={start}&end={end}').status_code
+
+
+def report_products(client, store, rng):
+    start, end = store.days_back(30)
+    return client.get(f'/reports/products?start={start}&end={end}&limit=20').status_code
+
+
+def dashboard(client, store, rng):
+    return client.get('/admin').status_code
+
+
+# name: (scenario, weight in the http mix)
+SCENARIOS = {
+    'checkout': (checkout, 30),
+    'product': (product, 25),
+    'search': (search, 15),
+    'lookup': (lookup, 10),
+    'catalog': (catalog, 5),
+    'report_range': (report_range, 6),
+    'report_products': (report_products, 5),
+    'dashboard': (dashboard, 4),
+}
+
+
+def login(client):
+    client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+
+
+def summarize(latencies, elapsed, errors):
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'ops_per_sec': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+# ---------------- Test client ----------------
+
+def run_client(db_path, store, iterations, seed):
+    app = make_app(db_path, METRICS_SLOW_REQUEST_LOG=False)
+    client = app.test_client()
+    login(client)
+    results = {}
+    for name, (scenario, _) in SCENARIOS.items():
+        rng = random.Random(seed)
+        scenario(client, store, rng)  # warm caches and the connection pool
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            status = scenario(client, store, rng)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += status >= 400
+        results[name] = summarize(latencies, time.perf_counter() - started, errors)
+    return results
+
+
+# ---------------- HTTP load ----------------
+
+_dumps = json.dumps  # HttpClient.post's json argument shadows the module
+
+
+class HttpResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class HttpClient:
+    """Keep-alive client with the test client's get/post surface and a session cookie."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {}
+        if content_type:
+            headers['Content-Type'] = content_type
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            self.conn.close()  # reconnects on the next request
+            return HttpResponse(599)
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return HttpResponse(response.status)
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, json=None, data=None):
+        if json is not None:
+            return self.request('POST', path, _dumps(json), 'application/json')
+        return self.request('POST', path, urlencode(data or {}), 'application/x-www-form-urlencoded')
+
+
+def _serve(db_path, ready):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = make_app(db_path, METRICS_SLOW_REQUEST_LOG=False)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def _load_worker(url, db_path, duration, seed):
+    store = Store(db_path)
+    rng = random.Random(seed)
+    client = HttpClient(url)
+    login(client)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name][1] for name in names]
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        t0 = time.perf_counter()
+        status = SCENARIOS[name][0](client, store, rng)
+        latencies[name].append((time.perf_counter() - t0) * 1000)
+        errors[name] += status >= 400
+    return latencies, errors
+
+
+def run_http(db_path, store, workers, duration, seed, url=None):
+    server = None
+    if url is None:
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=_serve, args=(db_path, ready), daemon=True)
+        server.start()
+        url = f'http://127.0.0.1:{ready.get(timeout=60)}'
+    try:
+        started = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            outcomes = pool.starmap(_load_worker, [(url, db_path, duration, seed + i) for i in range(workers)])
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    results = {}
+    for name in SCENARIOS:
+        latencies = [ms for worker_latencies, _ in outcomes for ms in worker_latencies[name]]
+        results[name] = summarize(latencies, elapsed, sum(worker_errors[name] for _, worker_errors in outcomes))
+    all_latencies = [ms for worker_latencies, _ in outcomes for values in worker_latencies.values() for ms in values]
+    errors = sum(sum(worker_errors.values()) for _, worker_errors in outcomes)
+    return {'workers': workers, 'duration_s': duration, 'total': summarize(all_latencies, elapsed, errors),
+            'scenarios': results}
+
+
+# ---------------- Main ----------------
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                               capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit.stdout.strip(), 'dirty': bool(dirty.stdout.strip())}
+
+
+def print_table(title, results):
+    print(title)
+    print(f"  {'scenario':<16} {'requests':>8} {'errors':>6} {'ops/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for name, row in results.items():
+        print(f"  {name:<16} {row['requests']:>8} {row['errors']:>6} {row.get('ops_per_sec', 0):>9.1f} "
+              f"{row.get('p50_ms', 0):>8.2f} {row.get('p90_ms', 0):>8.2f} {row.get('p99_ms', 0):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='Store generated by datagen.py; a small one is generated if omitted.')
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--iterations', type=int, default=200, help='Per scenario, client mode.')
+    parser.add_argument('--workers', type=int, default=4, help='Load processes, http mode.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds, http mode.')
+    parser.add_argument('--url', help='Load an already running server instead of starting one.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pos-harness-')
+    db_path = os.path.join(workdir, 'store.db')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+            store_info = {'source': os.path.abspath(args.db)}
+        else:
+            store_info = generate(make_app(db_path), products=1000, months=2, sales_per_day=200, seed=args.seed)
+        restock(db_path)
+        store = Store(db_path)
+
+        results = {
+            'meta': dict(git_revision(), created_at=datetime.utcnow().isoformat(timespec='seconds'),
+                         python=platform.python_version(), sqlite=sqlite3.sqlite_version,
+                         cpus=os.cpu_count(), args=vars(args), store=store_info)
+        }
+        if args.mode in ('client', 'both'):
+            results['client'] = run_client(db_path, store, args.iterations, args.seed)
+            print_table('test client', results['client'])
+        if args.mode in ('http', 'both'):
+            results['http'] = run_http(db_path, store, args.workers, args.duration, args.seed, args.url)
+            print_table(f'http, {args.workers} workers x {args.duration:g}s', results['http']['scenarios'])
+            print_table('', {'total': results['http']['total']})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Multi-process stock stress test: parallel cashiers hammering the same few SKUs.
+
+Exits non-zero if any update was lost or any product was oversold.
+
+    python benchmarks/stress_stock.py [--workers 8] [--sales 200] [--stock 500]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+
+from common import make_app, seed_catalog
+from models import db, Product
+
+
+def cashier(db_path, user_id, product_ids, sales, seed, results):
+    app = make_app(db_path)
+    client = app.test_client()
+    rng = random.Random(seed)
+    sold = {pid: 0 for pid in product_ids}
+    rejected = 0
+    for _ in range(sales):
+        items = [{'product_id': pid, 'quantity': rng.randint(1, 3), 'price': 10.0}
+                 for pid in rng.sample(product_ids, rng.randint(1, len(product_ids)))]
+        response = client.post('/transactions', json={
+            'user_id': user_id, 'payment_method': 'cash',
+            'total_amount': sum(i['quantity'] * i['price'] for i in items), 'items': items
+        })
+        if response.status_code == 200:
+            for item in items:
+                sold[item['product_id']] += item['quantity']
+        elif response.status_code == 400 and 'Not enough stock' in response.get_json()['error']:
+            rejected += 1
+        else:
+            raise RuntimeError(response.get_json())
+    results.put((sold, rejected))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--sales', type=int, default=200)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--skus', type=int, default=3)
+    args = parser.parse_args()
+
+    app = make_app()
+    db_path = app.config['BENCH_DB_PATH']
+    user_id, product_ids = seed_catalog(app, products=args.skus, stock=args.stock)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=cashier, args=(db_path, user_id, product_ids, args.sales, seed, results))
+        for seed in range(args.workers)
+    ]
+    for w in workers:
+        w.start()
+    totals = {pid: 0 for pid in product_ids}
+    rejected = 0
+    for _ in workers:
+        sold, worker_rejected = results.get()
+        rejected += worker_rejected
+        for pid, quantity in sold.items():
+            totals[pid] += quantity
+    for w in workers:
+        w.join()
+
+    failed = False
+    with app.app_context():
+        for product in Product.query.filter(Product.product_id.in_(product_ids)):
+            expected = args.stock - totals[product.product_id]
+            status = 'ok' if product.stock_quantity == expected and product.stock_quantity >= 0 else 'FAIL'
+            failed = failed or status == 'FAIL'
+            print(f"product {product.product_id}: initial {args.stock} sold {totals[product.product_id]} "
+                  f"final {product.stock_quantity} expected {expected} [{status}]")
+        db.session.remove()
+    print(f"rejected sales (insufficient stock): {rejected}")
+    os.remove(db_path)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
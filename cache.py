@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Small thread-safe key/value cache whose entries expire after ttl seconds."""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key, compute, ttl=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        # Compute outside the lock so a slow query does not block other keys
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL, a version counter and hit/miss statistics.
+
+    The version is bumped on every invalidation so callers can tell whether a snapshot is current.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or MISSING; counts the lookup."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, version=None):
+        """Store value; pass the version read before loading it to drop results that raced an invalidation."""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is MISSING:
+            version = self.version
+            value = compute()
+            self.set(key, value, ttl=ttl, version=version)
+        return value
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or everything when keys is None."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+            self.version += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+# Aggregates shown on the admin dashboard (summary cards, top products, low stock)
+dashboard_cache = TTLCache()
+
+# Product/category catalog, see catalog.py
+catalog_cache = LRUCache()
+
+# Sales analytics results keyed by (metric, start, end, ...), see analytics.py
+analytics_cache = LRUCache(max_entries=256, ttl=3600)
+
+# Rendered receipts keyed by (store, transaction_id, format, width), see receipts.py
+receipt_cache = LRUCache(max_entries=5000, ttl=60)
@@ -0,0 +1,156 @@
+import hashlib
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Product, Category
+from cache import catalog_cache, MISSING
+from stock import STOCK_TOUCHED
+from serialization import records, columnar
+from sharding import current_store
+from money import amount_column
+
+# Read-mostly product/category catalog served from catalog_cache.
+#
+# Keys, each prefixed with the current store (None: head office, see sharding.py):
+#   ('product', product_id)        -> product dict (includes stock_quantity)
+#   ('name', lowercased name)      -> [product_id, ...]
+#   ('category', category_id)      -> [product_id, ...]
+#   ('products', fmt) / ('categories',) -> (json body, etag) snapshots for the list endpoints
+#
+# Invalidation is write-through: a session that changed a Product/Category row, or
+# moved stock through stock.py, drops the affected keys right after it commits.
+
+CATALOG_DIRTY = 'catalog_dirty'
+LIST_FORMATS = ('records', 'columnar')
+
+
+# price comes back in currency units, converted by SQLite (stored in cents, see money.py)
+PRODUCT_COLUMNS = (
+    Product.product_id, Product.product_name, Product.category_id, amount_column(Product.price),
+    Product.stock_quantity, Product.unit, Product.sku, Product.barcode
+)
+
+
+def product_rows():
+    """Query for PRODUCT_COLUMNS tuples; cheaper than loading Product entities for read-only lists."""
+    return db.session.query(*PRODUCT_COLUMNS)
+
+
+def serialize_product(p):
+    return {
+        'product_id': p.product_id,
+        'product_name': p.product_name,
+        'category_id': p.category_id,
+        'price': p.price,
+        'stock_quantity': p.stock_quantity,
+        'unit': p.unit,
+        'sku': p.sku,
+        'barcode': p.barcode
+    }
+
+
+def _ttl():
+    return current_app.config.get('CATALOG_CACHE_TTL')
+
+
+def _key(*parts):
+    return (current_store(),) + parts
+
+
+def _snapshot(rows):
+    body = current_app.json.dumps(rows)
+    return body, hashlib.sha1(body.encode()).hexdigest()
+
+
+def get_products(product_ids):
+    """{product_id: product dict} for the ids that exist; cache misses are loaded with one IN query."""
+    found, missing = {}, []
+    for product_id in set(product_ids):
+        cached = catalog_cache.get(_key('product', product_id))
+        if cached is MISSING:
+            missing.append(product_id)
+        else:
+            found[product_id] = cached
+    if missing:
+        version = catalog_cache.version
+        for p in product_rows().filter(Product.product_id.in_(missing)):
+            found[p.product_id] = serialize_product(p)
+            catalog_cache.set(_key('product', p.product_id), found[p.product_id], ttl=_ttl(), version=version)
+    return found
+
+
+def get_product(product_id):
+    return get_products([product_id]).get(product_id)
+
+
+def _products_by(key, load_ids):
+    product_ids = catalog_cache.get_or_set(key, load_ids, ttl=_ttl())
+    products = get_products(product_ids)
+    return [products[pid] for pid in product_ids if pid in products]
+
+
+def find_by_name(name):
+    name = name.strip().lower()
+    return _products_by(_key('name', name), lambda: [
+        pid for (pid,) in db.session.query(Product.product_id)
+        .filter(db.func.lower(Product.product_name) == name).order_by(Product.product_id)
+    ])
+
+
+def products_in_category(category_id):
+    return _products_by(_key('category', category_id), lambda: [
+        pid for (pid,) in db.session.query(Product.product_id)
+        .filter(Product.category_id == category_id).order_by(Product.product_id)
+    ])
+
+
+def product_list_snapshot(fmt='records'):
+    """(json body, etag) for GET /products, as a list of objects or in columnar form."""
+    def load():
+        rows = product_rows().order_by(Product.product_id).all()
+        return _snapshot(columnar(PRODUCT_COLUMNS, rows) if fmt == 'columnar' else records(PRODUCT_COLUMNS, rows))
+    return catalog_cache.get_or_set(_key('products', fmt), load, ttl=_ttl())
+
+
+def category_list_snapshot():
+    """(json body, etag) for GET /categories."""
+    columns = (Category.category_id, Category.category_name)
+    return catalog_cache.get_or_set(_key('categories'), lambda: _snapshot(
+        records(columns, db.session.query(*columns).order_by(Category.category_id))
+    ), ttl=_ttl())
+
+
+def invalidate_catalog():
+    catalog_cache.invalidate()
+
+
+def invalidate_stock(product_ids):
+    """Stock moved: only the per-product entries and the product list snapshot are stale."""
+    catalog_cache.invalidate([_key('product', pid) for pid in product_ids] +
+                             [_key('products', fmt) for fmt in LIST_FORMATS])
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_catalog_writes(session, flush_context, instances):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Product, Category)):
+            session.info[CATALOG_DIRTY] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop(CATALOG_DIRTY, False):
+        invalidate_catalog()
+        session.info.pop(STOCK_TOUCHED, None)
+    touched = session.info.pop(STOCK_TOUCHED, None)
+    if touched:
+        invalidate_stock(touched)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_pending_writes(session):
+    session.info.pop(CATALOG_DIRTY, None)
+    session.info.pop(STOCK_TOUCHED, None)
@@ -0,0 +1,265 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Transaction, TransactionDetail, Payment, InventoryLog
+from stock import decrement_stock, run_with_retry, OutOfStockError
+from rollups import record_sale, record_sales
+from catalog import get_products
+from journal import inventory_journal
+from stores import origin
+from events import sale_recorded
+from money import MoneyError, to_cents, format_amount, allocate, vat_portion
+
+SYNC_MAX_SALES = 500
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+
+class CheckoutError(Exception):
+    """Raised when a sale cannot be recorded; the message is safe to return to the client."""
+
+
+def validate_items(items):
+    if not isinstance(items, list) or len(items) == 0:
+        raise CheckoutError('Items must be a non-empty list')
+    for item in items:
+        if not isinstance(item, dict) or 'product_id' not in item or 'quantity' not in item or 'price' not in item:
+            raise CheckoutError('Each item must have product_id, quantity, and price')
+
+
+def price_sale(items, total_amount, products, discount=None):
+    """(lines, totals) in cents, recomputed from the items; raises CheckoutError unless total_amount matches.
+
+    products is {product_id: product dict} from the catalog (get_products): every item must be one
+    of them and carry its current price, so a terminal working from a stale or altered price list
+    is refused rather than charging its own price. Each item may carry its own 'discount' (an amount off the line) and the sale a 'discount' off
+    its subtotal, which is spread over the lines in proportion so that the line subtotals always
+    add up to the sale. VAT is VAT_RATE of the discounted total: included in it, or added on top
+    when PRICES_INCLUDE_VAT is off.
+    """
+    lines = []
+    try:
+        for item in items:
+            quantity = item['quantity']
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+                raise CheckoutError('quantity must be a positive integer')
+            product = products.get(item['product_id'])
+            if product is None:
+                raise CheckoutError(f"Product ID {item['product_id']} not found")
+            price = to_cents(item['price'], 'price')
+            if price != to_cents(product['price']):
+                raise CheckoutError(f"Price of product {item['product_id']} is {format_amount(to_cents(product['price']))}, "
+                                    f"not {format_amount(price)}")
+            line_discount = to_cents(item.get('discount') or 0, 'discount')
+            if price < 0 or not 0 <= line_discount <= quantity * price:
+                raise CheckoutError(f"Invalid price or discount for product {item['product_id']}")
+            lines.append({'product_id': item['product_id'], 'quantity': quantity, 'price': price,
+                          'discount': line_discount, 'subtotal': quantity * price - line_discount})
+        sale_discount = to_cents(discount or 0, 'discount')
+        paid = to_cents(total_amount, 'total_amount')
+    except MoneyError as e:
+        raise CheckoutError(str(e))
+    subtotal = sum(line['subtotal'] for line in lines)
+    if not 0 <= sale_discount <= subtotal:
+        raise CheckoutError('discount must be between 0 and the sale subtotal')
+    for line, share in zip(lines, allocate(sale_discount, [line['subtotal'] for line in lines])):
+        line['discount'] += share
+        line['subtotal'] -= share
+    included = current_app.config.get('PRICES_INCLUDE_VAT', True)
+    vat = vat_portion(subtotal - sale_discount, Decimal(current_app.config.get('VAT_RATE', '0')), included)
+    total = subtotal - sale_discount + (0 if included else vat)
+    if paid != total:
+        raise CheckoutError(f'total_amount {format_amount(paid)} does not match the items: expected {format_amount(total)}')
+    return lines, {'total_amount': total, 'discount_amount': sum(line['discount'] for line in lines), 'vat_amount': vat}
+
+
+def validate_idempotency_key(key):
+    if key is None:
+        return None
+    if not isinstance(key, str) or not key.strip() or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise CheckoutError(f'idempotency_key must be a non-empty string of at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+    return key
+
+
+def parse_sold_at(value):
+    """Terminal-side sale time (ISO 8601) as naive UTC, like Transaction.date_time defaults."""
+    if value is None:
+        return None
+    try:
+        sold_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise CheckoutError('date_time must be an ISO 8601 timestamp')
+    if sold_at.tzinfo is not None:
+        sold_at = sold_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return sold_at
+
+
+def _quantities(items):
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def _record(user_id, payment_method, totals, items, quantities, products, idempotency_key=None, sold_at=None):
+    """Write one priced sale (see price_sale) into the current transaction without committing it;
+    the caller updates the rollups."""
+    try:
+        # Conditional decrements first: the stock check and the write are one statement,
+        # so a concurrent sale of the same SKU cannot slip in between them.
+        decrement_stock(quantities)
+    except OutOfStockError as e:
+        raise CheckoutError(f"Not enough stock for product {products[e.product_id]['product_name']}")
+
+    store_id, terminal_id = origin()
+    transaction = Transaction(
+        user_id=user_id,
+        payment_method=payment_method,
+        idempotency_key=idempotency_key,
+        date_time=sold_at or datetime.utcnow(),
+        store_id=store_id,
+        terminal_id=terminal_id,
+        **totals
+    )
+    db.session.add(transaction)
+    db.session.flush()  # assigns transaction_id without committing
+
+    db.session.execute(insert(TransactionDetail), [
+        dict(item, transaction_id=transaction.transaction_id) for item in items
+    ])
+    db.session.add(Payment(
+        transaction_id=transaction.transaction_id,
+        method=payment_method,
+        amount=totals['total_amount']
+    ))
+    if inventory_journal.enabled():
+        # Write-behind: journaled now, inserted by the flusher once the sale commits
+        inventory_journal.record(transaction.transaction_id, transaction.date_time, items, store_id, terminal_id)
+        return transaction
+    db.session.execute(insert(InventoryLog), [
+        {
+            'product_id': item['product_id'],
+            'change_type': 'Sale',
+            'quantity_change': -item['quantity'],
+            'remarks': f'Sold {item["quantity"]} during transaction {transaction.transaction_id}',
+            'store_id': store_id,
+            'terminal_id': terminal_id
+        }
+        for item in items
+    ])
+    return transaction
+
+
+def find_by_idempotency_key(key):
+    return Transaction.query.filter_by(idempotency_key=key).first()
+
+
+def process_checkout(user_id, payment_method, total_amount, items, idempotency_key=None, discount=None):
+    """Record one sale (header, line items, stock, inventory logs and payment) in a single commit.
+
+    With an idempotency key a retried request returns the transaction recorded the first time.
+    """
+    validate_items(items)
+    idempotency_key = validate_idempotency_key(idempotency_key)
+
+    def work():
+        if idempotency_key:
+            existing = find_by_idempotency_key(idempotency_key)
+            if existing:
+                return existing
+        # Catalog cache first, one IN (...) lookup for the misses; it supplies the prices,
+        # and the conditional decrement is what actually guards stock.
+        products = get_products(item['product_id'] for item in items)
+        lines, totals = price_sale(items, total_amount, products, discount)
+        quantities = _quantities(lines)
+        try:
+            transaction = _record(user_id, payment_method, totals, lines, quantities, products, idempotency_key)
+            record_sale(transaction.date_time, totals['total_amount'], lines)
+            sale_recorded(transaction)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # The same key was committed by a concurrent retry between our check and our insert,
+            # or the sale references a user (or product) this database does not have
+            existing = idempotency_key and find_by_idempotency_key(idempotency_key)
+            if not existing:
+                raise CheckoutError('Unknown user or product')
+            return existing
+        except Exception:
+            db.session.rollback()
+            raise
+        return transaction
+
+    return run_with_retry(work)
+
+
+def _validate_sale(sale):
+    if not isinstance(sale, dict):
+        raise CheckoutError('Each sale must be an object')
+    for field in ('idempotency_key', 'user_id', 'payment_method', 'total_amount', 'items'):
+        if field not in sale:
+            raise CheckoutError(f'Missing {field}')
+    validate_items(sale['items'])
+    key = validate_idempotency_key(sale['idempotency_key'])
+    if key is None:
+        raise CheckoutError('idempotency_key is required')
+    return key, parse_sold_at(sale.get('date_time'))
+
+
+def sync_sales(sales):
+    """Record a batch of queued terminal sales in one commit; return one result per sale, in order.
+
+    Sales whose idempotency key is already recorded are skipped as duplicates. Each new sale runs in
+    its own savepoint, so a rejected sale (unknown product, outdated price, not enough stock) leaves the rest intact
+    and its key unused, letting the terminal resend it once the problem is fixed.
+    """
+    keys = [sale['idempotency_key'] for sale in sales
+            if isinstance(sale, dict) and isinstance(sale.get('idempotency_key'), str)]
+    product_ids = {item['product_id'] for sale in sales if isinstance(sale, dict) and isinstance(sale.get('items'), list)
+                   for item in sale['items'] if isinstance(item, dict) and 'product_id' in item}
+
+    def work():
+        recorded = dict(db.session.query(Transaction.idempotency_key, Transaction.transaction_id)
+                        .filter(Transaction.idempotency_key.in_(keys)))
+        products = get_products(product_ids)
+        results, created = [], []
+        for sale in sales:
+            key = sale.get('idempotency_key') if isinstance(sale, dict) else None
+            try:
+                key, sold_at = _validate_sale(sale)
+                if key in recorded:
+                    results.append({'idempotency_key': key, 'status': 'duplicate', 'transaction_id': recorded[key]})
+                    continue
+                items, totals = price_sale(sale['items'], sale['total_amount'], products, sale.get('discount'))
+                quantities = _quantities(items)
+                with db.session.begin_nested():
+                    transaction = _record(sale['user_id'], sale['payment_method'], totals,
+                                          items, quantities, products, key, sold_at)
+            except CheckoutError as e:
+                results.append({'idempotency_key': key, 'status': 'rejected', 'error': str(e)})
+                continue
+            except IntegrityError:
+                # Either the key was committed by another request since the lookup above,
+                # or the sale references a user that does not exist
+                existing = find_by_idempotency_key(key)
+                if not existing:
+                    results.append({'idempotency_key': key, 'status': 'rejected', 'error': 'Unknown user_id'})
+                    continue
+                recorded[key] = existing.transaction_id
+                results.append({'idempotency_key': key, 'status': 'duplicate', 'transaction_id': existing.transaction_id})
+                continue
+            recorded[key] = transaction.transaction_id
+            created.append((transaction.date_time, totals['total_amount'], items))
+            sale_recorded(transaction)
+            results.append({'idempotency_key': key, 'status': 'created', 'transaction_id': transaction.transaction_id})
+        try:
+            record_sales(created)  # one rollup upsert per table for the whole batch
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return results
+
+    return run_with_retry(work)
@@ -4,5 +4,140 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = 'your-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'pos.db')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'pos.db'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DASHBOARD_CACHE_TTL = 30  # seconds the admin summary cards are served from cache
+    ADMIN_PAGE_SIZE = 50
+    CATALOG_CACHE_TTL = 60  # seconds; bounds staleness across worker processes
+    CATALOG_CACHE_MAX_ENTRIES = 10000
+
+    JSON_FAST_ENCODER = True  # encode responses with orjson when it is installed (see serialization.py)
+
+    # Logins and API tokens (see auth.py)
+    AUTH_HASH_PROFILE = 'standard'    # 'standard' (Werkzeug's default cost) or 'strong'; cheaper hashes are upgraded at the next login
+    AUTH_THROTTLE_ENABLED = True
+    AUTH_IP_RATE = 1.0                # login attempts per second per client address...
+    AUTH_IP_BURST = 60                # ...after a burst big enough for a shift change behind one router
+    AUTH_USER_RATE = 1 / 60           # failed attempts per second per username...
+    AUTH_USER_BURST = 5               # ...after this many in a row
+    AUTH_MAX_CONCURRENT_HASHES = 2    # password checks running at once; the rest wait up to AUTH_HASH_WAIT
+    AUTH_HASH_WAIT = 10.0             # seconds; then 503, rather than queueing logins without bound
+    AUTH_TOKEN_TTL = 900              # seconds a terminal API token stays valid (and other workers accept a revoked one)
+
+    # Stores (see sharding.py and stores.py): each store in STORES gets its own database in
+    # STORE_DATABASE_DIR, so stores write in parallel; STORE_DATABASES maps ids to URIs explicitly
+    STORES = [s for s in os.environ.get('POS_STORES', '').split(',') if s]
+    STORE_DATABASES = {}
+    STORE_DATABASE_DIR = os.environ.get('STORE_DATABASE_DIR', os.path.join(basedir, 'stores'))
+
+    # Period-end archival (see archive.py): `flask archive run` from cron, or POST /admin/archive/run
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(basedir, 'archive'))
+    ARCHIVE_AFTER_MONTHS = 12         # whole months kept in the hot tables besides the current one
+    ARCHIVE_VACUUM_STEP_PAGES = 1000  # pages per incremental vacuum step; the write lock is released between steps
+    ARCHIVE_VACUUM_FREE_RATIO = 0.2   # free share of a database without auto_vacuum that triggers its one full VACUUM
+
+    # Live stock and sales updates over Server-Sent Events (see events.py)
+    EVENTS_ENABLED = True
+    EVENTS_BUFFER_SIZE = 2000         # events kept for clients that fall behind or reconnect with Last-Event-ID
+    EVENTS_MAX_CLIENTS = 200          # open streams per process; each holds a server thread
+    EVENTS_STREAM_SECONDS = 300       # a stream then ends and the client reconnects where it left off
+    EVENTS_HEARTBEAT_SECONDS = 15     # comment line sent when idle, so proxies keep the connection open
+    EVENTS_RETRY_MS = 3000            # reconnect delay suggested to clients
+    EVENTS_BATCH_SIZE = 200           # events per write to one client
+    EVENTS_MAX_PRODUCTS = 500         # a commit touching more products sends one 'catalog' event instead
+
+    # Money (see money.py and checkout.py): amounts are stored in cents and checkout recomputes every
+    # total; a client total_amount that differs from it by even a cent is rejected
+    VAT_RATE = os.environ.get('VAT_RATE', '0.12')  # decimal string, parsed exactly
+    PRICES_INCLUDE_VAT = True         # shelf prices already include VAT; otherwise it is added to the total
+
+    # Background jobs (see jobs.py); kept small so reports never starve the checkout workers
+    JOB_WORKERS = 1               # threads per process; 0 runs jobs inline in the submitting request
+    JOB_POLL_INTERVAL = 2.0       # seconds an idle worker waits before looking for jobs from other processes
+    JOB_RESULTS_DIR = os.environ.get('JOB_RESULTS_DIR', os.path.join(basedir, 'job-results'))
+    JOB_STALE_AFTER = 3600        # seconds before a 'running' job whose process died is claimed again
+    JOB_RETENTION_DAYS = 7
+
+    # Write-behind 'Sale' inventory logs (see journal.py): checkout journals them to a local file
+    # and a background thread inserts them in batches
+    INVENTORY_WRITE_BEHIND = False
+    INVENTORY_JOURNAL_DIR = os.environ.get('INVENTORY_JOURNAL_DIR', os.path.join(basedir, 'journal'))
+    INVENTORY_FLUSH_INTERVAL = 1.0        # seconds between flushes
+    INVENTORY_FLUSH_BATCH = 1000          # sales per insert; a backlog this large flushes right away
+    INVENTORY_JOURNAL_FSYNC = False       # fsync every entry: survives power loss, not just a crashed process
+    INVENTORY_JOURNAL_SCAN_INTERVAL = 60  # seconds between looks for journals left by dead processes
+
+    # Sales analytics (see analytics.py)
+    ANALYTICS_MAX_DAYS = 366
+    ANALYTICS_CACHE_TTL = 60              # seconds, for ranges that include today
+    ANALYTICS_HISTORY_CACHE_TTL = 3600    # seconds, for ranges entirely in the past
+    ANALYTICS_ABC_A = 0.8                 # cumulative revenue share covered by class A
+    ANALYTICS_ABC_B = 0.95                # ... by classes A and B
+
+    # Receipts (see receipts.py)
+    RECEIPT_WIDTH = 42                    # characters per line: 42 on 80 mm paper, 32 on 58 mm
+    RECEIPT_CURRENCY = ''
+    RECEIPT_HEADER = ('POS Store',)       # centred lines above every receipt
+    RECEIPT_FOOTER = ('Thank you!',)
+    RECEIPT_CACHE_TTL = 60                # seconds; bounds how long other workers print an old name
+
+    # Reorder forecasting (see forecast.py)
+    FORECAST_HALF_LIFE_DAYS = 14      # a day's sales count half as much in the velocity after this many days
+    FORECAST_HISTORY_DAYS = 180       # window a rebuild replays
+    FORECAST_LEAD_TIME_DAYS = 7       # supplier lead time
+    FORECAST_SAFETY_DAYS = 3          # extra cover kept on top of the lead time
+    FORECAST_REVIEW_DAYS = 7          # suggested orders cover until the next order round
+
+    # Request instrumentation exposed on /metrics (see metrics.py)
+    METRICS_ENABLED = True
+    METRICS_N_PLUS_ONE_THRESHOLD = 20   # more SQL statements than this in one request is logged as a likely N+1
+    METRICS_SLOW_REQUEST_MS = 500       # None disables the slow-request counter and log
+    METRICS_SLOW_REQUEST_LOG = True
+
+    # Applied to every new SQLite connection (see sqlite_tuning.py)
+    SQLITE_PRAGMAS = {
+        'auto_vacuum': 'INCREMENTAL',  # before any table exists; older files are converted by archive.py
+        'journal_mode': 'WAL',        # readers no longer block the checkout writer
+        'synchronous': 'NORMAL',      # fsync at checkpoints only; safe with WAL
+        'busy_timeout': 5000,         # ms to wait for a lock before "database is locked"
+        'foreign_keys': 'ON',
+        'cache_size': -32000,         # negative = KiB, so ~32 MB page cache per connection
+        'mmap_size': 268435456,       # 256 MB memory-mapped reads
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+        'pool_recycle': 3600,
+    }
+
+class DevelopmentConfig(Config):
+    pass
+
+class ProductionConfig(Config):
+    DASHBOARD_CACHE_TTL = 60
+    METRICS_SLOW_REQUEST_MS = 1000
+    SQLALCHEMY_ENGINE_OPTIONS = dict(Config.SQLALCHEMY_ENGINE_OPTIONS, pool_size=20, max_overflow=20)
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    DASHBOARD_CACHE_TTL = 0
+    ANALYTICS_CACHE_TTL = ANALYTICS_HISTORY_CACHE_TTL = 0
+    # In-memory databases have no journal file to put in WAL mode and use a single connection
+    SQLITE_PRAGMAS = {'foreign_keys': 'ON', 'busy_timeout': 5000}
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    JOB_WORKERS = 0
+    METRICS_SLOW_REQUEST_LOG = False
+    AUTH_HASH_PROFILE = 'fast'
+
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+def get_config(name=None):
+    """Config class for POS_ENV (development, production or testing); defaults to development."""
+    return config_by_name[name or os.environ.get('POS_ENV', 'development')]
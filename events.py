@@ -0,0 +1,271 @@
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import db, Product, DailySales
+from stock import STOCK_TOUCHED
+from catalog import PRODUCT_COLUMNS, serialize_product
+from forecast import stock_levels
+from sharding import current_store
+from money import to_amount
+
+# Change events pushed to dashboards and terminals over Server-Sent Events (GET /events).
+#
+# Once a commit that moved stock, edited products or recorded sales succeeds, it
+# publishes one event per product and sale to event_bus:
+#   stock    {product_id, product_name, stock_quantity, days_of_cover, low_stock}
+#   product  the product fields plus days_of_cover/low_stock, or {product_id, deleted}
+#   sale     {transaction_id, total_amount, date_time, day, daily_sales, daily_transactions} (amounts in units)
+#   catalog  {products}: more than EVENTS_MAX_PRODUCTS changed at once (an import); reload
+# Values are read inside the committing transaction, so they are what was committed.
+# With no stream open in this process nothing is read: the commit only leaves a
+# 'reset' marker in the buffer, so a client resuming from before it reloads.
+#
+# The bus is one ring buffer of the last EVENTS_BUFFER_SIZE events. Publishing
+# appends and wakes the streams; it never waits for a client. Each stream is a
+# cursor into the buffer, so a slow client only falls behind: superseded stock and
+# product events are dropped from its batches, and once its cursor has been
+# overwritten it gets a 'reset' event (reload) and carries on from the newest event.
+# Event ids are '<bus id>-<sequence>': a client reconnecting with Last-Event-ID gets
+# exactly what it missed while that is still buffered, and a 'reset' otherwise
+# (e.g. after a restart).
+#
+# The bus is per process: with several worker processes a stream only sees the
+# changes made through its own process.
+
+EVENTS_PRODUCTS = 'events_products'  # session.info: product ids written through the ORM
+EVENTS_SALES = 'events_sales'        # session.info: sales recorded in this transaction
+EVENTS_PENDING = 'events_pending'    # session.info: (store, events) to publish after the commit
+EVENTS_SKIPPED = 'events_skipped'    # session.info: changes committed while no stream was open
+
+COALESCED = ('stock', 'product')  # only the latest event per product matters
+
+
+class EventBus:
+
+    def __init__(self, size=1000):
+        self.enabled = False
+        self.bus_id = uuid.uuid4().hex[:8]
+        self.clients = 0
+        self._events = deque(maxlen=size)  # (seq, store, name, product_id to coalesce on, data as JSON)
+        self._seq = 0
+        self._reset_seq = 0  # sequence of the newest 'reset' marker (see skipped)
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        app.extensions['event_bus'] = self
+        self.enabled = app.config.get('EVENTS_ENABLED', True)
+        with self._cond:
+            self._events = deque(self._events, maxlen=app.config.get('EVENTS_BUFFER_SIZE', 1000))
+
+    def publish(self, store, events):
+        """Append [(name, data)] for store's streams; data is encoded once for every client."""
+        encoded = [(name, data.get('product_id') if name in COALESCED else None, current_app.json.dumps(data))
+                   for name, data in events]
+        with self._cond:
+            for name, key, data in encoded:
+                self._seq += 1
+                self._events.append((self._seq, store, name, key, data))
+            self._cond.notify_all()
+
+    def skipped(self):
+        """Record that changes were committed without their events, for every store's streams."""
+        with self._cond:
+            self._seq += 1
+            self._reset_seq = self._seq
+            self._events.append((self._seq, None, 'reset', None, '{}'))
+            self._cond.notify_all()
+
+    def event_id(self, seq):
+        return f'{self.bus_id}-{seq}'
+
+    def position(self, last_event_id=None):
+        """Sequence to stream after: last_event_id's if it belongs to this bus, else None."""
+        bus_id, _, seq = (last_event_id or '').partition('-')
+        if bus_id != self.bus_id or not seq.isdigit():
+            return None
+        with self._cond:
+            return min(int(seq), self._seq)
+
+    def resumable(self, last_event_id):
+        """Whether every event after last_event_id is still buffered, with no changes skipped since."""
+        position = self.position(last_event_id)
+        with self._cond:
+            return (position is not None and position >= self._reset_seq
+                    and (not self._events or position + 1 >= self._events[0][0]))
+
+    def connected(self, delta):
+        with self._cond:
+            self.clients += delta
+
+    def latest(self):
+        with self._cond:
+            return self._seq
+
+    def read(self, after, timeout, limit):
+        """(up to limit events after sequence after, lost) once there are any or timeout passes;
+        lost means some of the events after it were already overwritten."""
+        with self._cond:
+            if self._seq <= after:
+                self._cond.wait(timeout)
+            if self._seq <= after:
+                return [], False
+            oldest = self._events[0][0]
+            start = max(after + 1 - oldest, 0)
+            return list(islice(self._events, start, start + limit)), after + 1 < oldest
+
+
+event_bus = EventBus()
+
+
+def _coalesce(events):
+    # Only the latest stock/product event per product is sent; sales are deltas and all kept
+    latest = {key: seq for seq, store, name, key, data in events if key is not None}
+    return [e for e in events if e[3] is None or latest[e[3]] == e[0]]
+
+
+def format_event(event_id, name, data):
+    return f'id: {event_id}\nevent: {name}\ndata: {data}\n\n'
+
+
+def sse_stream(app, store, last_event_id=None):
+    """SSE text chunks of store's events after last_event_id, for EVENTS_STREAM_SECONDS.
+
+    Needs no app context, so the request's session is released while the stream runs;
+    clients reconnect when it ends (EventSource does, sending Last-Event-ID).
+    """
+    config = app.config
+    heartbeat = config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+    limit = config.get('EVENTS_BATCH_SIZE', 200)
+    deadline = time.monotonic() + config.get('EVENTS_STREAM_SECONDS', 300)
+    position = event_bus.position(last_event_id)
+    reset = position is None and last_event_id
+    if position is None:
+        position = event_bus.latest()
+    event_bus.connected(1)
+    try:
+        yield f"retry: {config.get('EVENTS_RETRY_MS', 3000)}\n\n"
+        if reset:
+            yield format_event(event_bus.event_id(position), 'reset', '{}')
+        while time.monotonic() < deadline:
+            events, lost = event_bus.read(position, heartbeat, limit)
+            if lost:
+                position = event_bus.latest()
+                yield format_event(event_bus.event_id(position), 'reset', '{}')
+                continue
+            if not events:
+                yield ': keep-alive\n\n'  # also how a closed connection is noticed
+                continue
+            position = events[-1][0]
+            chunk = ''.join(format_event(event_bus.event_id(seq), name, data)
+                            for seq, event_store, name, key, data in _coalesce(events) if event_store in (store, None))
+            # Other stores' events still move the cursor: a bare id line lets the client resume past them
+            yield chunk or f'id: {event_bus.event_id(position)}\n\n'
+    finally:
+        event_bus.connected(-1)
+
+
+def sale_recorded(transaction):
+    """Queue a 'sale' event for a sale written in the current transaction; sent once it commits."""
+    db.session.info.setdefault(EVENTS_SALES, []).append(
+        (transaction.transaction_id, transaction.total_amount, transaction.date_time))
+
+
+def products_written(product_ids):
+    """Queue product events for rows written with Core statements, which bypass the flush hook."""
+    db.session.info.setdefault(EVENTS_PRODUCTS, set()).update(product_ids)
+
+
+def _product_events(session, edited, product_ids):
+    levels = {row.product_id: row for row in session.execute(stock_levels(product_ids))}
+    products = {row.product_id: serialize_product(row) for row in session.execute(
+        select(*PRODUCT_COLUMNS).where(Product.product_id.in_(list(edited))))} if edited else {}
+    events = []
+    for product_id in sorted(product_ids):
+        row = levels.get(product_id)
+        if row is None:
+            events.append(('product', {'product_id': product_id, 'deleted': True}))
+            continue
+        data = {
+            'product_id': product_id,
+            'product_name': row.product_name,
+            'stock_quantity': row.stock_quantity,
+            'days_of_cover': None if row.days_of_cover is None else round(row.days_of_cover, 1),
+            'low_stock': bool(row.low_stock)
+        }
+        events.append(('product', dict(products[product_id], **data)) if product_id in products else ('stock', data))
+    return events
+
+
+def _sale_events(session, sales):
+    days = {sold_at.date() for _, _, sold_at in sales}
+    totals = {day: (total, count) for day, total, count in session.execute(
+        select(DailySales.sales_date, DailySales.total_sales, DailySales.transaction_count)
+        .where(DailySales.sales_date.in_(days)))}
+    events = []
+    for transaction_id, total_amount, sold_at in sales:
+        total, count = totals.get(sold_at.date(), (0, 0))
+        events.append(('sale', {
+            'transaction_id': transaction_id,
+            'total_amount': to_amount(total_amount),
+            'date_time': sold_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'day': str(sold_at.date()),
+            'daily_sales': to_amount(total),
+            'daily_transactions': count
+        }))
+    return events
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_products(session, flush_context):
+    if not event_bus.enabled:
+        return
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Product):
+            session.info.setdefault(EVENTS_PRODUCTS, set()).add(obj.product_id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _collect_events(session):
+    if not event_bus.enabled:
+        return
+    session.flush()  # the commit would flush first anyway; this runs _track_products on pending ORM edits
+    if not (session.info.get(STOCK_TOUCHED) or session.info.get(EVENTS_PRODUCTS) or session.info.get(EVENTS_SALES)):
+        return
+    if not event_bus.clients:
+        # Nobody to tell: keep the reads out of the write transaction
+        session.info[EVENTS_SKIPPED] = True
+        return
+    edited = session.info.pop(EVENTS_PRODUCTS, set())
+    product_ids = edited | session.info.get(STOCK_TOUCHED, set())
+    sales = session.info.pop(EVENTS_SALES, [])
+    events = []
+    if len(product_ids) > current_app.config.get('EVENTS_MAX_PRODUCTS', 500):
+        events.append(('catalog', {'products': len(product_ids)}))
+    elif product_ids:
+        events += _product_events(session, edited, product_ids)
+    if sales:
+        events += _sale_events(session, sales)
+    session.info[EVENTS_PENDING] = (current_store(), events)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    session.info.pop(EVENTS_PRODUCTS, None)  # queued while the bus was disabled
+    session.info.pop(EVENTS_SALES, None)
+    pending = session.info.pop(EVENTS_PENDING, None)
+    if pending:
+        event_bus.publish(*pending)
+    if session.info.pop(EVENTS_SKIPPED, None):
+        event_bus.skipped()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_events(session):
+    for key in (EVENTS_PRODUCTS, EVENTS_SALES, EVENTS_PENDING, EVENTS_SKIPPED):
+        session.info.pop(key, None)
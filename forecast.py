@@ -0,0 +1,180 @@
+import math
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Date, Float, column, func, literal, select, update, values
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, DailyProductSales, ProductVelocity
+
+# Sales velocity and reorder points.
+#
+# ProductVelocity.daily_units is an exponentially weighted moving average of the
+# units sold per day, fed from the DailyProductSales rollup. Whole days are folded in
+# incrementally: catching up k days multiplies every average by (1 - alpha)^k in one
+# UPDATE and adds alpha * quantity * (1 - alpha)^age for just the rollup rows of those
+# days, so the history is never rescanned. All rows share one as_of mark; a fold only
+# applies if the mark is still the one it read, so two processes cannot fold twice.
+#
+# Days of cover = stock / velocity. A product needs reordering once its stock no
+# longer covers the supplier lead time plus safety days.
+
+LOW_STOCK_THRESHOLD = 5  # units; the dashboard lists products below this whatever their velocity
+
+_velocity = ProductVelocity.__table__
+
+
+def _alpha():
+    # Weight of the newest day, from the half-life of a day's influence on the average
+    return 1 - 0.5 ** (1 / current_app.config.get('FORECAST_HALF_LIFE_DAYS', 14))
+
+
+def _horizon():
+    config = current_app.config
+    return config.get('FORECAST_LEAD_TIME_DAYS', 7) + config.get('FORECAST_SAFETY_DAYS', 3)
+
+
+def _last_complete_day():
+    return datetime.utcnow().date() - timedelta(days=1)
+
+
+def _fold(mark, target):
+    """Fold the rollup days after mark up to target into the averages; the caller commits."""
+    alpha = _alpha()
+    days = (target - mark).days
+    db.session.execute(update(_velocity).values(daily_units=_velocity.c.daily_units * (1 - alpha) ** days,
+                                                as_of=target))
+    weights = values(column('sales_date', Date), column('weight', Float), name='weights').data([
+        (target - timedelta(days=age), alpha * (1 - alpha) ** age) for age in range(days)
+    ]).cte('weights')  # SQLite has no column aliases on a VALUES subquery
+    contributions = (
+        select(DailyProductSales.product_id,
+               func.sum(DailyProductSales.quantity_sold * weights.c.weight),
+               literal(target, Date))  # as_of for products selling for the first time
+        .join(weights, weights.c.sales_date == DailyProductSales.sales_date)
+        .group_by(DailyProductSales.product_id)
+    )
+    stmt = sqlite_insert(_velocity).from_select(['product_id', 'daily_units', 'as_of'], contributions)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['product_id'],
+        set_={'daily_units': _velocity.c.daily_units + stmt.excluded.daily_units}
+    ))
+
+
+def rebuild_velocity(target=None):
+    """Recompute every average from the last FORECAST_HISTORY_DAYS of rollups."""
+    target = target or _last_complete_day()
+    history = current_app.config.get('FORECAST_HISTORY_DAYS', 180)
+    db.session.execute(db.delete(ProductVelocity))
+    _fold(target - timedelta(days=history), target)
+    db.session.commit()
+    return db.session.query(func.count()).select_from(ProductVelocity).scalar()
+
+
+def update_velocity(target=None):
+    """Fold the days completed since the last update; returns how many days were folded."""
+    target = target or _last_complete_day()
+    mark = db.session.query(func.max(ProductVelocity.as_of)).scalar()
+    if mark is None:
+        rebuild_velocity(target)
+        return current_app.config.get('FORECAST_HISTORY_DAYS', 180)
+    if mark >= target:
+        return 0
+    # Claim the fold: matches nothing if another process moved the mark since we read it
+    claimed = db.session.execute(
+        update(_velocity).where(_velocity.c.as_of == mark).values(as_of=mark)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return 0
+    _fold(mark, target)
+    db.session.commit()
+    return (target - mark).days
+
+
+def _cover():
+    return Product.stock_quantity / func.nullif(ProductVelocity.daily_units, 0)
+
+
+def reorder_query(category_id=None):
+    """Products whose stock no longer covers lead time + safety days, fewest days of cover first."""
+    query = db.session.query(
+        Product.product_id, Product.product_name, Product.category_id, Product.stock_quantity,
+        ProductVelocity.daily_units, _cover().label('days_of_cover')
+    ).join(ProductVelocity, ProductVelocity.product_id == Product.product_id).filter(
+        ProductVelocity.daily_units > 0,
+        func.coalesce(Product.stock_quantity, 0) <= ProductVelocity.daily_units * _horizon()
+    )
+    if category_id is not None:
+        query = query.filter(Product.category_id == category_id)
+    return query.order_by(_cover(), Product.product_id)
+
+
+def serialize_reorder(row):
+    config = current_app.config
+    stock = row.stock_quantity or 0
+    order_up_to = row.daily_units * (_horizon() + config.get('FORECAST_REVIEW_DAYS', 7))
+    return {
+        'product_id': row.product_id,
+        'product_name': row.product_name,
+        'category_id': row.category_id,
+        'stock_quantity': stock,
+        'daily_units': round(row.daily_units, 3),
+        'days_of_cover': round(stock / row.daily_units, 1),
+        'reorder_point': math.ceil(row.daily_units * _horizon()),
+        'suggested_order': max(0, math.ceil(order_up_to - stock))
+    }
+
+
+def _low_stock(threshold):
+    velocity = func.coalesce(ProductVelocity.daily_units, 0)
+    return (Product.stock_quantity < threshold) | (
+        (velocity > 0) & (func.coalesce(Product.stock_quantity, 0) <= velocity * _horizon()))
+
+
+def low_stock_query(threshold=LOW_STOCK_THRESHOLD):
+    """(product_id, product_name, stock_quantity, days_of_cover) for the dashboard: below the fixed
+    threshold or below the reorder point, fewest days of cover first (no sales history last)."""
+    cover = _cover()
+    return db.session.query(
+        Product.product_id, Product.product_name, Product.stock_quantity, cover
+    ).outerjoin(ProductVelocity, ProductVelocity.product_id == Product.product_id).filter(
+        _low_stock(threshold)
+    ).order_by(cover.is_(None), cover, Product.stock_quantity)
+
+
+def stock_levels(product_ids, threshold=LOW_STOCK_THRESHOLD):
+    """Select of (product_id, product_name, stock_quantity, days_of_cover, low_stock) for product_ids,
+    low_stock by the same rule as low_stock_query."""
+    return select(
+        Product.product_id, Product.product_name, Product.stock_quantity, _cover().label('days_of_cover'),
+        _low_stock(threshold).label('low_stock')
+    ).outerjoin(ProductVelocity, ProductVelocity.product_id == Product.product_id).where(
+        Product.product_id.in_(list(product_ids))
+    )
+
+
+forecast_cli = AppGroup('forecast', help='Sales velocity and reorder points.')
+
+
+@forecast_cli.command('update')
+def update_command():
+    """Fold the days completed since the last update into the velocities."""
+    click.echo(f'{update_velocity()} days folded.')
+
+
+@forecast_cli.command('rebuild')
+def rebuild_command():
+    """Recompute every velocity from the rollup history."""
+    click.echo(f'Velocities rebuilt ({rebuild_velocity()} products).')
+
+
+@forecast_cli.command('reorder')
+@click.option('--limit', type=int, default=50, show_default=True)
+def reorder_command(limit):
+    """List the products to reorder, most urgent first."""
+    update_velocity()
+    for row in map(serialize_reorder, reorder_query().limit(limit)):
+        click.echo(f"{row['product_id']:>8} {row['product_name'][:40]:<40} stock {row['stock_quantity']:>6} "
+                   f"cover {row['days_of_cover']:>6.1f} d  order {row['suggested_order']:>6}")
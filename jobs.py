@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_, update
+from models import db, Job
+from stock import run_with_retry
+from rollups import range_report, product_report, rebuild_rollups
+from product_io import FORMATS, iter_export
+from ledger import reconcile, take_snapshots
+from analytics import sales_analytics
+from forecast import rebuild_velocity
+from stores import consolidate
+from archive import archive_closed_periods, reclaim_space
+from sharding import current_store, store_context
+
+# Persistent background jobs for work that must not hold a request thread:
+# reports over long ranges, exports, rollup rebuilds, ledger reconciliation.
+#
+# Jobs are rows in the job table. Workers are a few daemon threads per process
+# that claim the oldest queued row with a conditional UPDATE, so several
+# processes can share the table, and jobs queued before a restart are picked up
+# by the next worker that polls. A job left 'running' by a dead process is claimed
+# again after JOB_STALE_AFTER seconds, so every job type must be safe to re-run.
+# Results are written to JOB_RESULTS_DIR and served by GET /jobs/<id>/result.
+# Jobs live in the head office; one submitted by a store runs against that store's
+# database (its store_id is kept in the params).
+
+JOB_TYPES = {}
+
+
+def job_type(kind):
+    """Register fn(params) -> (text or iterable of text chunks, mimetype, file extension)."""
+    def register(fn):
+        JOB_TYPES[kind] = fn
+        return fn
+    return register
+
+
+class JobRunner:
+
+    def __init__(self):
+        self.app = None
+        self._threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['job_runner'] = self
+
+        # Workers start with the first request, never at import: `flask db upgrade` must not run jobs
+        @app.before_request
+        def _start_job_workers():
+            if not self._threads:
+                self.start()
+
+    def start(self):
+        with self._lock:
+            if self._threads or not self.app.config.get('JOB_WORKERS'):
+                return
+            for i in range(self.app.config['JOB_WORKERS']):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, params=None):
+        if kind not in JOB_TYPES:
+            raise ValueError(f'Unknown job type {kind}')
+        params = dict(params or {})
+        if current_store() is not None:
+            params.setdefault('store_id', current_store())
+        job = Job(kind=kind, params=json.dumps(params), status='queued')
+        db.session.add(job)
+        db.session.commit()
+        if not current_app.config.get('JOB_WORKERS'):
+            job.status, job.started_at = 'running', datetime.utcnow()
+            db.session.commit()
+            job_id = job.job_id
+            self.run(job_id)
+            return db.session.get(Job, job_id)  # run() may have switched stores, closing the session
+        else:
+            self.start()
+            self._wake.set()
+        return job
+
+    def _claim(self):
+        """Take the oldest claimable job; the conditional UPDATE makes the claim safe across processes."""
+        stale = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+        claimable = or_(Job.status == 'queued', and_(Job.status == 'running', Job.started_at < stale))
+        job_id = db.session.query(Job.job_id).filter(claimable).order_by(Job.job_id).limit(1).scalar()
+        if job_id is None:
+            return None
+        claimed = db.session.execute(
+            update(Job).where(Job.job_id == job_id, claimable)
+            .values(status='running', started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return job_id if claimed else self._claim()
+
+    def run(self, job_id):
+        """Run one claimed (or, with JOB_WORKERS = 0, just submitted) job and record its outcome."""
+        job = db.session.get(Job, job_id)
+        kind, params = job.kind, json.loads(job.params or '{}')
+        results_dir = current_app.config['JOB_RESULTS_DIR']
+        try:
+            with store_context(params.get('store_id')):
+                body, mimetype, extension = JOB_TYPES[kind](params)
+                os.makedirs(results_dir, exist_ok=True)
+                result_file = f'{job_id}.{extension}'
+                with open(os.path.join(results_dir, result_file), 'w', encoding='utf-8', newline='') as f:
+                    for chunk in ([body] if isinstance(body, str) else body):
+                        f.write(chunk)
+            values = {'status': 'done', 'result_file': result_file, 'result_mimetype': mimetype}
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Job %s (%s) failed', job_id, kind)
+            values = {'status': 'failed', 'error': str(e) or e.__class__.__name__}
+
+        def finish():
+            db.session.execute(update(Job).where(Job.job_id == job_id).values(finished_at=datetime.utcnow(), **values))
+            db.session.commit()
+        run_with_retry(finish)
+
+    def _work(self):
+        while True:
+            app = self.app
+            try:
+                with app.app_context():
+                    job_id = run_with_retry(self._claim)
+                    if job_id is not None:
+                        self.run(job_id)
+                        continue
+            except Exception:
+                app.logger.exception('Job worker error')
+            self._wake.wait(app.config['JOB_POLL_INTERVAL'])
+            self._wake.clear()
+
+    def wait(self, job_id, timeout=60):
+        """Block until a job finishes (benchmarks and CLI); returns the Job."""
+        deadline = time.monotonic() + timeout
+        while True:
+            db.session.expire_all()
+            job = db.session.get(Job, job_id)
+            if job.status in ('done', 'failed') or time.monotonic() > deadline:
+                return job
+            time.sleep(0.05)
+
+
+job_runner = JobRunner()
+
+
+def serialize_job(job):
+    return {
+        'job_id': job.job_id,
+        'kind': job.kind,
+        'params': json.loads(job.params or '{}'),
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'result_url': f'/jobs/{job.job_id}/result' if job.status == 'done' else None
+    }
+
+
+def prune_jobs(days=None):
+    """Delete finished jobs (and their result files) older than days."""
+    days = current_app.config['JOB_RETENTION_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    old = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).all()
+    for job in old:
+        if job.result_file:
+            path = os.path.join(current_app.config['JOB_RESULTS_DIR'], job.result_file)
+            if os.path.exists(path):
+                os.remove(path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(old)
+
+
+# ---------------- Job types ----------------
+
+def _json(data):
+    return current_app.json.dumps(data), 'application/json', 'json'
+
+
+def _date(params, name):
+    value = params.get(name)
+    return date.fromisoformat(value) if value else None
+
+
+@job_type('report.range')
+def _range_report(params):
+    return _json(range_report(_date(params, 'start'), _date(params, 'end')))
+
+
+@job_type('report.products')
+def _product_report(params):
+    return _json(product_report(_date(params, 'start'), _date(params, 'end'), params.get('limit', 10)))
+
+
+@job_type('report.analytics')
+def _sales_analytics(params):
+    return _json(sales_analytics(_date(params, 'start'), _date(params, 'end'), params.get('metrics'),
+                                 params.get('by', 'revenue'), params.get('limit', 10)))
+
+
+@job_type('products.export')
+def _export_products(params):
+    fmt = params.get('format', 'csv')
+    return iter_export(fmt), FORMATS[fmt], fmt
+
+
+@job_type('rollups.rebuild')
+def _rebuild_rollups(params):
+    days = run_with_retry(lambda: rebuild_rollups(_date(params, 'start'), _date(params, 'end')))
+    return _json({'days': days})
+
+
+@job_type('forecast.rebuild')
+def _rebuild_forecast(params):
+    return _json({'products': run_with_retry(rebuild_velocity)})
+
+
+@job_type('inventory.reconcile')
+def _reconcile_inventory(params):
+    drift = run_with_retry(reconcile)
+    return _json({'reconciled': len(drift), 'products': drift})
+
+
+@job_type('ledger.snapshot')
+def _snapshot_ledger(params):
+    return _json({'snapshots': run_with_retry(take_snapshots)})
+
+
+@job_type('stores.consolidate')
+def _consolidate_stores(params):
+    return _json({'stores': consolidate(_date(params, 'start'), _date(params, 'end'))})
+
+
+@job_type('archive.run')
+def _run_archive(params):
+    archived = archive_closed_periods()
+    return _json({'periods': [{'month': month, 'transactions': sales, 'inventory_logs': logs}
+                              for month, sales, logs in archived], 'vacuum': reclaim_space()})
+
+
+jobs_cli = AppGroup('jobs', help='Background job maintenance.')
+
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(['queued', 'running', 'done', 'failed']))
+@click.option('--limit', type=int, default=20, show_default=True)
+def list_command(status, limit):
+    """Show the most recent jobs."""
+    query = Job.query
+    if status:
+        query = query.filter(Job.status == status)
+    for job in query.order_by(Job.job_id.desc()).limit(limit):
+        click.echo(f'{job.job_id:>6} {job.kind:<22} {job.status:<8} {job.created_at:%Y-%m-%d %H:%M:%S} {job.error or ""}')
+
+
+@jobs_cli.command('prune')
+@click.option('--days', type=int, help='Defaults to JOB_RETENTION_DAYS.')
+def prune_command(days):
+    """Delete finished jobs and their result files."""
+    click.echo(f'{prune_jobs(days)} jobs pruned.')
@@ -0,0 +1,390 @@
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from models import db, Transaction, InventoryLog, JournalCheckpoint
+from stock import run_with_retry
+from sharding import store_context
+from stores import store_ids
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Write-behind 'Sale' inventory logs (INVENTORY_WRITE_BEHIND).
+#
+# Instead of inserting InventoryLog rows inside the sale's transaction, checkout
+# appends a P (prepared) entry to this process's journal file, and the session's
+# commit or rollback appends a C (with a sequence number) or R entry. Committed
+# entries are also queued in memory, and a flusher thread bulk-inserts them into
+# inventory_log together with the journal's checkpoint row (last sequence number
+# inserted), in one transaction, so nothing is inserted twice.
+#
+# Each process holds an OS lock on its own journal for as long as it lives. A
+# journal whose lock can be taken belongs to a dead process and is replayed:
+# committed entries past the checkpoint are inserted, and P entries with neither C
+# nor R (the process died between the database commit and the C entry) are inserted
+# only if their transaction exists with the same timestamp.
+#
+# With STORES configured, entries carry their store and are flushed into (and
+# checkpointed in) that store's database, each database with its own checkpoint row.
+#
+# Until the flusher catches up, stock is ahead of the ledger: ledger.py flushes
+# this process's journal first, but other processes' entries show as transient drift.
+
+JOURNAL_PENDING = 'journal_pending'
+JOURNAL_SUFFIX = '.journal'
+REPLAYED = 2 ** 62  # checkpoint of a journal that was replayed and is about to be deleted
+
+
+def _try_lock(f):
+    """Take the owner lock without blocking; False if a live process holds it."""
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _log_rows(transaction_id, sold_at, items, store_id=None, terminal_id=None):
+    return [
+        {
+            'product_id': product_id,
+            'change_type': 'Sale',
+            'quantity_change': -quantity,
+            'remarks': f'Sold {quantity} during transaction {transaction_id}',
+            'date_time': sold_at,
+            'store_id': store_id,
+            'terminal_id': terminal_id
+        }
+        for product_id, quantity in items
+    ]
+
+
+def _database(store_id):
+    """The store whose database holds store_id's sales: itself when stores are sharded, else the head office."""
+    return store_id if store_id in (current_app.config.get('STORE_DATABASES') or ()) else None
+
+
+def _databases():
+    return [None] + store_ids()
+
+
+def _save_checkpoint(journal_id, last_seq):
+    stmt = sqlite_insert(JournalCheckpoint.__table__).values(
+        journal_id=journal_id, last_seq=last_seq, updated_at=datetime.utcnow())
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['journal_id'], set_={'last_seq': stmt.excluded.last_seq, 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+class InventoryJournal:
+
+    def __init__(self):
+        self.app = None
+        self.journal_id = None
+        self._file = None
+        self._seq = 0
+        self._open = set()          # tokens of P entries still waiting for their commit or rollback
+        # (seq, transaction_id, sold_at, items, store_id, terminal_id) not yet in inventory_log
+        self._committed = deque()
+        self._flushed = {}          # database -> last seq inserted there
+        self._lock = threading.Lock()        # journal file and the in-memory state
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.extensions['inventory_journal'] = self
+        if not app.config.get('INVENTORY_WRITE_BEHIND'):
+            return
+        self.app = app
+
+        # Like the job workers: started by the first request, never by `flask db upgrade`
+        @app.before_request
+        def _start_inventory_journal():
+            if self._thread is None:
+                self.start()
+
+    def enabled(self):
+        return self.app is not None and current_app._get_current_object() is self.app
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            directory = self.app.config['INVENTORY_JOURNAL_DIR']
+            os.makedirs(directory, exist_ok=True)
+            self.journal_id = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._file = open(os.path.join(directory, self.journal_id + JOURNAL_SUFFIX), 'a+', encoding='utf-8')
+            _try_lock(self._file)
+            self._thread = threading.Thread(target=self._work, name='inventory-journal', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------- Writing ----------------
+
+    def _append(self, entries):
+        """Write entries to the journal; the caller holds self._lock."""
+        self._file.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+        self._file.flush()
+        if self.app.config.get('INVENTORY_JOURNAL_FSYNC'):
+            os.fsync(self._file.fileno())
+
+    def record(self, transaction_id, sold_at, items, store_id=None, terminal_id=None):
+        """Journal the 'Sale' logs of a sale being written in the current session; must be its last write."""
+        if self._thread is None:
+            self.start()
+        token = uuid.uuid4().hex
+        lines = [(item['product_id'], item['quantity']) for item in items]
+        with self._lock:
+            self._append([{'t': 'P', 'k': token, 'tx': transaction_id, 'at': sold_at.isoformat(), 'items': lines,
+                           'st': store_id, 'tm': terminal_id}])
+            self._open.add(token)
+        db.session.info.setdefault(JOURNAL_PENDING, []).append(
+            (token, transaction_id, sold_at, lines, store_id, terminal_id))
+
+    def _committed_entries(self, pending):
+        with self._lock:
+            entries = []
+            for token, *sale in pending:
+                self._seq += 1
+                entries.append({'t': 'C', 'k': token, 's': self._seq})
+                self._committed.append((self._seq, *sale))
+                self._open.discard(token)
+            self._append(entries)
+            backlog = len(self._committed)
+        if backlog >= self.app.config['INVENTORY_FLUSH_BATCH']:
+            self._wake.set()
+
+    def _rolled_back(self, pending):
+        with self._lock:
+            self._append([{'t': 'R', 'k': token} for token, *_ in pending])
+            self._open.difference_update(token for token, *_ in pending)
+
+    # ---------------- Flushing ----------------
+
+    def flush(self):
+        """Insert every committed entry now; returns how many sales were written."""
+        if self._thread is None:
+            return 0
+        written = 0
+        while True:
+            flushed = self._flush_batch()
+            if not flushed:
+                return written
+            written += flushed
+
+    def _flush_batch(self):
+        with self._flush_lock:
+            with self._lock:
+                batch = [self._committed[i] for i in range(min(len(self._committed),
+                                                               self.app.config['INVENTORY_FLUSH_BATCH']))]
+            if not batch:
+                return 0
+
+            by_database = {}
+            for entry in batch:
+                by_database.setdefault(_database(entry[4]), []).append(entry)
+            for database, entries in by_database.items():
+                # After a failure part way through, the databases already written are skipped
+                entries = [entry for entry in entries if entry[0] > self._flushed.get(database, 0)]
+                if not entries:
+                    continue
+
+                def work():
+                    db.session.execute(insert(InventoryLog), [row for _, *sale in entries for row in _log_rows(*sale)])
+                    _save_checkpoint(self.journal_id, entries[-1][0])
+                    db.session.commit()
+                with store_context(database):
+                    run_with_retry(work)
+                self._flushed[database] = entries[-1][0]
+
+            with self._lock:
+                for _ in batch:
+                    self._committed.popleft()
+                if not self._committed and not self._open:
+                    # Everything journaled is in the database: start the file over
+                    self._file.seek(0)
+                    self._file.truncate()
+            return len(batch)
+
+    def _work(self):
+        app = self.app
+        next_scan = 0
+        while True:
+            self._wake.wait(app.config['INVENTORY_FLUSH_INTERVAL'])
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    self.flush()
+                    if time.monotonic() >= next_scan:
+                        replay_dead_journals()
+                        next_scan = time.monotonic() + app.config.get('INVENTORY_JOURNAL_SCAN_INTERVAL', 60)
+            except Exception:
+                app.logger.exception('Inventory journal flush failed')
+
+    def close(self):
+        """Flush at interpreter exit; the journal file is removed once nothing in it is pending."""
+        if self._file is None:
+            return
+        with self.app.app_context():
+            self.flush()
+            with self._lock:
+                if self._open:
+                    return  # a sale still in flight: leave the journal for replay
+                self._file.close()
+                os.remove(self._file.name)
+                self._file = None
+            _delete_checkpoints(self.journal_id)
+
+    def stats(self):
+        with self._lock:
+            return {'journal_id': self.journal_id, 'open': len(self._open), 'unflushed': len(self._committed),
+                    'seq': self._seq}
+
+
+inventory_journal = InventoryJournal()
+
+
+@event.listens_for(Session, 'after_commit')
+def _journal_after_commit(session):
+    pending = session.info.pop(JOURNAL_PENDING, None)
+    if pending:
+        inventory_journal._committed_entries(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _journal_after_rollback(session):
+    pending = session.info.pop(JOURNAL_PENDING, None)
+    if pending:
+        inventory_journal._rolled_back(pending)
+
+
+# ---------------- Replay ----------------
+
+def _read_journal(f):
+    prepared, committed, rolled_back = {}, {}, set()
+    f.seek(0)
+    for line in f:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break  # torn last line: the process died mid-write, before that entry could matter
+        if entry['t'] == 'P':
+            prepared[entry['k']] = (entry['tx'], datetime.fromisoformat(entry['at']), entry['items'],
+                                    entry.get('st'), entry.get('tm'))
+        elif entry['t'] == 'C':
+            committed[entry['k']] = entry['s']
+        else:
+            rolled_back.add(entry['k'])
+    return prepared, committed, rolled_back
+
+
+def _delete_checkpoints(journal_id):
+    for database in _databases():
+        with store_context(database):
+            db.session.execute(db.delete(JournalCheckpoint).where(JournalCheckpoint.journal_id == journal_id))
+            db.session.commit()
+
+
+def _replay_into(journal_id, prepared, committed, rolled_back, database):
+    """Insert the entries of one database past its checkpoint; returns the number of sales recovered."""
+    checkpoint = db.session.get(JournalCheckpoint, journal_id)
+    last_seq = checkpoint.last_seq if checkpoint else 0
+    if last_seq >= REPLAYED:
+        return 0
+    prepared = {token: sale for token, sale in prepared.items() if _database(sale[3]) == database}
+    recovered = [prepared[token] for token, seq in sorted(committed.items(), key=lambda item: item[1])
+                 if seq > last_seq and token in prepared]
+    orphans = [sale for token, sale in prepared.items() if token not in committed and token not in rolled_back]
+    if orphans:
+        # Died between the database commit and its C entry: keep only the sales that exist
+        found = set(db.session.query(Transaction.transaction_id, Transaction.date_time).filter(
+            tuple_(Transaction.transaction_id, Transaction.date_time).in_([(tx, at) for tx, at, *_ in orphans])))
+        recovered += [sale for sale in orphans if (sale[0], sale[1]) in found]
+    rows = [row for sale in recovered for row in _log_rows(*sale)]
+    if rows:
+        db.session.execute(insert(InventoryLog), rows)
+    _save_checkpoint(journal_id, REPLAYED)
+    db.session.commit()
+    return len(recovered)
+
+
+def replay_journal(path, f):
+    """Insert what a dead process journaled but never flushed; returns the number of sales recovered."""
+    journal_id = os.path.basename(path)[:-len(JOURNAL_SUFFIX)]
+    prepared, committed, rolled_back = _read_journal(f)
+    recovered = 0
+    for database in _databases():
+        with store_context(database):
+            recovered += run_with_retry(lambda: _replay_into(journal_id, prepared, committed, rolled_back, database))
+    f.close()
+    os.remove(path)
+    _delete_checkpoints(journal_id)
+    return recovered
+
+
+def replay_dead_journals():
+    """Replay every journal in INVENTORY_JOURNAL_DIR whose owner process is gone."""
+    directory = current_app.config['INVENTORY_JOURNAL_DIR']
+    if not os.path.isdir(directory):
+        return 0
+    recovered = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(JOURNAL_SUFFIX) or name[:-len(JOURNAL_SUFFIX)] == inventory_journal.journal_id:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            f = open(path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            continue  # replayed by another process just now
+        if not _try_lock(f):
+            f.close()
+            continue
+        try:
+            recovered += replay_journal(path, f)
+        except Exception:
+            f.close()
+            raise
+    return recovered
+
+
+journal_cli = AppGroup('journal', help='Write-behind inventory log journals.')
+
+
+@journal_cli.command('replay')
+def replay_command():
+    """Insert the unflushed inventory logs of dead processes."""
+    click.echo(f'{replay_dead_journals()} sales recovered.')
+
+
+@journal_cli.command('status')
+def status_command():
+    """List journal files and whether their process is still alive."""
+    directory = current_app.config['INVENTORY_JOURNAL_DIR']
+    names = sorted(n for n in os.listdir(directory) if n.endswith(JOURNAL_SUFFIX)) if os.path.isdir(directory) else []
+    for name in names:
+        path = os.path.join(directory, name)
+        with open(path, 'r+', encoding='utf-8') as f:
+            state = 'dead' if _try_lock(f) else 'live'
+        click.echo(f'{name:<60} {os.path.getsize(path):>10} bytes  {state}')
+    click.echo(f'{len(names)} journals.')
@@ -0,0 +1,184 @@
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, func, insert, inspect, literal, select
+from sqlalchemy.orm import Session, aliased
+from models import db, Product, InventoryLog, StockSnapshot
+from journal import inventory_journal
+
+# The inventory ledger is the sum of InventoryLog.quantity_change per product;
+# Product.stock_quantity should always equal it. StockSnapshot rows checkpoint the
+# ledger at a log_id high-water mark so reading it only replays the logs written
+# since (one index range on inventory_log.product_id per product).
+#
+# Marks are safe because SQLite serialises writers: log ids are handed out in
+# commit order, so no log can later appear below a mark. Editing or deleting an
+# old log through the ORM drops the snapshots that covered it (see the flush hook).
+
+_log = InventoryLog.__table__
+_snapshot = StockSnapshot.__table__
+
+
+def _latest_snapshots(before=None):
+    """Subquery with the newest snapshot per product, optionally only those taken entirely before a time."""
+    marks = select(_snapshot.c.product_id, func.max(_snapshot.c.last_log_id).label('last_log_id'))
+    if before is not None:
+        marks = marks.where(_snapshot.c.as_of < before)
+    marks = marks.group_by(_snapshot.c.product_id).subquery()
+    return select(_snapshot).join(marks, and_(
+        _snapshot.c.product_id == marks.c.product_id, _snapshot.c.last_log_id == marks.c.last_log_id
+    )).subquery('latest')
+
+
+def _since_mark(latest, column, before=None):
+    """Correlated per-product aggregate over the logs after the product's snapshot mark."""
+    query = select(column).where(
+        _log.c.product_id == Product.product_id,
+        _log.c.log_id > func.coalesce(latest.c.last_log_id, 0)
+    )
+    if before is not None:
+        query = query.where(_log.c.date_time < before)
+    return query.scalar_subquery()
+
+
+def ledger_query(product_ids=None, before=None):
+    """Rows of (product_id, product_name, stock_quantity, ledger_quantity); the ledger as of before if given."""
+    latest = _latest_snapshots(before)
+    ledger = func.coalesce(latest.c.quantity, 0) + func.coalesce(
+        _since_mark(latest, func.sum(_log.c.quantity_change), before), 0)
+    query = db.session.query(
+        Product.product_id, Product.product_name, Product.stock_quantity, ledger.label('ledger_quantity')
+    ).outerjoin(latest, latest.c.product_id == Product.product_id)
+    if product_ids is not None:
+        query = query.filter(Product.product_id.in_(product_ids))
+    return query.order_by(Product.product_id)
+
+
+def find_drift():
+    """Products whose stock_quantity disagrees with their ledger, as dicts."""
+    inventory_journal.flush()  # write-behind sale logs of this process; other processes' show as transient drift
+    return [
+        {
+            'product_id': row.product_id,
+            'product_name': row.product_name,
+            'stock_quantity': row.stock_quantity or 0,
+            'ledger_quantity': row.ledger_quantity,
+            'drift': (row.stock_quantity or 0) - row.ledger_quantity
+        }
+        for row in ledger_query()
+        if (row.stock_quantity or 0) != row.ledger_quantity
+    ]
+
+
+def take_snapshots():
+    """Checkpoint every product that has logs past its last mark; returns the number of snapshots written."""
+    inventory_journal.flush()
+    latest = _latest_snapshots()
+    last_log = _since_mark(latest, func.max(_log.c.log_id))
+    rows = select(
+        Product.product_id,
+        last_log,
+        func.coalesce(latest.c.quantity, 0) + _since_mark(latest, func.sum(_log.c.quantity_change)),
+        func.max(func.coalesce(latest.c.as_of, datetime.min),
+                 func.coalesce(_since_mark(latest, func.max(_log.c.date_time)), datetime.min)),
+        literal(datetime.utcnow(), db.DateTime)
+    ).outerjoin(latest, latest.c.product_id == Product.product_id).where(last_log.isnot(None))
+    result = db.session.execute(insert(_snapshot).from_select(
+        ['product_id', 'last_log_id', 'quantity', 'as_of', 'taken_at'], rows
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_snapshots():
+    """Drop every snapshot and checkpoint again from a full replay of the log."""
+    db.session.execute(db.delete(StockSnapshot))
+    return take_snapshots()
+
+
+def prune_snapshots(keep=1):
+    """Keep only the newest keep snapshots per product."""
+    newer = aliased(StockSnapshot)
+    newer_count = select(func.count()).select_from(newer).where(
+        newer.product_id == StockSnapshot.product_id, newer.last_log_id > StockSnapshot.last_log_id
+    ).scalar_subquery()
+    result = db.session.execute(db.delete(StockSnapshot).where(newer_count >= keep))
+    db.session.commit()
+    return result.rowcount
+
+
+def reconcile():
+    """Write a 'Reconciliation' log for every drifting product so the ledger matches stock_quantity again.
+
+    Stock itself is never changed: the counter is what the tills sold against, the log is the audit trail.
+    """
+    drift = find_drift()
+    if drift:
+        db.session.execute(insert(InventoryLog), [
+            {
+                'product_id': row['product_id'],
+                'change_type': 'Reconciliation',
+                'quantity_change': row['drift'],
+                'remarks': f"Ledger was {row['ledger_quantity']}, stock {row['stock_quantity']}"
+            }
+            for row in drift
+        ])
+    db.session.commit()
+    return drift
+
+
+@event.listens_for(Session, 'before_flush')
+def _drop_stale_snapshots(session, flush_context, instances):
+    stale = []
+    for obj in session.dirty:
+        if isinstance(obj, InventoryLog) and session.is_modified(obj):
+            history = inspect(obj).attrs.product_id.history
+            for product_id in set(history.deleted or ()) | {obj.product_id}:
+                stale.append((product_id, obj.log_id))
+    for obj in session.deleted:
+        if isinstance(obj, InventoryLog):
+            stale.append((obj.product_id, obj.log_id))
+    if stale:
+        connection = session.connection()
+        for product_id, log_id in stale:
+            connection.execute(db.delete(StockSnapshot).where(
+                StockSnapshot.product_id == product_id, StockSnapshot.last_log_id >= log_id
+            ))
+
+
+ledger_cli = AppGroup('ledger', help='Inventory ledger snapshots and drift checks.')
+
+
+@ledger_cli.command('snapshot')
+@click.option('--keep', type=int, help='Also prune to the newest N snapshots per product.')
+def snapshot_command(keep):
+    """Checkpoint products whose log grew since their last snapshot."""
+    click.echo(f'{take_snapshots()} snapshots taken.')
+    if keep:
+        click.echo(f'{prune_snapshots(keep)} old snapshots pruned.')
+
+
+@ledger_cli.command('rebuild')
+def rebuild_command():
+    """Recompute all snapshots from the full inventory log."""
+    click.echo(f'Snapshots rebuilt ({rebuild_snapshots()} products).')
+
+
+@ledger_cli.command('drift')
+def drift_command():
+    """List products whose stock disagrees with the ledger; exits 1 if any do."""
+    drift = find_drift()
+    for row in drift:
+        click.echo(f"{row['product_id']:>8} {row['product_name'][:40]:<40} "
+                   f"stock {row['stock_quantity']:>8} ledger {row['ledger_quantity']:>8} drift {row['drift']:>+8}")
+    click.echo(f'{len(drift)} products drifting.')
+    if drift:
+        sys.exit(1)
+
+
+@ledger_cli.command('reconcile')
+def reconcile_command():
+    """Log a correction for every drifting product."""
+    click.echo(f'{len(reconcile())} products reconciled.')
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from flask import current_app, stream_with_context, Response
+from sqlalchemy import literal
+from models import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+class ListArgsError(ValueError):
+    pass
+
+
+def int_arg(args, name, default=None, minimum=None):
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ListArgsError(f"'{name}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise ListArgsError(f"'{name}' must be at least {minimum}")
+    return value
+
+
+def date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ListArgsError(f"'{name}' must be a date in YYYY-MM-DD format")
+
+
+def parse_page_args(args):
+    """Return (after, limit) from ?after=<id>&limit=<n>; limit is capped at MAX_PAGE_SIZE."""
+    after = int_arg(args, 'after', default=0, minimum=0)
+    limit = min(int_arg(args, 'limit', default=DEFAULT_PAGE_SIZE, minimum=1), MAX_PAGE_SIZE)
+    return after, limit
+
+
+def filter_int(query, column, args, name):
+    value = int_arg(args, name)
+    if value is not None:
+        query = query.filter(column == value)
+    return query
+
+
+def filter_date_range(query, column, args):
+    """Apply ?start=YYYY-MM-DD&end=YYYY-MM-DD (both inclusive) as a plain range on column."""
+    start = date_arg(args, 'start')
+    end = date_arg(args, 'end')
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column < end + timedelta(days=1))
+    return query
+
+
+def keyset_page(query, key, after, limit, descending=False):
+    """Fetch one page ordered by key, starting after the cursor; return (rows, next_cursor).
+
+    With descending=True the page walks from the newest row down and a zero cursor means "from the top".
+    """
+    if descending:
+        if after:
+            query = query.filter(key < after)
+        query = query.order_by(key.desc())
+    else:
+        query = query.filter(key > after).order_by(key)
+    # Inline the LIMIT: with a bound LIMIT SQLite cannot cost the sort and walks the whole
+    # primary key instead of using a date/user index for filtered pages.
+    rows = query.limit(literal(limit + 1, literal_execute=True)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, getattr(rows[-1], key.key)
+    return rows, None
+
+
+def iter_keyset_batches(query, key, after=0, batch_size=STREAM_BATCH_SIZE):
+    """Yield every row of query in key order, as lists of at most batch_size rows."""
+    while True:
+        rows, after = keyset_page(query, key, after, batch_size)
+        if rows:
+            yield rows
+        db.session.expunge_all()  # keep the identity map from growing with the history
+        if after is None:
+            return
+
+
+def iter_keyset(query, key, after=0, batch_size=STREAM_BATCH_SIZE):
+    """Yield every row of query in key order, one bounded batch at a time."""
+    for rows in iter_keyset_batches(query, key, after, batch_size):
+        yield from rows
+
+
+def ndjson_response(rows, serialize=None):
+    """Stream rows as NDJSON; without serialize they are already plain dicts."""
+    def generate():
+        dumps = current_app.json.dumps
+        for row in rows:
+            yield dumps(row if serialize is None else serialize(row)) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def wants_ndjson(request):
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def wants_columnar(request):
+    # {'columns': [...], 'data': [[...], ...]}: much smaller than one object per row for long pages
+    return request.args.get('format') == 'columnar'
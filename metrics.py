@@ -0,0 +1,172 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request instrumentation exposed in Prometheus text format on /metrics.
+#
+# Every request records its latency, SQL query count, SQL time and response size
+# per endpoint. SQL is counted with cursor events on every engine, attributed to the
+# current request through flask.g (queries outside a request, e.g. job workers, are
+# not counted). Values are per process: scrape every worker.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # bytes
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class CounterMetric:
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = Counter()
+
+    def inc(self, labels, amount=1):
+        self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    return ','.join(
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    )
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = CounterMetric('pos_http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram('pos_http_request_duration_seconds', 'Time to produce the response.',
+                                 ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.queries = Histogram('pos_http_request_sql_queries', 'SQL statements executed per request.',
+                                 ('endpoint',), QUERY_BUCKETS)
+        self.sql_time = Histogram('pos_http_request_sql_seconds', 'Time spent in SQL per request.',
+                                  ('endpoint',), LATENCY_BUCKETS)
+        self.size = Histogram('pos_http_response_size_bytes', 'Response body size (streamed bodies excluded).',
+                              ('endpoint',), SIZE_BUCKETS)
+        self.n_plus_one = CounterMetric('pos_http_n_plus_one_total',
+                                        'Requests that issued more SQL statements than METRICS_N_PLUS_ONE_THRESHOLD.',
+                                        ('endpoint',))
+        self.slow = CounterMetric('pos_http_slow_requests_total',
+                                  'Requests slower than METRICS_SLOW_REQUEST_MS.', ('endpoint',))
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        g.sql_statements = Counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        queries, sql_seconds = g.sql_queries, g.sql_seconds
+        config = current_app.config
+        threshold = config.get('METRICS_N_PLUS_ONE_THRESHOLD')
+        n_plus_one = threshold is not None and queries > threshold
+        slow_ms = config.get('METRICS_SLOW_REQUEST_MS')
+        slow = slow_ms is not None and elapsed * 1000 >= slow_ms
+        with self._lock:
+            self.requests.inc((endpoint, request.method, response.status_code))
+            self.latency.observe((endpoint, request.method), elapsed)
+            self.queries.observe((endpoint,), queries)
+            self.sql_time.observe((endpoint,), sql_seconds)
+            # Streamed bodies (exports, job results) have no length until they are sent
+            if not response.is_streamed:
+                self.size.observe((endpoint,), response.calculate_content_length() or 0)
+            if n_plus_one:
+                self.n_plus_one.inc((endpoint,))
+            if slow:
+                self.slow.inc((endpoint,))
+
+        if n_plus_one:
+            statement, repeats = g.sql_statements.most_common(1)[0]
+            current_app.logger.warning(
+                'Possible N+1: %s %s issued %d queries; most repeated (%dx): %s',
+                request.method, request.path, queries, repeats, ' '.join(statement.split())[:200]
+            )
+        if slow and config.get('METRICS_SLOW_REQUEST_LOG'):
+            current_app.logger.warning(
+                'Slow request: %s %s -> %s in %.1f ms (%d queries, %.1f ms SQL)',
+                request.method, request.full_path.rstrip('?'), response.status_code,
+                elapsed * 1000, queries, sql_seconds * 1000
+            )
+        return response
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.queries, self.sql_time, self.size,
+                           self.n_plus_one, self.slow):
+                lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_queries' in g:
+        conn.info['metrics_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_query_started', None)
+    if started is not None and has_request_context() and 'sql_queries' in g:
+        g.sql_seconds += time.perf_counter() - started
+        g.sql_queries += 1
+        g.sql_statements[statement] += 1
@@ -97,14 +97,27 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            # SQLITE_PRAGMAS turns foreign keys on for every connection, and batch operations
+            # rebuild tables that others reference. The PRAGMA is ignored inside a transaction,
+            # so it runs (and is committed) before the migrations begin theirs.
+            foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
             **conf_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.exec_driver_sql(f'PRAGMA foreign_keys={int(bool(foreign_keys))}')
+                connection.commit()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,29 @@
+"""Add journal checkpoint table for write-behind inventory logs
+
+Revision ID: 2c8f4a6e9b13
+Revises: 7e2b9d4c1a58
+Create Date: 2026-10-18 18:22:54.630941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8f4a6e9b13'
+down_revision = '7e2b9d4c1a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('journal_checkpoint',
+    sa.Column('journal_id', sa.String(length=100), nullable=False),
+    sa.Column('last_seq', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('journal_id')
+    )
+
+
+def downgrade():
+    op.drop_table('journal_checkpoint')
@@ -0,0 +1,50 @@
+"""Add daily sales rollup tables
+
+Revision ID: 4b7d2e9a1c3f
+Revises: e16370341ec2
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e9a1c3f'
+down_revision = 'e16370341ec2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_sales',
+    sa.Column('sales_date', sa.Date(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('sales_date')
+    )
+    op.create_table('daily_product_sales',
+    sa.Column('sales_date', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_sold', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('sales_date', 'product_id')
+    )
+    # Backfill from existing history (same queries as `flask rollups rebuild`)
+    op.execute(
+        'INSERT INTO daily_sales (sales_date, total_sales, transaction_count) '
+        'SELECT date(date_time), coalesce(sum(total_amount), 0), count(*) '
+        'FROM "transaction" WHERE date_time IS NOT NULL GROUP BY date(date_time)'
+    )
+    op.execute(
+        'INSERT INTO daily_product_sales (sales_date, product_id, quantity_sold, revenue) '
+        'SELECT date(t.date_time), d.product_id, coalesce(sum(d.quantity), 0), coalesce(sum(d.subtotal), 0) '
+        'FROM transaction_detail d JOIN "transaction" t ON t.transaction_id = d.transaction_id '
+        'WHERE d.product_id IS NOT NULL AND t.date_time IS NOT NULL '
+        'GROUP BY date(t.date_time), d.product_id'
+    )
+
+
+def downgrade():
+    op.drop_table('daily_product_sales')
+    op.drop_table('daily_sales')
@@ -0,0 +1,27 @@
+"""Add idempotency key to transactions for terminal sync
+
+Revision ID: 5f0c2a8e4b19
+Revises: d83a6b0f5e12
+Create Date: 2026-10-18 14:02:11.318470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0c2a8e4b19'
+down_revision = 'd83a6b0f5e12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('transaction', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    op.create_index('ix_transaction_idempotency_key', 'transaction', ['idempotency_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_transaction_idempotency_key', table_name='transaction')
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.drop_column('idempotency_key')
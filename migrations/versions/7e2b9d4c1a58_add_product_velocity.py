@@ -0,0 +1,29 @@
+"""Add product velocity table for reorder forecasting
+
+Revision ID: 7e2b9d4c1a58
+Revises: c5d18b3e7a42
+Create Date: 2026-10-18 17:41:27.118390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b9d4c1a58'
+down_revision = 'c5d18b3e7a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_velocity',
+    sa.Column('product_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('daily_units', sa.Float(), nullable=False),
+    sa.Column('as_of', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+
+
+def downgrade():
+    op.drop_table('product_velocity')
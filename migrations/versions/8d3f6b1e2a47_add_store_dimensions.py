@@ -0,0 +1,48 @@
+"""Add store and terminal columns and head-office store rollups
+
+Revision ID: 8d3f6b1e2a47
+Revises: 2c8f4a6e9b13
+Create Date: 2026-10-18 19:41:07.215384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6b1e2a47'
+down_revision = '2c8f4a6e9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('transaction', 'inventory_log'):
+        op.add_column(table, sa.Column('store_id', sa.String(length=20), nullable=True))
+        op.add_column(table, sa.Column('terminal_id', sa.String(length=50), nullable=True))
+    op.create_table('store_daily_sales',
+    sa.Column('store_id', sa.String(length=20), nullable=False),
+    sa.Column('sales_date', sa.Date(), nullable=False),
+    sa.Column('total_sales', sa.Float(), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('store_id', 'sales_date')
+    )
+    op.create_table('store_daily_product_sales',
+    sa.Column('store_id', sa.String(length=20), nullable=False),
+    sa.Column('sales_date', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_sold', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('store_id', 'sales_date', 'product_id')
+    )
+    op.create_index('ix_store_daily_product_sales_date', 'store_daily_product_sales', ['sales_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_store_daily_product_sales_date', table_name='store_daily_product_sales')
+    op.drop_table('store_daily_product_sales')
+    op.drop_table('store_daily_sales')
+    for table in ('inventory_log', 'transaction'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('terminal_id')
+            batch_op.drop_column('store_id')
@@ -0,0 +1,40 @@
+"""Add indexes for reports, low stock and history lookups
+
+Revision ID: 9c1e5f3a7d20
+Revises: 4b7d2e9a1c3f
+Create Date: 2026-10-18 10:03:17.552981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e5f3a7d20'
+down_revision = '4b7d2e9a1c3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_product_category_id', 'product', ['category_id'], unique=False)
+    op.create_index('ix_product_stock_quantity', 'product', ['stock_quantity'], unique=False)
+    op.create_index('ix_transaction_user_id', 'transaction', ['user_id'], unique=False)
+    op.create_index('ix_transaction_date_time', 'transaction', ['date_time'], unique=False)
+    op.create_index('ix_transaction_detail_transaction_id', 'transaction_detail', ['transaction_id'], unique=False)
+    op.create_index('ix_transaction_detail_product_transaction', 'transaction_detail', ['product_id', 'transaction_id'], unique=False)
+    op.create_index('ix_payment_transaction_id', 'payment', ['transaction_id'], unique=False)
+    op.create_index('ix_inventory_log_date_time', 'inventory_log', ['date_time'], unique=False)
+    op.create_index('ix_inventory_log_product_id', 'inventory_log', ['product_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_inventory_log_product_id', table_name='inventory_log')
+    op.drop_index('ix_inventory_log_date_time', table_name='inventory_log')
+    op.drop_index('ix_payment_transaction_id', table_name='payment')
+    op.drop_index('ix_transaction_detail_product_transaction', table_name='transaction_detail')
+    op.drop_index('ix_transaction_detail_transaction_id', table_name='transaction_detail')
+    op.drop_index('ix_transaction_date_time', table_name='transaction')
+    op.drop_index('ix_transaction_user_id', table_name='transaction')
+    op.drop_index('ix_product_stock_quantity', table_name='product')
+    op.drop_index('ix_product_category_id', table_name='product')
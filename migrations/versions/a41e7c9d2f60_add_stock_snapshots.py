@@ -0,0 +1,35 @@
+"""Add stock snapshots (inventory ledger checkpoints)
+
+Revision ID: a41e7c9d2f60
+Revises: 5f0c2a8e4b19
+Create Date: 2026-10-18 15:20:37.552981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41e7c9d2f60'
+down_revision = '5f0c2a8e4b19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_snapshot',
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('last_log_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=True),
+    sa.Column('taken_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('snapshot_id'),
+    sa.UniqueConstraint('product_id', 'last_log_id', name='uq_stock_snapshot_product_log')
+    )
+    # No backfill: without a snapshot the ledger is replayed from the first log;
+    # run `flask ledger snapshot` after upgrading.
+
+
+def downgrade():
+    op.drop_table('stock_snapshot')
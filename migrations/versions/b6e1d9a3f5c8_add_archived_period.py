@@ -0,0 +1,34 @@
+"""Add archived period table for period-end archival
+
+Revision ID: b6e1d9a3f5c8
+Revises: 8d3f6b1e2a47
+Create Date: 2026-10-18 20:36:52.804117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1d9a3f5c8'
+down_revision = '8d3f6b1e2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_period',
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('period_end', sa.Date(), nullable=False),
+    sa.Column('first_at', sa.DateTime(), nullable=True),
+    sa.Column('last_at', sa.DateTime(), nullable=True),
+    sa.Column('transactions', sa.Integer(), nullable=False),
+    sa.Column('inventory_logs', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('archived_period')
@@ -0,0 +1,38 @@
+"""Add job table for background work
+
+Revision ID: c5d18b3e7a42
+Revises: a41e7c9d2f60
+Create Date: 2026-10-18 16:05:12.402718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d18b3e7a42'
+down_revision = 'a41e7c9d2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('result_file', sa.String(length=255), nullable=True),
+    sa.Column('result_mimetype', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_index('ix_job_status_job_id', 'job', ['status', 'job_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_job_status_job_id', table_name='job')
+    op.drop_table('job')
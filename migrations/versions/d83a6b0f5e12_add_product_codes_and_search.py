@@ -0,0 +1,55 @@
+"""Add product SKU/barcode and FTS5 name search
+
+Revision ID: d83a6b0f5e12
+Revises: 9c1e5f3a7d20
+Create Date: 2026-10-18 11:26:50.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd83a6b0f5e12'
+down_revision = '9c1e5f3a7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('product', sa.Column('sku', sa.String(length=64), nullable=True))
+    op.add_column('product', sa.Column('barcode', sa.String(length=64), nullable=True))
+    op.create_index('ix_product_sku', 'product', ['sku'], unique=True)
+    op.create_index('ix_product_barcode', 'product', ['barcode'], unique=True)
+
+    # Same statements as product_search.SEARCH_INDEX_DDL; requires SQLite >= 3.34 for the trigram tokenizer
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+        "product_name, content='product', content_rowid='product_id', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+        "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+        "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name ON product BEGIN "
+        "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); "
+        "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END"
+    )
+    op.execute("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS product_search_au')
+    op.execute('DROP TRIGGER IF EXISTS product_search_ad')
+    op.execute('DROP TRIGGER IF EXISTS product_search_ai')
+    op.execute('DROP TABLE IF EXISTS product_search')
+    op.drop_index('ix_product_barcode', table_name='product')
+    op.drop_index('ix_product_sku', table_name='product')
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('barcode')
+        batch_op.drop_column('sku')
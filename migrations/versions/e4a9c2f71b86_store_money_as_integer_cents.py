@@ -0,0 +1,69 @@
+"""Store money as integer cents; add sale discount and VAT columns
+
+Revision ID: e4a9c2f71b86
+Revises: b6e1d9a3f5c8
+Create Date: 2026-10-18 22:14:37.520961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c2f71b86'
+down_revision = 'b6e1d9a3f5c8'
+branch_labels = None
+depends_on = None
+
+# Same tables and columns as money.MONEY_COLUMNS
+MONEY_COLUMNS = {
+    'product': (('price', False),),
+    'transaction': (('total_amount', True),),
+    'transaction_detail': (('price', True), ('subtotal', True)),
+    'payment': (('amount', True),),
+    'daily_sales': (('total_sales', False),),
+    'daily_product_sales': (('revenue', False),),
+    'store_daily_sales': (('total_sales', False),),
+    'store_daily_product_sales': (('revenue', False),),
+}
+
+# Same statements as product_search.SEARCH_INDEX_DDL: rebuilding 'product' drops its triggers
+SEARCH_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); "
+    "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END",
+]
+
+
+def upgrade():
+    op.add_column('transaction', sa.Column('discount_amount', sa.Integer(), nullable=True))
+    op.add_column('transaction', sa.Column('vat_amount', sa.Integer(), nullable=True))
+    op.add_column('transaction_detail', sa.Column('discount', sa.Integer(), nullable=True))
+    for table, columns in MONEY_COLUMNS.items():
+        for column, nullable in columns:
+            op.execute(f'UPDATE "{table}" SET {column} = ROUND({column} * 100)')
+        with op.batch_alter_table(table) as batch_op:
+            for column, nullable in columns:
+                batch_op.alter_column(column, existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=nullable)
+    for statement in SEARCH_TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade():
+    for table, columns in MONEY_COLUMNS.items():
+        with op.batch_alter_table(table) as batch_op:
+            for column, nullable in columns:
+                batch_op.alter_column(column, existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=nullable)
+            if table == 'transaction':
+                batch_op.drop_column('vat_amount')
+                batch_op.drop_column('discount_amount')
+            elif table == 'transaction_detail':
+                batch_op.drop_column('discount')
+        for column, nullable in columns:
+            op.execute(f'UPDATE "{table}" SET {column} = {column} / 100.0')
+    for statement in SEARCH_TRIGGERS:
+        op.execute(statement)
@@ -0,0 +1,26 @@
+"""Index the payment method and inventory change type filters
+
+Revision ID: f2b7d4a9c631
+Revises: e4a9c2f71b86
+Create Date: 2026-10-18 16:42:08.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b7d4a9c631'
+down_revision = 'e4a9c2f71b86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_transaction_payment_method', 'transaction', ['payment_method'], unique=False)
+    op.create_index('ix_inventory_log_change_type', 'inventory_log', ['change_type'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_inventory_log_change_type', table_name='inventory_log')
+    op.drop_index('ix_transaction_payment_method', table_name='transaction')
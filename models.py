@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sharding import StoreSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': StoreSession})  # routes to the selected store's database
 
 # Users (Admin/Cashier)
 class User(db.Model):
@@ -21,19 +22,26 @@ class Category(db.Model):
 class Product(db.Model):
     product_id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(100), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.category_id'))
-    price = db.Column(db.Float, nullable=False)
-    stock_quantity = db.Column(db.Integer, default=0)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.category_id'), index=True)
+    price = db.Column(db.Integer, nullable=False)  # cents, like every money column (see money.py)
+    stock_quantity = db.Column(db.Integer, default=0, index=True)  # low-stock queries
     unit = db.Column(db.String(20), default='pcs')
+    sku = db.Column(db.String(64), unique=True, index=True)  # internal stock-keeping code
+    barcode = db.Column(db.String(64), unique=True, index=True)  # EAN/UPC printed on the item
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Transactions (Sales)
 class Transaction(db.Model):
     transaction_id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    payment_method = db.Column(db.String(50))
-    total_amount = db.Column(db.Float)
-    date_time = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), index=True)
+    payment_method = db.Column(db.String(50), index=True)  # SQLite appends the rowid, so pages stay in key order
+    total_amount = db.Column(db.Integer)  # paid, after discounts
+    discount_amount = db.Column(db.Integer, default=0)  # line and sale discounts
+    vat_amount = db.Column(db.Integer, default=0)  # included in total_amount unless PRICES_INCLUDE_VAT is off
+    date_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    idempotency_key = db.Column(db.String(64), unique=True, index=True)  # set by the terminal that recorded the sale
+    store_id = db.Column(db.String(20))     # store and till that recorded the sale (see stores.py)
+    terminal_id = db.Column(db.String(50))
     user = db.relationship('User', backref='transactions')   # Link to User
     details = db.relationship('TransactionDetail', backref='transaction', lazy=True)
     payments = db.relationship('Payment', backref='transaction', lazy=True)
@@ -41,26 +49,113 @@ class Transaction(db.Model):
 
 # Transaction details (line items)
 class TransactionDetail(db.Model):
+    __table_args__ = (
+        # "transactions containing product X" and per-product sales history
+        db.Index('ix_transaction_detail_product_transaction', 'product_id', 'transaction_id'),
+    )
     detail_id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.transaction_id'))
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.transaction_id'), index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
     quantity = db.Column(db.Integer)
-    price = db.Column(db.Float)
-    subtotal = db.Column(db.Float)
+    price = db.Column(db.Integer)
+    discount = db.Column(db.Integer, default=0)  # its own discount plus its share of the sale's
+    subtotal = db.Column(db.Integer)  # quantity * price - discount
 
 # Payments
 class Payment(db.Model):
     payment_id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.transaction_id'))
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.transaction_id'), index=True)
     method = db.Column(db.String(50))
-    amount = db.Column(db.Float)
+    amount = db.Column(db.Integer)
 
 # Inventory logs
 class InventoryLog(db.Model):
     log_id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
-    change_type = db.Column(db.String(50))  # stock_in, stock_out, adjustment
+    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'), index=True)
+    change_type = db.Column(db.String(50), index=True)  # stock_in, stock_out, adjustment
     quantity_change = db.Column(db.Integer)
     remarks = db.Column(db.String(200))
-    date_time = db.Column(db.DateTime, default=datetime.utcnow)
+    date_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    store_id = db.Column(db.String(20))
+    terminal_id = db.Column(db.String(50))
     product = db.relationship('Product', backref='inventory_logs')
+
+# Sales rollups (maintained by checkout, rebuilt with `flask rollups rebuild`)
+class DailySales(db.Model):
+    sales_date = db.Column(db.Date, primary_key=True)
+    total_sales = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyProductSales(db.Model):
+    sales_date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)  # no FK: rollups outlive deleted products
+    quantity_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+
+# Head office: per-store rollups merged from every store database by `flask stores consolidate`
+class StoreDailySales(db.Model):
+    store_id = db.Column(db.String(20), primary_key=True)
+    sales_date = db.Column(db.Date, primary_key=True)
+    total_sales = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class StoreDailyProductSales(db.Model):
+    __table_args__ = (
+        db.Index('ix_store_daily_product_sales_date', 'sales_date'),  # chain-wide top products for a range
+    )
+    store_id = db.Column(db.String(20), primary_key=True)
+    sales_date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+
+# Sales velocity per product (maintained by forecast.py from the DailyProductSales rollup)
+class ProductVelocity(db.Model):
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # no FK, like the rollups
+    daily_units = db.Column(db.Float, nullable=False, default=0)  # EWMA of units sold per day
+    as_of = db.Column(db.Date, nullable=False)  # last whole day folded into the average
+
+# Inventory ledger checkpoints (taken with `flask ledger snapshot`, see ledger.py)
+class StockSnapshot(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'last_log_id', name='uq_stock_snapshot_product_log'),
+    )
+    snapshot_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)  # no FK: history outlives deleted products
+    last_log_id = db.Column(db.Integer, nullable=False)  # high-water mark: every log up to here is included
+    quantity = db.Column(db.Integer, nullable=False)  # sum of quantity_change up to last_log_id
+    as_of = db.Column(db.DateTime)  # latest date_time among the included logs
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Write-behind inventory journals: the last entry of each journal file already in inventory_log (see journal.py)
+class JournalCheckpoint(db.Model):
+    journal_id = db.Column(db.String(100), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Closed months moved out of the hot sales tables into archive files (see archive.py)
+class ArchivedPeriod(db.Model):
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    file_name = db.Column(db.String(255), nullable=False)  # in ARCHIVE_DIR
+    period_end = db.Column(db.Date, nullable=False)  # first day after the month; hot tables hold nothing earlier
+    first_at = db.Column(db.DateTime)  # oldest and newest date_time in the file
+    last_at = db.Column(db.DateTime)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    inventory_logs = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Background jobs (see jobs.py)
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_job_id', 'status', 'job_id'),  # workers claim the oldest queued job
+    )
+    job_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    error = db.Column(db.Text)
+    result_file = db.Column(db.String(255))
+    result_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
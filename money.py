@@ -0,0 +1,121 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import literal
+
+# Money is stored as integer cents (centavos) in every amount column, so line totals,
+# sale totals and the SUMs behind the reports are exact integer arithmetic in SQL
+# and Python. Amounts cross the API as decimal numbers in currency units: to_cents()
+# parses what clients and forms send, to_amount() / amount_column() turn stored cents
+# back into units for responses (a float whose shortest repr is the exact 2-decimal
+# amount, e.g. 1999 -> 19.99).
+
+CENTS = 100
+
+# Stored in cents since the integer-money migration (e4a9c2f71b86); convert_to_cents()
+# applies the same change to store databases and archive files created before it
+MONEY_COLUMNS = {
+    'product': ('price',),
+    'transaction': ('total_amount',),
+    'transaction_detail': ('price', 'subtotal'),
+    'payment': ('amount',),
+    'daily_sales': ('total_sales',),
+    'daily_product_sales': ('revenue',),
+    'store_daily_sales': ('total_sales',),
+    'store_daily_product_sales': ('revenue',),
+}
+# Added by the same migration; NULL on sales recorded before it
+ADDED_COLUMNS = {
+    'transaction': ('discount_amount', 'vat_amount'),
+    'transaction_detail': ('discount',),
+}
+
+
+class MoneyError(ValueError):
+    """Amount that is not a number of whole cents; the message is safe to return to the client."""
+
+
+def to_cents(value, field='amount'):
+    """Integer cents for an amount in currency units (number or numeric string), rounded half up."""
+    if value is None or isinstance(value, bool):
+        raise MoneyError(f"'{field}' must be a number")
+    try:
+        amount = Decimal(value.strip() if isinstance(value, str) else str(value))
+    except InvalidOperation:
+        raise MoneyError(f"'{field}' must be a number")
+    if not amount.is_finite():
+        raise MoneyError(f"'{field}' must be a number")
+    return int((amount * CENTS).to_integral_value(ROUND_HALF_UP))
+
+
+def to_amount(cents):
+    """Currency units for a response; None stays None."""
+    return None if cents is None else cents / CENTS
+
+
+def amount_column(column, name=None):
+    """column (cents) as currency units, computed by SQLite and labelled like the column."""
+    return (column / literal(float(CENTS))).label(name or column.key)
+
+
+def format_amount(cents):
+    """'1,234.50' for 123450 cents, with no float in between."""
+    sign = '-' if cents < 0 else ''
+    units, rest = divmod(abs(cents), CENTS)
+    return f'{sign}{units:,}.{rest:02d}'
+
+
+def allocate(cents, weights):
+    """Split cents over weights in proportion; the shares add up to cents exactly (largest remainder)."""
+    total = sum(weights)
+    if not total:
+        return [0] * len(weights)
+    shares = [cents * weight // total for weight in weights]
+    by_remainder = sorted(range(len(weights)), key=lambda i: cents * weights[i] % total, reverse=True)
+    for i in by_remainder[:cents - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+def vat_portion(cents, rate, included):
+    """VAT on an amount of cents at rate (a Decimal): the part of it that is VAT when included, else on top."""
+    vat = Decimal(cents) * rate / (1 + rate) if included else Decimal(cents) * rate
+    return int(vat.to_integral_value(ROUND_HALF_UP))
+
+
+def convert_to_cents(engine):
+    """Convert a database created before the integer-money migration, in place; returns the tables rebuilt.
+
+    Mirrors migration e4a9c2f71b86 for databases Alembic does not manage (store databases,
+    archive files). Columns already declared INTEGER are left alone, so it is safe to re-run.
+    Rebuilding 'product' drops the FTS5 triggers: recreate them with ensure_search_index().
+    """
+    converted = []
+    with engine.connect() as connection:
+        # The rebuilds drop tables that others reference; the PRAGMA is a no-op inside a transaction
+        foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            inspector = sa.inspect(connection)
+            operations = Operations(MigrationContext.configure(connection))
+            for table in set(MONEY_COLUMNS) & set(inspector.get_table_names()):
+                existing = {column['name']: column for column in inspector.get_columns(table)}
+                legacy = [name for name in MONEY_COLUMNS[table]
+                          if name in existing and not isinstance(existing[name]['type'], sa.Integer)]
+                added = [name for name in ADDED_COLUMNS.get(table, ()) if name not in existing]
+                if not legacy and not added:
+                    continue
+                for name in legacy:
+                    connection.exec_driver_sql(f'UPDATE "{table}" SET {name} = ROUND({name} * {CENTS})')
+                with operations.batch_alter_table(table) as batch_op:
+                    for name in legacy:
+                        batch_op.alter_column(name, type_=sa.Integer(), existing_nullable=existing[name]['nullable'])
+                    for name in added:
+                        batch_op.add_column(sa.Column(name, sa.Integer(), nullable=True))
+                converted.append(table)
+            connection.commit()
+        finally:
+            connection.exec_driver_sql(f'PRAGMA foreign_keys={int(bool(foreign_keys))}')
+    return sorted(converted)
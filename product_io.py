@@ -0,0 +1,402 @@
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, select, update, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Product, Category, InventoryLog
+from catalog import CATALOG_DIRTY, product_rows, serialize_product
+from events import products_written
+from stores import catalog_written
+from receipts import names_changed
+from listing import iter_keyset
+from product_search import CODE_CHANGES, normalize_code
+from stock import run_with_retry
+from money import to_cents
+
+# Bulk catalog import/export (CSV or NDJSON, one product per row/line).
+#
+# Imports are parsed as a stream and written IMPORT_CHUNK_SIZE rows per transaction
+# with executemany, so a supplier file of any size needs neither the whole file nor
+# thousands of ORM objects in memory. Rows are matched to existing products by
+# product_id, then sku, then barcode; unmatched rows are inserted. Stock is only set
+# for new products (with an 'Initial Stock' inventory log) — stock of existing
+# products moves through inventory adjustments, never through a catalog import.
+# Optional columns left blank keep the existing product's value.
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_FIELDS = ['product_id', 'product_name', 'category_id', 'price', 'stock_quantity', 'unit', 'sku', 'barcode']
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+NOT_UTF8 = 'not valid UTF-8'
+
+_INSERTED = ('product_name', 'category_id', 'price', 'stock_quantity', 'unit', 'sku', 'barcode')
+_UPDATED = ('product_name', 'category_id', 'price', 'unit', 'sku', 'barcode')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def import_format(explicit=None, filename=None, mimetype=None):
+    """Pick 'csv' or 'ndjson' from ?format=, then the file extension, then the content type."""
+    if explicit:
+        if explicit not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        return explicit
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+    return 'ndjson' if mimetype == FORMATS['ndjson'] else 'csv'
+
+
+def _decoded_lines(binary, bad):
+    """Text lines of a binary stream; the numbers of lines that are not UTF-8 are added to bad."""
+    for number, raw in enumerate(binary, 1):
+        try:
+            yield raw.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            bad.add(number)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def read_rows(binary, fmt):
+    """Yield (line number, raw row) from a binary stream without reading it all at once.
+
+    Lines that are not UTF-8, or not valid CSV / JSON, come out as ImportRowError rows.
+    """
+    bad = set()
+    lines = _decoded_lines(binary, bad)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        first = 1  # first physical line of the next record (quoted fields may span lines)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                row = ImportRowError(f'invalid CSV: {e}')
+            if bad.intersection(range(first, reader.line_num + 1)):
+                row = ImportRowError(NOT_UTF8)
+            first = reader.line_num + 1
+            yield reader.line_num, row
+    for line, raw in enumerate(lines, 1):
+        if line in bad:
+            yield line, ImportRowError(NOT_UTF8)
+            continue
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw)
+        except ValueError as e:
+            yield line, ImportRowError(f'invalid JSON: {e}')
+
+
+def _text(row, name, max_length=None):
+    value = row.get(name)
+    value = None if value is None else str(value).strip() or None
+    if value is not None and max_length and len(value) > max_length:
+        raise ImportRowError(f"'{name}' is longer than {max_length} characters")
+    return value
+
+
+def _number(row, name, cast, default=None):
+    value = _text(row, name)
+    if value is None:
+        return default
+    try:
+        value = cast(value)
+    except ValueError:
+        raise ImportRowError(f"'{name}' must be a number")
+    if value < 0:
+        raise ImportRowError(f"'{name}' cannot be negative")
+    return value
+
+
+class _Categories:
+    """category_id / category_name resolution; unknown names are created with the first rows that use them."""
+
+    def __init__(self):
+        self.ids = set()
+        self.by_name = {}  # committed categories only
+        for category_id, name in db.session.query(Category.category_id, Category.category_name):
+            self.ids.add(category_id)
+            self.by_name.setdefault(name.strip().lower(), category_id)
+
+    def resolve(self, row):
+        """The row's category_id, or its category_name when no such category exists yet."""
+        category_id = _number(row, 'category_id', int)
+        if category_id is not None:
+            if category_id not in self.ids:
+                raise ImportRowError(f'category {category_id} does not exist')
+            return category_id
+        name = _text(row, 'category_name', 50)
+        if name is None:
+            return None
+        return self.by_name.get(name.lower(), name)
+
+    def create(self, rows, created):
+        """Insert the new categories rows name in the current transaction (committed with the rows);
+        returns {lowercased name: id} for them. created holds those already added in this transaction."""
+        new = {}
+        for row in rows:
+            name = row['category_id']
+            if isinstance(name, str) and name.lower() not in created:
+                new.setdefault(name.lower(), name)
+        if not new:
+            return {}
+        # Like the product inserts below: one executemany, then the highest ids are the new rows
+        db.session.execute(insert(Category), [{'category_name': name} for name in new.values()])
+        ids = db.session.execute(
+            select(Category.category_id).order_by(Category.category_id.desc()).limit(len(new))
+        ).scalars().all()[::-1]
+        catalog_written(Category, ids)
+        return dict(zip(new, ids))
+
+    def committed(self, created):
+        self.by_name.update(created)
+        self.ids.update(created.values())
+
+
+def validate_row(raw, categories):
+    if isinstance(raw, Exception):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ImportRowError('expected an object with product fields')
+    row = {
+        'product_id': _number(raw, 'product_id', int),
+        'product_name': _text(raw, 'product_name', 100),
+        'price': _number(raw, 'price', to_cents),  # currency units in the file, cents in the table
+        'stock_quantity': _number(raw, 'stock_quantity', int, default=0),
+        'unit': _text(raw, 'unit', 20),
+        'sku': normalize_code(_text(raw, 'sku', 64)),
+        'barcode': normalize_code(_text(raw, 'barcode', 64)),
+    }
+    if row['product_name'] is None:
+        raise ImportRowError("'product_name' is required")
+    if row['price'] is None:
+        raise ImportRowError("'price' is required")
+    row['category_id'] = categories.resolve(raw)
+    return row
+
+
+def _match(row, existing):
+    """product_id of the product this row updates, or None to insert it."""
+    by_id, by_sku, by_barcode = existing
+    target = None
+    if row['product_id'] in by_id:
+        target = row['product_id']
+    else:
+        target = by_sku.get(row['sku']) or by_barcode.get(row['barcode'])
+    for field, owners in (('sku', by_sku), ('barcode', by_barcode)):
+        owner = owners.get(row[field])
+        if owner is not None and owner != target:
+            raise ImportRowError(f"{field} '{row[field]}' already belongs to product {owner}")
+    return target
+
+
+def _existing(rows):
+    ids = [r['product_id'] for r in rows if r['product_id']]
+    skus = [r['sku'] for r in rows if r['sku']]
+    barcodes = [r['barcode'] for r in rows if r['barcode']]
+    by_id, by_sku, by_barcode = {}, {}, {}
+    for product_id, sku, barcode in db.session.query(Product.product_id, Product.sku, Product.barcode).filter(
+        or_(Product.product_id.in_(ids), Product.sku.in_(skus), Product.barcode.in_(barcodes))
+    ):
+        by_id[product_id] = (sku, barcode)
+        if sku:
+            by_sku[sku] = product_id
+        if barcode:
+            by_barcode[barcode] = product_id
+    return by_id, by_sku, by_barcode
+
+
+def _write(rows, categories, created):
+    """Upsert validated rows in the current transaction, creating the new categories they name (created:
+    those already added in it); return (inserted, updated, errors, code changes, categories added)."""
+    existing = _existing([row for _, row in rows])
+    matched, errors = [], []
+    for line, row in rows:
+        try:
+            matched.append((_match(row, existing), row))
+        except ImportRowError as e:
+            errors.append({'line': line, 'error': str(e)})
+    added = categories.create([row for _, row in matched], created)
+    names = dict(created, **added)
+    inserts, updates = [], []
+    for target, row in matched:
+        if isinstance(row['category_id'], str):
+            row = dict(row, category_id=names[row['category_id'].lower()])
+        if target is None:
+            inserts.append(dict({field: row[field] for field in _INSERTED}, unit=row['unit'] or 'pcs'))
+        else:
+            updates.append(dict(
+                {field: row[field] for field in _UPDATED if row[field] is not None}, product_id=target
+            ))
+
+    code_changes = []
+    for values in updates:
+        sku, barcode = existing[0][values['product_id']]
+        code_changes.append((values['product_id'], {
+            c for c in (values.get('sku', sku), values.get('barcode', barcode)) if c
+        }))
+    if updates:
+        db.session.execute(update(Product), updates)
+        if any('product_name' in values for values in updates):
+            names_changed()
+    if inserts:
+        # One executemany (INSERT ... RETURNING would run once per row on SQLite). The transaction
+        # holds the write lock from the first row on, so the rows get the highest product_ids, in order.
+        db.session.execute(insert(Product), inserts)
+        new_ids = db.session.execute(
+            select(Product.product_id).order_by(Product.product_id.desc()).limit(len(inserts))
+        ).scalars().all()[::-1]
+        logs = []
+        for product_id, row in zip(new_ids, inserts):
+            code_changes.append((product_id, {c for c in (row['sku'], row['barcode']) if c}))
+            if row['stock_quantity'] > 0:
+                logs.append({
+                    'product_id': product_id,
+                    'change_type': 'Initial Stock',
+                    'quantity_change': row['stock_quantity'],
+                    'remarks': 'Product imported with initial stock'
+                })
+        if logs:
+            db.session.execute(insert(InventoryLog), logs)
+    return len(inserts), len(updates), errors, code_changes, added
+
+
+def _commit(code_changes):
+    # Core statements bypass the flush hooks, so hand catalog.py and product_search.py their work directly
+    db.session.info[CATALOG_DIRTY] = True
+    db.session.info.setdefault(CODE_CHANGES, []).extend(code_changes)
+    products_written(product_id for product_id, _ in code_changes)
+    catalog_written(Product, [product_id for product_id, _ in code_changes])
+    db.session.commit()
+
+
+def _write_chunk(rows, categories):
+    def work():
+        try:
+            inserted, updated, errors, code_changes, created = _write(rows, categories, {})
+            _commit(code_changes)
+            categories.committed(created)
+            return inserted, updated, errors
+        except IntegrityError:
+            db.session.rollback()
+        # A row raced another writer: redo the chunk one row per savepoint to find it
+        inserted = updated = 0
+        errors, code_changes, created = [], [], {}
+        for line, row in rows:
+            try:
+                with db.session.begin_nested():
+                    row_inserted, row_updated, row_errors, row_changes, row_created = _write(
+                        [(line, row)], categories, created)
+            except IntegrityError:
+                errors.append({'line': line, 'error': 'conflicts with an existing product'})
+                continue
+            inserted += row_inserted
+            updated += row_updated
+            errors += row_errors
+            code_changes += row_changes
+            created.update(row_created)
+        _commit(code_changes)
+        categories.committed(created)
+        return inserted, updated, errors
+    return run_with_retry(work)
+
+
+def import_products(rows, chunk_size=None):
+    """Import (line, raw row) pairs; return counts plus the first MAX_REPORTED_ERRORS row errors."""
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    result = {'inserted': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+    categories = _Categories()
+    seen = {}  # product_id/sku/barcode -> first line using it
+
+    def reject(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line, 'error': message})
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return result
+        valid = []
+        for line, raw in chunk:
+            try:
+                row = validate_row(raw, categories)
+                keys = [(f, row[f]) for f in ('product_id', 'sku', 'barcode') if row[f]]
+                for field, value in keys:
+                    if (field, value) in seen:
+                        raise ImportRowError(f"duplicate {field} '{value}' (first used on line {seen[field, value]})")
+                for key in keys:
+                    seen[key] = line
+            except ImportRowError as e:
+                reject(line, str(e))
+                continue
+            valid.append((line, row))
+        if valid:
+            inserted, updated, errors = _write_chunk(valid, categories)
+            result['inserted'] += inserted
+            result['updated'] += updated
+            for error in errors:
+                reject(error['line'], error['error'])
+
+
+def iter_export(fmt):
+    """Yield the catalog in product_id order as CSV or NDJSON text."""
+    products = iter_keyset(product_rows(), Product.product_id)
+    if fmt == 'ndjson':
+        dumps = current_app.json.dumps
+        for product in products:
+            yield dumps(serialize_product(product)) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for product in products:
+        row = serialize_product(product)
+        writer.writerow(['' if row[f] is None else row[f] for f in EXPORT_FIELDS])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+products_cli = AppGroup('products', help='Bulk import and export of the product catalog.')
+
+
+@products_cli.command('import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+def import_command(source, fmt, chunk_size):
+    """Create or update products from a CSV or NDJSON file ('-' for stdin)."""
+    fmt = import_format(fmt, source.name)
+    result = import_products(read_rows(source, fmt), chunk_size)
+    for error in result['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"{result['inserted']} inserted, {result['updated']} updated, {result['error_count']} rejected.")
+    if result['error_count']:
+        sys.exit(1)
+
+
+@products_cli.command('export')
+@click.argument('target', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+def export_command(target, fmt):
+    """Write the whole catalog to a file ('-' for stdout)."""
+    for text in iter_export(fmt):
+        target.write(text)
@@ -0,0 +1,188 @@
+import threading
+from itertools import chain
+
+from sqlalchemy import event, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import db, Product
+from catalog import get_product, get_products
+
+# Scanner lookups (barcode/SKU -> product) and name search for manual entry.
+#
+# Codes live in a process-local dict built on first use and patched after every
+# commit that writes a Product, so a scan is a dict hit plus a catalog cache hit.
+# Name search uses an FTS5 trigram index kept in sync by triggers (see
+# ensure_search_index); it falls back to LIKE when FTS5 is unavailable.
+
+CODE_CHANGES = 'product_code_changes'
+
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "product_name, content='product', content_rowid='product_id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, product_name) VALUES ('delete', old.product_id, old.product_name); "
+    "INSERT INTO product_search(rowid, product_name) VALUES (new.product_id, new.product_name); END",
+    "INSERT INTO product_search(product_search) VALUES ('rebuild')",
+]
+
+
+def ensure_search_index():
+    """Create (or rebuild) the FTS5 name index; the migration runs the same statements."""
+    for statement in SEARCH_INDEX_DDL:
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+def exclude_search_tables(name, type_, parent_names):
+    # Keep Alembic autogenerate from proposing to drop the FTS5 table and its shadow tables
+    return not (type_ == 'table' and name.startswith('product_search'))
+
+
+def normalize_code(value):
+    value = (value or '').strip()
+    return value or None
+
+
+class CodeIndex:
+    """code (SKU or barcode) -> product_id, plus the reverse map for cheap updates."""
+
+    def __init__(self):
+        self._codes = {}
+        self._by_product = {}
+        self._lock = threading.Lock()
+        self._built = False
+
+    def build(self):
+        rows = db.session.query(Product.product_id, Product.sku, Product.barcode).filter(
+            or_(Product.sku.isnot(None), Product.barcode.isnot(None))
+        )
+        codes, by_product = {}, {}
+        for product_id, sku, barcode in rows:
+            product_codes = {c for c in (sku, barcode) if c}
+            by_product[product_id] = product_codes
+            for code in product_codes:
+                codes[code] = product_id
+        with self._lock:
+            self._codes, self._by_product, self._built = codes, by_product, True
+        return len(codes)
+
+    def _set(self, product_id, product_codes):
+        for code in self._by_product.pop(product_id, ()):
+            if self._codes.get(code) == product_id:
+                del self._codes[code]
+        if product_codes:
+            self._by_product[product_id] = product_codes
+            for code in product_codes:
+                self._codes[code] = product_id
+
+    def apply(self, changes):
+        """changes: [(product_id, {codes})]; an empty set removes the product."""
+        with self._lock:
+            if not self._built:
+                return
+            for product_id, product_codes in changes:
+                self._set(product_id, product_codes)
+
+    def lookup(self, code):
+        """Return the product dict for a scanned code, or None."""
+        if not self._built:
+            self.build()
+        product_id = self._codes.get(code)
+        if product_id is not None:
+            product = get_product(product_id)
+            if product and code in (product['sku'], product['barcode']):
+                return product
+        # Miss or stale (another worker changed the product): ask the database and repair the entry
+        row = db.session.query(Product.product_id, Product.sku, Product.barcode).filter(
+            or_(Product.sku == code, Product.barcode == code)
+        ).first()
+        with self._lock:
+            if product_id is not None and (row is None or row.product_id != product_id):
+                self._codes.pop(code, None)
+            if row is not None:
+                self._set(row.product_id, {c for c in (row.sku, row.barcode) if c})
+        return get_product(row.product_id) if row else None
+
+    def __len__(self):
+        return len(self._codes)
+
+
+code_index = CodeIndex()
+
+
+def _quote(text):
+    # Quoted strings cannot inject FTS5 syntax
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _fts_queries(text):
+    """(match expression, order by bm25) to try in turn.
+
+    A quoted string is a substring query for the trigram tokenizer; ranking it would score every
+    hit (thousands for a common word) for little gain, so only the fuzzy any-trigram query is ranked.
+    """
+    yield _quote(text), False
+    grams = sorted({text[i:i + 3] for i in range(len(text) - 2)})
+    if len(grams) > 1:
+        yield ' OR '.join(_quote(g) for g in grams), True
+
+
+def _match_rank(name, text):
+    name = name.lower()
+    return 0 if name.startswith(text) else 1 if text in name else 2
+
+
+def search_products(text, limit=20):
+    """Products whose name best matches text: prefix matches first, then substrings, then fuzzy trigram hits."""
+    text = text.strip().lower()
+    if not text:
+        return []
+    candidates = None
+    if len(text) >= 3:
+        try:
+            for fts_query, ranked in _fts_queries(text):
+                candidates = db.session.execute(db.text(
+                    'SELECT rowid FROM product_search WHERE product_search MATCH :q '
+                    + ('ORDER BY rank ' if ranked else '') + 'LIMIT :n'
+                ), {'q': fts_query, 'n': limit * 5}).scalars().all()
+                if candidates:
+                    break
+        except OperationalError:
+            candidates = None
+            db.session.rollback()  # no FTS5 (or no index yet): fall back to LIKE
+    if candidates is None:
+        candidates = [pid for (pid,) in db.session.query(Product.product_id).filter(
+            Product.product_name.ilike('%' + text + '%')
+        ).order_by(Product.product_id).limit(limit * 5)]
+    products = get_products(candidates)
+    ranked = sorted(
+        (pid for pid in candidates if pid in products),
+        key=lambda pid: _match_rank(products[pid]['product_name'], text)
+    )  # stable sort keeps the FTS order within each group
+    return [products[pid] for pid in ranked[:limit]]
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_code_changes(session, flush_context):
+    changes = [
+        (obj.product_id, {c for c in (obj.sku, obj.barcode) if c})
+        for obj in chain(session.new, session.dirty) if isinstance(obj, Product)
+    ] + [(obj.product_id, set()) for obj in session.deleted if isinstance(obj, Product)]
+    if changes:
+        session.info.setdefault(CODE_CHANGES, []).extend(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_code_changes(session):
+    changes = session.info.pop(CODE_CHANGES, None)
+    if changes:
+        code_index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_code_changes(session):
+    session.info.pop(CODE_CHANGES, None)
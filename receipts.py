@@ -0,0 +1,212 @@
+import json
+from itertools import chain
+
+from flask import current_app, render_template
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from models import db, User, Product, Transaction, TransactionDetail, Payment
+from cache import receipt_cache, MISSING
+from listing import iter_keyset_batches
+from sharding import current_store
+from money import format_amount
+
+# Receipts for printing and reprinting.
+#
+# A receipt is loaded with one joined query (header, cashier, line items with product
+# names, payments) and rendered as fixed-width text for ESC/POS printers, the same text
+# wrapped in printer commands, or HTML. Sales never change once recorded, so rendered
+# receipts are kept in receipt_cache by (store, transaction_id, format, width); end-of-day
+# batches load every uncached receipt of a page with a single IN (...) query. The cashier
+# and product names are the current ones, so a commit that renames or deletes a user or
+# a product drops every cached receipt of its process; other worker processes keep theirs
+# until RECEIPT_CACHE_TTL, which is kept short for that reason.
+
+FORMATS = {
+    'text': 'text/plain; charset=utf-8',
+    'escpos': 'application/octet-stream',
+    'html': 'text/html; charset=utf-8',
+}
+BATCH_FORMATS = ('text', 'escpos')  # one stream for the printer; HTML receipts are one page each
+MIN_WIDTH, MAX_WIDTH = 24, 80
+RECEIPT_NAMES = 'receipt_names_changed'  # session.info key: a name printed on receipts changed
+_PRINTED_NAMES = {User: 'username', Product: 'product_name'}
+
+ESC_INIT = b'\x1b@'        # ESC @: reset the printer
+ESC_CUT = b'\n\n\n\x1dV\x01'  # feed past the tear bar, GS V 1: partial cut
+
+
+class ReceiptError(ValueError):
+    pass
+
+
+def validate_format(fmt, width):
+    if fmt not in FORMATS:
+        raise ReceiptError(f"'format' must be one of {', '.join(FORMATS)}")
+    if fmt == 'html':
+        return fmt, None  # the browser wraps the lines
+    if width is None:
+        width = current_app.config.get('RECEIPT_WIDTH', 42)
+    if not MIN_WIDTH <= width <= MAX_WIDTH:
+        raise ReceiptError(f"'width' must be between {MIN_WIDTH} and {MAX_WIDTH}")
+    return fmt, width
+
+
+def _payments():
+    # One JSON array per sale, so joining the payments does not repeat the line items
+    return select(func.json_group_array(func.json_array(Payment.method, Payment.amount))).where(
+        Payment.transaction_id == Transaction.transaction_id
+    ).correlate(Transaction).scalar_subquery()
+
+
+def load_receipts(transaction_ids):
+    """{transaction_id: receipt dict} for the ids that exist."""
+    rows = db.session.query(
+        Transaction.transaction_id, Transaction.date_time, Transaction.payment_method, Transaction.total_amount,
+        Transaction.vat_amount, User.username, _payments().label('payments'), TransactionDetail.quantity,
+        TransactionDetail.price, TransactionDetail.discount, TransactionDetail.subtotal, Product.product_name
+    ).outerjoin(User, User.user_id == Transaction.user_id).outerjoin(
+        TransactionDetail, TransactionDetail.transaction_id == Transaction.transaction_id
+    ).outerjoin(Product, Product.product_id == TransactionDetail.product_id).filter(
+        Transaction.transaction_id.in_(list(transaction_ids))
+    ).order_by(Transaction.transaction_id, TransactionDetail.detail_id)
+    receipts = {}
+    for row in rows:
+        receipt = receipts.get(row.transaction_id)
+        if receipt is None:
+            receipt = receipts[row.transaction_id] = {
+                'transaction_id': row.transaction_id,
+                'date_time': row.date_time,
+                'cashier': row.username,
+                'total_amount': row.total_amount or 0,
+                'vat_amount': row.vat_amount,  # None on sales recorded before VAT was
+                'payments': [
+                    {'method': method, 'amount': amount or 0} for method, amount in json.loads(row.payments or '[]')
+                ] or [{'method': row.payment_method, 'amount': row.total_amount or 0}],
+                'items': []
+            }
+        if row.quantity is not None:
+            receipt['items'].append({
+                'name': row.product_name or 'Deleted product',
+                'quantity': row.quantity,
+                'price': row.price or 0,
+                'discount': row.discount or 0,
+                'subtotal': row.subtotal or 0
+            })
+    for receipt in receipts.values():
+        # Lines add up to the total unless VAT was charged on top (PRICES_INCLUDE_VAT off). Sales
+        # from before VAT have no vat_amount, and the cents migration rounded their lines and total
+        # separately, so a difference there is not VAT: they print without a VAT line.
+        receipt['subtotal'] = sum(item['subtotal'] for item in receipt['items'])
+        receipt['vat_added'] = receipt['vat_amount'] is not None and receipt['subtotal'] != receipt['total_amount']
+    return receipts
+
+
+def _money(cents):
+    return f"{current_app.config.get('RECEIPT_CURRENCY', '')}{format_amount(cents)}"
+
+
+def _pair(left, right, width):
+    # Left text truncated so the right-aligned amount always fits on the line
+    left = left[:max(width - len(right) - 1, 0)]
+    return f'{left}{right:>{width - len(left)}}'
+
+
+def render_text(receipt, width):
+    config = current_app.config
+    rule = '-' * width
+    lines = [line.center(width).rstrip() for line in config.get('RECEIPT_HEADER', ())]
+    lines += [
+        rule,
+        _pair(f"Receipt #{receipt['transaction_id']}",
+              receipt['date_time'].strftime('%Y-%m-%d %H:%M') if receipt['date_time'] else '', width),
+        f"Cashier: {receipt['cashier'] or 'N/A'}"[:width],
+        rule,
+    ]
+    for item in receipt['items']:
+        lines.append(item['name'][:width])
+        lines.append(_pair(f"  {item['quantity']} x {_money(item['price'])}",
+                           _money(item['subtotal'] + item['discount']), width))
+        if item['discount']:
+            lines.append(_pair('  Discount', _money(-item['discount']), width))
+    lines.append(rule)
+    if receipt['vat_added']:
+        lines += [_pair('SUBTOTAL', _money(receipt['subtotal']), width), _pair('VAT', _money(receipt['vat_amount']), width)]
+    lines.append(_pair('TOTAL', _money(receipt['total_amount']), width))
+    if receipt['vat_amount'] and not receipt['vat_added']:
+        lines.append(_pair('  VAT included', _money(receipt['vat_amount']), width))
+    lines += [_pair(f"  {payment['method'] or 'N/A'}", _money(payment['amount']), width)
+              for payment in receipt['payments']]
+    lines.append(rule)
+    lines += [line.center(width).rstrip() for line in config.get('RECEIPT_FOOTER', ())]
+    return '\n'.join(lines) + '\n'
+
+
+def render(receipt, fmt, width):
+    """Rendered receipt as bytes."""
+    if fmt == 'html':
+        return render_template('receipt.html', receipt=receipt, money=_money,
+                               header=current_app.config.get('RECEIPT_HEADER', ()),
+                               footer=current_app.config.get('RECEIPT_FOOTER', ())).encode()
+    text = render_text(receipt, width)
+    if fmt == 'escpos':
+        # Printer code page 437 has no symbols beyond ASCII and box drawing
+        return ESC_INIT + text.encode('cp437', errors='replace') + ESC_CUT
+    return text.encode()
+
+
+def get_receipts(transaction_ids, fmt, width):
+    """{transaction_id: rendered bytes}; cache misses are loaded together."""
+    ttl = current_app.config.get('RECEIPT_CACHE_TTL')
+    version = receipt_cache.version  # a rename committed while these load must not be cached
+    found, missing = {}, []
+    for transaction_id in transaction_ids:
+        cached = receipt_cache.get((current_store(), transaction_id, fmt, width))
+        if cached is MISSING:
+            missing.append(transaction_id)
+        else:
+            found[transaction_id] = cached
+    if missing:
+        for transaction_id, receipt in load_receipts(missing).items():
+            found[transaction_id] = render(receipt, fmt, width)
+            receipt_cache.set((current_store(), transaction_id, fmt, width), found[transaction_id],
+                              ttl=ttl, version=version)
+    return found
+
+
+def get_receipt(transaction_id, fmt, width):
+    return get_receipts([transaction_id], fmt, width).get(transaction_id)
+
+
+def iter_receipts(query, fmt, width, batch_size=200):
+    """Rendered receipts of every sale matching query (a query of transaction ids), oldest first."""
+    for rows in iter_keyset_batches(query, Transaction.transaction_id, batch_size=batch_size):
+        ids = [row.transaction_id for row in rows]
+        rendered = get_receipts(ids, fmt, width)
+        for transaction_id in ids:
+            if transaction_id in rendered:
+                yield rendered[transaction_id]
+
+
+def names_changed():
+    """Drop cached receipts once the current transaction commits; for renames written with Core statements."""
+    db.session.info[RECEIPT_NAMES] = True
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_name_changes(session, flush_context, instances):
+    for obj in chain(session.dirty, session.deleted):
+        name = _PRINTED_NAMES.get(type(obj))
+        if name and (obj in session.deleted or inspect(obj).attrs[name].history.has_changes()):
+            session.info[RECEIPT_NAMES] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop(RECEIPT_NAMES, False):
+        receipt_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_name_changes(session):
+    session.info.pop(RECEIPT_NAMES, None)
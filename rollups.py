@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, Transaction, TransactionDetail, DailySales, DailyProductSales
+from archive import hot_since
+from money import to_amount
+
+# Per-day sales totals, updated inside the checkout commit so reports never
+# have to scan the transaction history. Amounts are integer cents (see money.py),
+# so the upserts and SUMs are exact; the reports convert them to currency units.
+
+_daily = DailySales.__table__
+_daily_product = DailyProductSales.__table__
+
+
+def day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def day_end(day):
+    """Exclusive upper bound for a timestamp falling on day."""
+    return day_start(day + timedelta(days=1))
+
+
+def record_sale(when, total_amount, items):
+    """Add one sale to the rollups; runs in the caller's transaction."""
+    record_sales([(when, total_amount, items)])
+
+
+def record_sales(sales):
+    """Add [(when, total_amount, items)] to the rollups with one upsert per table; items are priced lines
+    (see checkout.price_sale), whose subtotals are net of discounts."""
+    days, lines = {}, {}
+    for when, total_amount, items in sales:
+        day = when.date()
+        total, count = days.get(day, (0, 0))
+        days[day] = (total + (total_amount or 0), count + 1)
+        for item in items:
+            quantity, revenue = lines.get((day, item['product_id']), (0, 0))
+            lines[day, item['product_id']] = (quantity + item['quantity'], revenue + item['subtotal'])
+    if not days:
+        return
+
+    stmt = sqlite_insert(_daily)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=['sales_date'],
+            set_={
+                'total_sales': _daily.c.total_sales + stmt.excluded.total_sales,
+                'transaction_count': _daily.c.transaction_count + stmt.excluded.transaction_count
+            }
+        ),
+        [
+            {'sales_date': day, 'total_sales': total, 'transaction_count': count}
+            for day, (total, count) in days.items()
+        ]
+    )
+    stmt = sqlite_insert(_daily_product)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=['sales_date', 'product_id'],
+            set_={
+                'quantity_sold': _daily_product.c.quantity_sold + stmt.excluded.quantity_sold,
+                'revenue': _daily_product.c.revenue + stmt.excluded.revenue
+            }
+        ),
+        [
+            {'sales_date': day, 'product_id': product_id, 'quantity_sold': quantity, 'revenue': revenue}
+            for (day, product_id), (quantity, revenue) in lines.items()
+        ]
+    )
+
+
+def rebuild_rollups(start=None, end=None):
+    """Recompute the rollups from the raw history, for every day or for start..end inclusive.
+
+    Days in archived months are left alone: their raw rows are no longer in the hot tables.
+    """
+    horizon = hot_since()
+    if horizon and (start is None or start < horizon):
+        start = horizon
+    day = func.date(Transaction.date_time)
+    daily_delete = db.delete(DailySales)
+    product_delete = db.delete(DailyProductSales)
+    totals = (
+        select(day, func.coalesce(func.sum(Transaction.total_amount), 0), func.count())
+        .where(Transaction.date_time.isnot(None))
+        .group_by(day)
+    )
+    lines = (
+        select(day, TransactionDetail.product_id,
+               func.coalesce(func.sum(TransactionDetail.quantity), 0),
+               func.coalesce(func.sum(TransactionDetail.subtotal), 0))
+        .join(Transaction, Transaction.transaction_id == TransactionDetail.transaction_id)
+        .where(TransactionDetail.product_id.isnot(None), Transaction.date_time.isnot(None))
+        .group_by(day, TransactionDetail.product_id)
+    )
+    if start:
+        daily_delete = daily_delete.where(DailySales.sales_date >= start)
+        product_delete = product_delete.where(DailyProductSales.sales_date >= start)
+        totals = totals.where(Transaction.date_time >= day_start(start))
+        lines = lines.where(Transaction.date_time >= day_start(start))
+    if end:
+        daily_delete = daily_delete.where(DailySales.sales_date <= end)
+        product_delete = product_delete.where(DailyProductSales.sales_date <= end)
+        totals = totals.where(Transaction.date_time < day_end(end))
+        lines = lines.where(Transaction.date_time < day_end(end))
+
+    db.session.execute(daily_delete)
+    db.session.execute(product_delete)
+    db.session.execute(_daily.insert().from_select(
+        ['sales_date', 'total_sales', 'transaction_count'], totals))
+    db.session.execute(_daily_product.insert().from_select(
+        ['sales_date', 'product_id', 'quantity_sold', 'revenue'], lines))
+    db.session.commit()
+    return db.session.query(func.count()).select_from(DailySales).scalar()
+
+
+def sales_summary(start, end):
+    """Totals for start..end inclusive, read from the rollup (one row per day)."""
+    total_sales, transactions = db.session.query(
+        func.coalesce(func.sum(DailySales.total_sales), 0),
+        func.coalesce(func.sum(DailySales.transaction_count), 0)
+    ).filter(DailySales.sales_date >= start, DailySales.sales_date <= end).one()
+    return total_sales, transactions
+
+
+def daily_breakdown(start, end):
+    rows = DailySales.query.filter(
+        DailySales.sales_date >= start, DailySales.sales_date <= end
+    ).order_by(DailySales.sales_date).all()
+    return [
+        {'date': str(r.sales_date), 'total_sales': to_amount(r.total_sales), 'transactions': r.transaction_count}
+        for r in rows
+    ]
+
+
+def top_products(start=None, end=None, limit=10):
+    """[(product_name, quantity_sold, revenue)] ranked by units sold over the range."""
+    quantity = func.sum(DailyProductSales.quantity_sold)
+    query = db.session.query(
+        Product.product_name, quantity, func.sum(DailyProductSales.revenue)
+    ).join(Product, Product.product_id == DailyProductSales.product_id)
+    if start:
+        query = query.filter(DailyProductSales.sales_date >= start)
+    if end:
+        query = query.filter(DailyProductSales.sales_date <= end)
+    return query.group_by(DailyProductSales.product_id).order_by(quantity.desc()).limit(limit).all()
+
+
+def range_report(start, end):
+    total_sales, transactions = sales_summary(start, end)
+    return {
+        'start': str(start),
+        'end': str(end),
+        'total_sales': to_amount(total_sales),
+        'transactions': transactions,
+        'days': daily_breakdown(start, end)
+    }
+
+
+def product_report(start, end, limit=10):
+    products = [
+        {'product_name': name, 'quantity_sold': quantity, 'revenue': to_amount(revenue)}
+        for name, quantity, revenue in top_products(start, end, limit)
+    ]
+    return {'start': str(start), 'end': str(end), 'products': products}
+
+
+def month_bounds(day):
+    first = day.replace(day=1)
+    next_month = (first + timedelta(days=32)).replace(day=1)
+    return first, next_month - timedelta(days=1)
+
+
+rollups_cli = AppGroup('rollups', help='Maintain the pre-aggregated sales rollups.')
+
+
+@rollups_cli.command('rebuild')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to rebuild (inclusive).')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to rebuild (inclusive).')
+def rebuild_command(start, end):
+    """Repair the daily rollups from the transaction history."""
+    days = rebuild_rollups(start.date() if start else None, end.date() if end else None)
+    click.echo(f'Rollups rebuilt ({days} day rows in table).')
@@ -1,20 +1,84 @@
-from flask import request, jsonify, render_template, session, redirect, url_for
-from models import db, User, Product, Category, Transaction, TransactionDetail, Payment, InventoryLog
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import date
+from flask import request, jsonify, render_template, session, redirect, url_for, stream_with_context, send_from_directory
+from models import (
+    db, User, Product, Category, Transaction, TransactionDetail, Payment, InventoryLog, DailySales, Job, ArchivedPeriod
+)
+from checkout import process_checkout, sync_sales, CheckoutError, SYNC_MAX_SALES
+from stock import decrement_stock, adjust_stock, run_with_retry, OutOfStockError
+from rollups import sales_summary, top_products, month_bounds, range_report, product_report
+from datetime import date, timedelta
 from sqlalchemy import func
-
+from sqlalchemy.exc import IntegrityError
+from cache import dashboard_cache, catalog_cache, analytics_cache, receipt_cache
+from catalog import (
+    get_product, find_by_name, products_in_category, product_list_snapshot, category_list_snapshot, PRODUCT_COLUMNS
+)
+from product_search import code_index, search_products, normalize_code
+from product_io import FORMATS, import_format, read_rows, import_products, iter_export
+from ledger import ledger_query, find_drift
+from jobs import job_runner, serialize_job
+from forecast import update_velocity, reorder_query, serialize_reorder, low_stock_query
+from analytics import sales_analytics, validate_args, AnalyticsError
+from metrics import metrics
+from auth import auth, AuthError
+from journal import inventory_journal
+from events import event_bus, sse_stream
+import stores
+from stores import store_report
+from sharding import current_store
+from archive import hot_since, serialize_period
+from money import MoneyError, to_cents, to_amount, amount_column, format_amount
+from receipts import (
+    FORMATS as RECEIPT_FORMATS, BATCH_FORMATS, ReceiptError, validate_format, get_receipt, iter_receipts
+)
+from serialization import install_json_provider, column_names, records, columnar
+from listing import (
+    ListArgsError, MAX_PAGE_SIZE, int_arg, date_arg, parse_page_args, filter_int, filter_date_range,
+    keyset_page, iter_keyset_batches, ndjson_response, wants_ndjson, wants_columnar
+)
 
 
 def initialize_routes(app):
 
+    catalog_cache.max_entries = app.config.get('CATALOG_CACHE_MAX_ENTRIES', catalog_cache.max_entries)
+    install_json_provider(app)
+    job_runner.init_app(app)
+    metrics.init_app(app)
+    stores.init_app(app)
+    auth.init_app(app)
+    inventory_journal.init_app(app)
+    event_bus.init_app(app)
+    app.jinja_env.filters['amount'] = format_amount  # cents -> '1,234.50'
+
+    def wants_async():
+        return request.args.get('async') in ('1', 'true')
+
+    def job_accepted(job):
+        # 202 + Location: poll /jobs/<id>, then download /jobs/<id>/result
+        response = jsonify(serialize_job(db.session.get(Job, job.job_id)))
+        response.status_code = 202
+        response.headers['Location'] = url_for('get_job', job_id=job.job_id)
+        return response
+
+    def cached_json_response(body, etag):
+        # Terminals send If-None-Match with the last ETag and get a bodiless 304 when nothing changed
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    def list_response(columns, rows, next_cursor=None):
+        # Plain list by default, ?format=columnar for column arrays; the cursor goes in X-Next-Cursor
+        response = jsonify(columnar(columns, rows) if wants_columnar(request) else records(columns, rows))
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+        return response
+
     # ---------------- Users ----------------
     @app.route('/users', methods=['POST'])
     def create_user():
         data = request.get_json()
         if not data or 'username' not in data or 'password' not in data or 'role' not in data:
             return jsonify({'error': 'username, password, and role are required'}), 400
-        hashed_password = generate_password_hash(data['password'])
+        hashed_password = auth.hash_password(data['password'])
         user = User(username=data['username'], password=hashed_password, role=data['role'])
         db.session.add(user)
         db.session.commit()
@@ -22,9 +86,8 @@ def initialize_routes(app):
 
     @app.route('/users', methods=['GET'])
     def get_users():
-        users = User.query.all()
-        result = [{'user_id': u.user_id, 'username': u.username, 'role': u.role} for u in users]
-        return jsonify(result)
+        columns = (User.user_id, User.username, User.role)
+        return list_response(columns, db.session.query(*columns).all())
 
     # --- Admin UI User CRUD ---
     @app.route('/admin/users/add', methods=['POST'])
@@ -32,7 +95,7 @@ def initialize_routes(app):
         username = request.form['username']
         password = request.form['password']
         role = request.form['role']
-        hashed_password = generate_password_hash(password)
+        hashed_password = auth.hash_password(password)
         user = User(username=username, password=hashed_password, role=role)
         db.session.add(user)
         db.session.commit()
@@ -48,7 +111,7 @@ def initialize_routes(app):
         if user:
             user.username = username
             if password:
-                user.password = generate_password_hash(password)
+                user.password = auth.hash_password(password)
             user.role = role
             db.session.commit()
         return redirect(url_for('admin_dashboard'))
@@ -72,9 +135,8 @@ def initialize_routes(app):
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        categories = Category.query.all()
-        result = [{'category_id': c.category_id, 'category_name': c.category_name} for c in categories]
-        return jsonify(result)
+        body, etag = category_list_snapshot()
+        return cached_json_response(body, etag)
 
     # --- Admin UI Category CRUD ---
     @app.route('/admin/categories/add', methods=['POST'])
@@ -107,15 +169,25 @@ def initialize_routes(app):
     @app.route('/products', methods=['POST'])
     def create_product():
         data = request.get_json()
+        try:
+            price = to_cents(data.get('price'), 'price')
+        except MoneyError as e:
+            return jsonify({'error': str(e)}), 400
         product = Product(
             product_name=data['product_name'],
             category_id=data.get('category_id'),
-            price=data['price'],
+            price=price,
             stock_quantity=data.get('stock_quantity', 0),
-            unit=data.get('unit', 'pcs')
+            unit=data.get('unit', 'pcs'),
+            sku=normalize_code(data.get('sku')),
+            barcode=normalize_code(data.get('barcode'))
         )
         db.session.add(product)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'SKU or barcode already in use'}), 409
         # Add inventory log for initial stock
         if product.stock_quantity > 0:
             log = InventoryLog(
@@ -130,25 +202,86 @@ def initialize_routes(app):
 
     @app.route('/products', methods=['GET'])
     def get_products():
-        products = Product.query.all()
-        result = []
-        for p in products:
-            result.append({
-                'product_id': p.product_id,
-                'product_name': p.product_name,
-                'category_id': p.category_id,
-                'price': p.price,
-                'stock_quantity': p.stock_quantity,
-                'unit': p.unit
-            })
+        # ?category_id=<id> or ?name=<exact name, case-insensitive> narrow the list
+        try:
+            category_id = int_arg(request.args, 'category_id')
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        if category_id is not None:
+            products = products_in_category(category_id)
+        elif request.args.get('name'):
+            products = find_by_name(request.args['name'])
+        else:
+            body, etag = product_list_snapshot('columnar' if wants_columnar(request) else 'records')
+            return cached_json_response(body, etag)
+        if wants_columnar(request):
+            names = column_names(PRODUCT_COLUMNS)
+            response = jsonify(columnar(names, [[p[name] for name in names] for p in products]))
+        else:
+            response = jsonify(products)
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route('/products/<int:product_id>', methods=['GET'])
+    def get_product_by_id(product_id):
+        product = get_product(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        return jsonify(product)
+
+    @app.route('/products/lookup', methods=['GET'])
+    def lookup_product():
+        # Scanner path: ?code=<barcode or SKU>, exact match
+        code = normalize_code(request.args.get('code'))
+        if not code:
+            return jsonify({'error': "'code' is required"}), 400
+        product = code_index.lookup(code)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        return jsonify(product)
+
+    @app.route('/products/search', methods=['GET'])
+    def search_product_names():
+        # Manual entry: ?q=<part of the name>&limit=<n>
+        try:
+            limit = min(int_arg(request.args, 'limit', default=20, minimum=1), 100)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(search_products(request.args.get('q', ''), limit))
+
+    @app.route('/products/import', methods=['POST'])
+    def import_product_file():
+        # Multipart upload in 'file', or the raw body; ?format=csv|ndjson when it cannot be guessed
+        upload = request.files.get('file')
+        try:
+            fmt = import_format(request.args.get('format'), upload.filename if upload else None, request.mimetype)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        result = import_products(read_rows(upload.stream if upload else request.stream, fmt))
         return jsonify(result)
 
+    @app.route('/products/export', methods=['GET'])
+    def export_product_file():
+        # ?format=csv|ndjson; ?async=1 writes the file in a background job instead of streaming it
+        fmt = request.args.get('format', 'csv')
+        if fmt not in FORMATS:
+            return jsonify({'error': f"format must be one of: {', '.join(FORMATS)}"}), 400
+        if wants_async():
+            return job_accepted(job_runner.submit('products.export', {'format': fmt}))
+        return app.response_class(
+            stream_with_context(iter_export(fmt)), mimetype=FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename=products.{fmt}'}
+        )
+
     # --- Admin UI Product CRUD ---
     @app.route('/admin/products/add', methods=['POST'])
     def admin_add_product():
         product_name = request.form['product_name']
         category_id = request.form['category_id']
-        price = request.form['price']
+        try:
+            price = to_cents(request.form['price'], 'price')
+        except MoneyError as e:
+            return str(e), 400
         stock_quantity = request.form['stock_quantity']
         unit = request.form['unit']
         product = Product(
@@ -156,10 +289,16 @@ def initialize_routes(app):
             category_id=category_id,
             price=price,
             stock_quantity=stock_quantity,
-            unit=unit
+            unit=unit,
+            sku=normalize_code(request.form.get('sku')),
+            barcode=normalize_code(request.form.get('barcode'))
         )
         db.session.add(product)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return "SKU or barcode already in use", 409
         # Add inventory log for initial stock
         if int(stock_quantity) > 0:
             log = InventoryLog(
@@ -175,14 +314,43 @@ def initialize_routes(app):
     @app.route('/admin/products/edit', methods=['POST'])
     def admin_edit_product():
         product_id = request.form['product_id']
-        product = Product.query.get(product_id)
-        if product:
+        try:
+            price = to_cents(request.form['price'], 'price')
+        except MoneyError as e:
+            return str(e), 400
+        stock = int(request.form['stock_quantity'])
+        shown = request.form.get('stock_quantity_was')
+        store_id, terminal_id = stores.origin()
+
+        def work():
+            product = Product.query.get(product_id)
+            if product is None:
+                return
+            product.price = price
             product.product_name = request.form['product_name']
             product.category_id = request.form['category_id']
-            product.price = request.form['price']
-            product.stock_quantity = request.form['stock_quantity']
             product.unit = request.form['unit']
+            product.sku = normalize_code(request.form.get('sku'))
+            product.barcode = normalize_code(request.form.get('barcode'))
+            # Relative to the stock the form showed, so sales made since it opened are kept
+            delta = stock - (int(shown) if shown else product.stock_quantity)
+            if delta:
+                adjust_stock(product.product_id, delta)
+                db.session.add(InventoryLog(
+                    product_id=product.product_id,
+                    change_type='adjustment',
+                    quantity_change=delta,
+                    remarks='Stock edited with the product',
+                    store_id=store_id,
+                    terminal_id=terminal_id
+                ))
             db.session.commit()
+
+        try:
+            run_with_retry(work)
+        except IntegrityError:
+            db.session.rollback()
+            return "SKU or barcode already in use", 409
         return redirect(url_for('admin_dashboard'))
 
     @app.route('/admin/products/delete/<int:product_id>', methods=['POST'])
@@ -190,7 +358,12 @@ def initialize_routes(app):
         product = Product.query.get(product_id)
         if product:
             db.session.delete(product)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # foreign_keys=ON: transaction_detail rows still reference it
+                db.session.rollback()
+                return "Cannot delete product: it has recorded sales", 409
         return redirect(url_for('admin_dashboard'))
 
     # ---------------- Transactions ----------------
@@ -200,115 +373,226 @@ def initialize_routes(app):
         # --- Add validation ---
         if not data or 'user_id' not in data or 'payment_method' not in data or 'total_amount' not in data or 'items' not in data:
             return jsonify({'error': 'Missing required fields'}), 400
-        if not isinstance(data['items'], list) or len(data['items']) == 0:
-            return jsonify({'error': 'Items must be a non-empty list'}), 400
         # --- End validation ---
         try:
-            transaction = Transaction(
-                user_id=data['user_id'],
-                payment_method=data['payment_method'],
-                total_amount=data['total_amount']
-            )
-            db.session.add(transaction)
-            db.session.commit()
-
-            for item in data['items']:
-                # Validate item fields
-                if 'product_id' not in item or 'quantity' not in item or 'price' not in item:
-                    return jsonify({'error': 'Each item must have product_id, quantity, and price'}), 400
-                detail = TransactionDetail(
-                    transaction_id=transaction.transaction_id,
-                    product_id=item['product_id'],
-                    quantity=item['quantity'],
-                    price=item['price'],
-                    subtotal=item['quantity'] * item['price']
-                )
-                db.session.add(detail)
-                product = Product.query.get(item['product_id'])
-                if not product:
-                    return jsonify({'error': f"Product ID {item['product_id']} not found"}), 400
-                if product.stock_quantity < item['quantity']:
-                    return jsonify({'error': f"Not enough stock for product {product.product_name}"}), 400
-                product.stock_quantity -= item['quantity']
-                # Add inventory log for deduction
-                log = InventoryLog(
-                    product_id=product.product_id,
-                    change_type='Sale',
-                    quantity_change=-item['quantity'],
-                    remarks=f'Sold {item["quantity"]} during transaction {transaction.transaction_id}'
-                )
-                db.session.add(log)
-            db.session.commit()
-
-            payment = Payment(
-                transaction_id=transaction.transaction_id,
-                method=data['payment_method'],
-                amount=data['total_amount']
+            transaction = process_checkout(
+                data['user_id'],
+                data['payment_method'],
+                data['total_amount'],
+                data['items'],
+                # retries with the same key return the sale recorded the first time
+                request.headers.get('Idempotency-Key') or data.get('idempotency_key'),
+                data.get('discount')
             )
-            db.session.add(payment)
-            db.session.commit()
+            return jsonify({
+                'message': 'Transaction created successfully',
+                'transaction_id': transaction.transaction_id,
+                'total_amount': to_amount(transaction.total_amount),
+                'vat_amount': to_amount(transaction.vat_amount),
+                'receipt_url': url_for('get_transaction_receipt', transaction_id=transaction.transaction_id)
+            })
+        except CheckoutError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
 
-            return jsonify({'message': 'Transaction created successfully', 'transaction_id': transaction.transaction_id})
+    @app.route('/transactions/sync', methods=['POST'])
+    def sync_transactions():
+        # Offline terminals flush their queue here: {"sales": [{idempotency_key, user_id, payment_method,
+        # total_amount, items, discount?, date_time?}, ...]} -> one created/duplicate/rejected result per sale
+        data = request.get_json(silent=True)
+        sales = data.get('sales') if isinstance(data, dict) else None
+        if not isinstance(sales, list) or not sales:
+            return jsonify({'error': 'sales must be a non-empty list'}), 400
+        if len(sales) > SYNC_MAX_SALES:
+            return jsonify({'error': f'At most {SYNC_MAX_SALES} sales per batch'}), 413
+        try:
+            results = sync_sales(sales)
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
+        return jsonify({'results': results})
+
+    # Amounts in currency units, converted by SQLite (stored in cents, see money.py)
+    transaction_columns = (Transaction.transaction_id, Transaction.user_id, Transaction.payment_method,
+                           amount_column(Transaction.total_amount), amount_column(Transaction.discount_amount),
+                           amount_column(Transaction.vat_amount), Transaction.date_time)
+    transaction_item_columns = (TransactionDetail.product_id, TransactionDetail.quantity,
+                                amount_column(TransactionDetail.price), amount_column(TransactionDetail.discount),
+                                amount_column(TransactionDetail.subtotal))
+
+    def with_items(transactions):
+        # One IN (...) query for the line items of a whole page, appended to each header tuple
+        items = {t.transaction_id: [] for t in transactions}
+        details = db.session.query(TransactionDetail.transaction_id, *transaction_item_columns).filter(
+            TransactionDetail.transaction_id.in_(list(items))).order_by(TransactionDetail.detail_id)
+        for transaction_id, *item in details:
+            items[transaction_id].append(dict(zip(column_names(transaction_item_columns), item)))
+        return [(*t, items[t.transaction_id]) for t in transactions]
 
     @app.route('/transactions', methods=['GET'])
     def get_transactions():
-        transactions = Transaction.query.all()
-        users = User.query.filter(User.role.in_(["admin", "cashier"])).all() # added
-
-        result = []
-        for t in transactions:
-            items = []
-            for d in t.details:
-                items.append({
-                    'product_id': d.product_id,
-                    'quantity': d.quantity,
-                    'price': d.price,
-                    'subtotal': d.subtotal
-                })
-            result.append({
-                'transaction_id': t.transaction_id,
-                'user_id': t.user_id,
-                'payment_method': t.payment_method,
-                'total_amount': t.total_amount,
-                'date_time': t.date_time,
-                'items': items
-            })
-        return jsonify(result)
+        # ?after=<transaction_id>&limit=&start=&end=&user_id=&product_id=&payment_method=&format=ndjson
+        try:
+            after, limit = parse_page_args(request.args)
+            query = db.session.query(*transaction_columns)
+            query = filter_date_range(query, Transaction.date_time, request.args)
+            query = filter_int(query, Transaction.user_id, request.args, 'user_id')
+            product_id = int_arg(request.args, 'product_id')
+            if product_id is not None:
+                query = query.filter(Transaction.details.any(TransactionDetail.product_id == product_id))
+            if request.args.get('payment_method'):
+                query = query.filter(Transaction.payment_method == request.args['payment_method'])
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+
+        columns = transaction_columns + ('items',)
+        if wants_ndjson(request):
+            batches = iter_keyset_batches(query, Transaction.transaction_id, after)
+            return ndjson_response(row for batch in batches for row in records(columns, with_items(batch)))
+        transactions, next_cursor = keyset_page(query, Transaction.transaction_id, after, limit)
+        return list_response(columns, with_items(transactions), next_cursor)
+
+    # ---------------- Receipts ----------------
+    def receipt_args():
+        # ?format=text|escpos|html&width=<characters per line, text formats only>
+        return validate_format(request.args.get('format', 'text'), int_arg(request.args, 'width'))
+
+    @app.route('/transactions/<int:transaction_id>/receipt', methods=['GET'])
+    def get_transaction_receipt(transaction_id):
+        try:
+            fmt, width = receipt_args()
+        except (ListArgsError, ReceiptError) as e:
+            return jsonify({'error': str(e)}), 400
+        body = get_receipt(transaction_id, fmt, width)
+        if body is None:
+            return jsonify({'error': 'Transaction not found'}), 404
+        return app.response_class(body, mimetype=RECEIPT_FORMATS[fmt])
+
+    @app.route('/receipts', methods=['GET'])
+    def batch_receipts():
+        # End-of-day printing: every receipt in ?start=&end= (and ?user_id=), oldest first, as one stream
+        try:
+            fmt, width = receipt_args()
+            if fmt not in BATCH_FORMATS:
+                raise ReceiptError(f"'format' must be one of {', '.join(BATCH_FORMATS)}")
+            query = filter_date_range(db.session.query(Transaction.transaction_id), Transaction.date_time, request.args)
+            query = filter_int(query, Transaction.user_id, request.args, 'user_id')
+        except (ListArgsError, ReceiptError) as e:
+            return jsonify({'error': str(e)}), 400
+        separator = b'\n' if fmt == 'text' else b''  # ESC/POS receipts end with their own cut
+        return app.response_class(
+            stream_with_context(body + separator for body in iter_receipts(query, fmt, width)),
+            mimetype=RECEIPT_FORMATS[fmt]
+        )
 
     # ---------------- Inventory Logs ----------------
     @app.route('/inventory', methods=['POST'])
     def add_inventory_log():
         data = request.get_json()
-        log = InventoryLog(
-            product_id=data['product_id'],
-            change_type=data['change_type'],
-            quantity_change=data['quantity_change'],
-            remarks=data.get('remarks', '')
-        )
-        db.session.add(log)
-        product = Product.query.get(data['product_id'])
-        product.stock_quantity += data['quantity_change']
-        db.session.commit()
+        store_id, terminal_id = stores.origin()
+
+        def work():
+            log = InventoryLog(
+                product_id=data['product_id'],
+                change_type=data['change_type'],
+                quantity_change=data['quantity_change'],
+                remarks=data.get('remarks', ''),
+                store_id=store_id,
+                terminal_id=terminal_id
+            )
+            db.session.add(log)
+            if data['quantity_change'] < 0:
+                decrement_stock({data['product_id']: -data['quantity_change']})
+            else:
+                adjust_stock(data['product_id'], data['quantity_change'])
+            db.session.commit()
+
+        try:
+            run_with_retry(work)
+        except OutOfStockError:
+            db.session.rollback()
+            return jsonify({'error': 'Not enough stock for this adjustment'}), 400
         return jsonify({'message': 'Inventory log added'})
 
+    inventory_log_columns = (InventoryLog.log_id, InventoryLog.product_id, Product.product_name,
+                             InventoryLog.change_type, InventoryLog.quantity_change, InventoryLog.remarks,
+                             InventoryLog.date_time)
+
     @app.route('/inventory', methods=['GET'])
     def get_inventory_logs():
-        logs = InventoryLog.query.all()
-        result = []
-        for l in logs:
-            result.append({
-                'log_id': l.log_id,
-                'product_id': l.product_id,
-                'product_name': l.product.product_name if l.product else None,
-                'change_type': l.change_type,
-                'quantity_change': l.quantity_change,
-                'remarks': l.remarks,
-                'date_time': l.date_time
-            })
-        return jsonify(result)
+        # ?after=<log_id>&limit=&start=&end=&product_id=&change_type=&format=ndjson
+        try:
+            after, limit = parse_page_args(request.args)
+            query = db.session.query(*inventory_log_columns).outerjoin(
+                Product, Product.product_id == InventoryLog.product_id)
+            query = filter_date_range(query, InventoryLog.date_time, request.args)
+            query = filter_int(query, InventoryLog.product_id, request.args, 'product_id')
+            if request.args.get('change_type'):
+                query = query.filter(InventoryLog.change_type == request.args['change_type'])
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if wants_ndjson(request):
+            batches = iter_keyset_batches(query, InventoryLog.log_id, after)
+            return ndjson_response(row for batch in batches for row in records(inventory_log_columns, batch))
+        logs, next_cursor = keyset_page(query, InventoryLog.log_id, after, limit)
+        return list_response(inventory_log_columns, logs, next_cursor)
+
+    # Ledger checks: the sum of the logs should always equal Product.stock_quantity, see ledger.py
+    @app.route('/inventory/drift', methods=['GET'])
+    def inventory_drift():
+        drift = find_drift()
+        return jsonify({'drifting': len(drift), 'products': drift})
+
+    # Reorder list from sales velocity, see forecast.py
+    @app.route('/inventory/reorder', methods=['GET'])
+    def inventory_reorder():
+        # ?limit=50&category_id=<id>; most urgent (fewest days of cover) first
+        try:
+            limit = min(int_arg(request.args, 'limit', default=50, minimum=1), MAX_PAGE_SIZE)
+            category_id = int_arg(request.args, 'category_id')
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        run_with_retry(update_velocity)
+        return jsonify([serialize_reorder(row) for row in reorder_query(category_id).limit(limit)])
+
+    @app.route('/admin/forecast/rebuild', methods=['POST'])
+    def admin_rebuild_forecast():
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return job_accepted(job_runner.submit('forecast.rebuild'))
+
+    @app.route('/inventory/ledger', methods=['GET'])
+    def inventory_ledger():
+        # ?product_id=<id>&as_of=YYYY-MM-DD (end of that day); all products when product_id is omitted
+        try:
+            product_id = int_arg(request.args, 'product_id')
+            as_of = date_arg(request.args, 'as_of')
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        before = as_of + timedelta(days=1) if as_of else None
+        horizon = hot_since()
+        if before and horizon and before.date() < horizon:
+            # The logs of archived months are only kept as one balance row per product
+            return jsonify({'error': f'Ledger history before {horizon} is archived'}), 400
+        rows = ledger_query(None if product_id is None else [product_id], before).all()
+        if product_id is not None and not rows:
+            return jsonify({'error': 'Product not found'}), 404
+        return list_response(('product_id', 'product_name', 'ledger_quantity'), rows)
+
+    @app.route('/admin/inventory/reconcile', methods=['POST'])
+    def admin_reconcile_inventory():
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return job_accepted(job_runner.submit('inventory.reconcile'))
+
+    @app.route('/admin/inventory/snapshot', methods=['POST'])
+    def admin_snapshot_inventory():
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return job_accepted(job_runner.submit('ledger.snapshot'))
 
     # --- Admin UI InventoryLog CRUD ---
     @app.route('/admin/inventory/edit', methods=['POST'])
@@ -318,104 +602,353 @@ def initialize_routes(app):
         change_type = request.form['change_type']
         quantity_change = int(request.form['quantity_change'])
         remarks = request.form.get('remarks', '')
-        log = InventoryLog.query.get(log_id)
-        if log:
-            # Adjust product stock based on previous log value
-            product = Product.query.get(log.product_id)
-            if product:
-                product.stock_quantity -= log.quantity_change
-            # Update log fields
-            log.product_id = product_id
-            log.change_type = change_type
-            log.quantity_change = quantity_change
-            log.remarks = remarks
-            # Adjust product stock for new value
-            product = Product.query.get(product_id)
-            if product:
-                product.stock_quantity += quantity_change
-            db.session.commit()
+
+        def work():
+            log = InventoryLog.query.get(log_id)
+            if log:
+                # Undo the previous log value, then apply the new one
+                adjust_stock(log.product_id, -log.quantity_change)
+                log.product_id = product_id
+                log.change_type = change_type
+                log.quantity_change = quantity_change
+                log.remarks = remarks
+                adjust_stock(product_id, quantity_change)
+                db.session.commit()
+
+        run_with_retry(work)
         return redirect(url_for('admin_dashboard'))
 
     @app.route('/admin/inventory/delete/<int:log_id>', methods=['POST'])
     def admin_delete_inventory_log(log_id):
-        log = InventoryLog.query.get(log_id)
-        if log:
-            product = Product.query.get(log.product_id)
-            if product:
-                product.stock_quantity -= log.quantity_change
-            db.session.delete(log)
-            db.session.commit()
+        def work():
+            log = InventoryLog.query.get(log_id)
+            if log:
+                adjust_stock(log.product_id, -log.quantity_change)
+                db.session.delete(log)
+                db.session.commit()
+
+        run_with_retry(work)
         return redirect(url_for('admin_dashboard'))
 
     # ---------------- Reports ----------------
+    # Served from the DailySales/DailyProductSales rollups, see rollups.py
     @app.route('/reports/daily', methods=['GET'])
     def daily_report():
         today = date.today()
-        transactions = Transaction.query.filter(db.func.date(Transaction.date_time) == today).all()
-        total_sales = sum([t.total_amount for t in transactions])
-        return jsonify({'date': str(today), 'total_sales': total_sales, 'transactions': len(transactions)})
+        row = db.session.get(DailySales, today)
+        total_sales = row.total_sales if row else 0
+        transactions = row.transaction_count if row else 0
+        return jsonify({'date': str(today), 'total_sales': to_amount(total_sales), 'transactions': transactions})
 
     @app.route('/reports/monthly', methods=['GET'])
     def monthly_report():
         today = date.today()
-        month = today.month
-        year = today.year
-        transactions = Transaction.query.filter(
-            db.extract('month', Transaction.date_time) == month,
-            db.extract('year', Transaction.date_time) == year
-        ).all()
-        total_sales = sum([t.total_amount for t in transactions])
-        return jsonify({'month': month, 'year': year, 'total_sales': total_sales, 'transactions': len(transactions)})
+        total_sales, transactions = sales_summary(*month_bounds(today))
+        return jsonify({'month': today.month, 'year': today.year, 'total_sales': to_amount(total_sales),
+                        'transactions': transactions})
+
+    def report_range():
+        start = date_arg(request.args, 'start')
+        end = date_arg(request.args, 'end')
+        if not start or not end:
+            raise ListArgsError("'start' and 'end' are required")
+        if end < start:
+            raise ListArgsError("'end' must not be before 'start'")
+        return start.date(), end.date()
+
+    # ?async=1 on the range reports runs them as a background job (see jobs.py)
+    @app.route('/reports/range', methods=['GET'])
+    def get_range_report():
+        # ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive)
+        try:
+            start, end = report_range()
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        if wants_async():
+            return job_accepted(job_runner.submit('report.range', {'start': str(start), 'end': str(end)}))
+        return jsonify(range_report(start, end))
+
+    @app.route('/reports/products', methods=['GET'])
+    def get_product_report():
+        # ?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=10
+        try:
+            start, end = report_range()
+            limit = min(int_arg(request.args, 'limit', default=10, minimum=1), MAX_PAGE_SIZE)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        if wants_async():
+            return job_accepted(job_runner.submit(
+                'report.products', {'start': str(start), 'end': str(end), 'limit': limit}))
+        return jsonify(product_report(start, end, limit))
+
+    @app.route('/reports/analytics', methods=['GET'])
+    def get_sales_analytics():
+        # ?start=&end=&metrics=top,abc,heatmap,baskets,categories&by=revenue|units&limit=10
+        try:
+            start, end = report_range()
+            limit = min(int_arg(request.args, 'limit', default=10, minimum=1), MAX_PAGE_SIZE)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        by = request.args.get('by', 'revenue')
+        try:
+            metrics = validate_args(start, end, [name for name in request.args.get('metrics', '').split(',') if name], by)
+        except AnalyticsError as e:
+            return jsonify({'error': str(e)}), 400
+        if wants_async():
+            return job_accepted(job_runner.submit('report.analytics', {
+                'start': str(start), 'end': str(end), 'metrics': metrics, 'by': by, 'limit': limit}))
+        return jsonify(sales_analytics(start, end, metrics, by, limit))
+
+    @app.route('/admin/rollups/rebuild', methods=['POST'])
+    def admin_rebuild_rollups():
+        # Optional ?start=&end= (inclusive) limit the rebuild to a date range
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        try:
+            start = date_arg(request.args, 'start')
+            end = date_arg(request.args, 'end')
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        return job_accepted(job_runner.submit('rollups.rebuild', {
+            'start': str(start.date()) if start else None,
+            'end': str(end.date()) if end else None
+        }))
+
+    # ---------------- Stores ----------------
+    # Chain-wide figures from the head office's consolidated copy of every store's rollups, see stores.py
+    @app.route('/reports/stores', methods=['GET'])
+    def get_store_report():
+        # ?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=10
+        try:
+            start, end = report_range()
+            limit = min(int_arg(request.args, 'limit', default=10, minimum=1), MAX_PAGE_SIZE)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        if current_store() is not None:
+            return jsonify({'error': 'Store reports are served by the head office; omit X-Store-Id'}), 400
+        return jsonify(store_report(start, end, limit))
+
+    @app.route('/admin/stores/consolidate', methods=['POST'])
+    def admin_consolidate_stores():
+        # Optional ?start=&end= (inclusive) limit the merge to a date range
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        try:
+            start = date_arg(request.args, 'start')
+            end = date_arg(request.args, 'end')
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        return job_accepted(job_runner.submit('stores.consolidate', {
+            'start': str(start.date()) if start else None,
+            'end': str(end.date()) if end else None
+        }))
+
+    # ---------------- Archive ----------------
+    # Closed months moved out of the hot tables, see archive.py
+    @app.route('/admin/archive', methods=['GET'])
+    def list_archived_periods():
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        periods = ArchivedPeriod.query.order_by(ArchivedPeriod.month).all()
+        return jsonify({'periods': [serialize_period(p) for p in periods], 'hot_since': hot_since()})
+
+    @app.route('/admin/archive/run', methods=['POST'])
+    def admin_run_archive():
+        # Archives every month older than ARCHIVE_AFTER_MONTHS, then reclaims the freed pages
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return job_accepted(job_runner.submit('archive.run'))
+
+    # ---------------- Jobs ----------------
+    @app.route('/jobs/<int:job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(serialize_job(job))
+
+    @app.route('/jobs/<int:job_id>/result', methods=['GET'])
+    def get_job_result(job_id):
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        if job.status != 'done':
+            return jsonify({'error': f'Job is {job.status}', 'job': serialize_job(job)}), 409
+        return send_from_directory(
+            app.config['JOB_RESULTS_DIR'], job.result_file, mimetype=job.result_mimetype,
+            as_attachment=job.result_mimetype != 'application/json',
+            download_name=f"{job.kind.replace('.', '-')}-{job.result_file}"
+        )
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        # Newest first; ?status=&after=<job_id>&limit=
+        try:
+            after, limit = parse_page_args(request.args)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        query = Job.query
+        if request.args.get('status'):
+            query = query.filter(Job.status == request.args['status'])
+        jobs, next_cursor = keyset_page(query, Job.job_id, after, limit, descending=True)
+        return jsonify({'jobs': [serialize_job(j) for j in jobs], 'next_cursor': next_cursor})
+
+    # ---------------- Live updates ----------------
+    @app.route('/events', methods=['GET'])
+    def event_stream():
+        # Server-Sent Events, see events.py. Resumes after the Last-Event-ID header (sent by
+        # EventSource on reconnect) or ?last_event_id=; ?store_id= stands in for X-Store-Id.
+        if auth.current_user_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        store = current_store()
+        if app.config.get('STORE_DATABASES') and request.args.get('store_id'):
+            store = request.args['store_id']
+            if store not in app.config['STORE_DATABASES']:
+                return jsonify({'error': f'Unknown store {store}'}), 400
+        if event_bus.clients >= app.config.get('EVENTS_MAX_CLIENTS', 200):
+            return jsonify({'error': 'Too many event streams'}), 503, {'Retry-After': '30'}
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        return app.response_class(
+            sse_stream(app, store, last_event_id), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}  # no proxy buffering
+        )
 
     # ---------------- Admin Dashboard ----------------
+    def dashboard_summary():
+        # Plain values only: the result is shared across requests through dashboard_cache
+        today = date.today()
+        event_id = event_bus.event_id(event_bus.latest())  # before the queries: the page replays what follows
+        run_with_retry(update_velocity)
+        low_stock = low_stock_query().all()  # the page needs every id, to keep the count right as events arrive
+        return {
+            'event_id': event_id,
+            'day': str(today),
+            'users': db.session.query(func.count(User.user_id)).scalar(),
+            'products': db.session.query(func.count(Product.product_id)).scalar(),
+            'transactions': sales_summary(date.min, date.max)[1],
+            'low_stock_count': len(low_stock),
+            'low_stock_ids': [product_id for product_id, *_ in low_stock],
+            'low_stock': [
+                (product_id, name, stock, None if cover is None else round(cover, 1))
+                for product_id, name, stock, cover in low_stock[:20]
+            ],
+            'top_products': [(name, quantity) for name, quantity, _ in top_products(limit=10)],
+            'daily_sales': to_amount(sales_summary(today, today)[0]),
+            'monthly_sales': to_amount(sales_summary(*month_bounds(today))[0])
+        }
+
     @app.route('/admin')
     def admin_dashboard():
-        if 'user_id' not in session:
+        if auth.current_admin_id() is None:
             return redirect(url_for('login'))
 
+        # First: a summary refresh may commit (velocity update), which would expire everything loaded before it
+        key = ('summary', current_store())
+        summary = dashboard_cache.get_or_set(key, dashboard_summary, ttl=app.config.get('DASHBOARD_CACHE_TTL', 30))
+        if not event_bus.resumable(summary['event_id']):
+            # The page could not catch up from this snapshot: take a new one
+            dashboard_cache.invalidate(key)
+            summary = dashboard_cache.get_or_set(key, dashboard_summary, ttl=app.config.get('DASHBOARD_CACHE_TTL', 30))
+        # Catalog tables stay server-rendered (the modals need them); the history tabs load from /admin/data/*
         users = User.query.all()
         products = Product.query.all()
-        transactions = Transaction.query.all()
-        inventory_logs = InventoryLog.query.all()
         categories = Category.query.all()
-        transaction_details = TransactionDetail.query.all()
-        payments = Payment.query.all()
-
-        # existing reports / summary cards
-        low_stock = Product.query.filter(Product.stock_quantity < 5).all()
-        from sqlalchemy import func
-        from datetime import date
-        today = date.today()
-        top_products = db.session.query(
-            Product.product_name,
-            func.sum(TransactionDetail.quantity)
-        ).join(TransactionDetail, Product.product_id == TransactionDetail.product_id
-        ).group_by(Product.product_id
-        ).order_by(func.sum(TransactionDetail.quantity).desc()
-        ).limit(10).all()
-        daily_sales = db.session.query(func.sum(Transaction.total_amount)).filter(db.func.date(Transaction.date_time) == today).scalar() or 0
-        month = today.month
-        year = today.year
-        monthly_sales = db.session.query(func.sum(Transaction.total_amount)).filter(
-            db.extract('month', Transaction.date_time) == month,
-            db.extract('year', Transaction.date_time) == year
-        ).scalar() or 0
 
         return render_template(
             'admin.html',
             users=users,
             products=products,
-            transactions=transactions,
-            inventory_logs=inventory_logs,
             categories=categories,
-            transaction_details=transaction_details,
-            payments=payments,
-            low_stock=low_stock,
-            top_products=top_products,
-            daily_sales=daily_sales,
-            monthly_sales=monthly_sales
+            summary=summary,
+            page_size=app.config.get('ADMIN_PAGE_SIZE', 50)
         )
 
+    def admin_transaction_row(t):
+        return {
+            'transaction_id': t.transaction_id,
+            'username': t.username or 'N/A',
+            'payment_method': t.payment_method,
+            'total_amount': to_amount(t.total_amount),
+            'date_time': t.date_time.strftime('%Y-%m-%d %H:%M:%S') if t.date_time else None
+        }
+
+    def admin_inventory_row(l):
+        return {
+            'log_id': l.log_id,
+            'product_id': l.product_id,
+            'product_name': l.product_name or 'N/A',
+            'change_type': l.change_type,
+            'quantity_change': l.quantity_change,
+            'remarks': l.remarks,
+            'date_time': l.date_time.strftime('%Y-%m-%d %H:%M:%S') if l.date_time else None
+        }
+
+    def admin_detail_row(d):
+        return {
+            'detail_id': d.detail_id,
+            'transaction_id': d.transaction_id,
+            'product_id': d.product_id,
+            'quantity': d.quantity,
+            'price': to_amount(d.price),
+            'discount': to_amount(d.discount),
+            'subtotal': to_amount(d.subtotal)
+        }
+
+    def admin_payment_row(p):
+        return {
+            'payment_id': p.payment_id,
+            'transaction_id': p.transaction_id,
+            'method': p.method,
+            'amount': to_amount(p.amount)
+        }
+
+    # Column tuples, not entities: the history tabs page through the largest tables
+    def admin_transactions():
+        return db.session.query(
+            Transaction.transaction_id, User.username, Transaction.payment_method, Transaction.total_amount,
+            Transaction.date_time
+        ).outerjoin(User, User.user_id == Transaction.user_id)
+
+    def admin_inventory():
+        return db.session.query(*inventory_log_columns).outerjoin(Product, Product.product_id == InventoryLog.product_id)
+
+    admin_tables = {
+        'transactions': (admin_transactions, Transaction.transaction_id, admin_transaction_row),
+        'inventory': (admin_inventory, InventoryLog.log_id, admin_inventory_row),
+        'transaction-details': (
+            lambda: db.session.query(TransactionDetail.detail_id, TransactionDetail.transaction_id,
+                                     TransactionDetail.product_id, TransactionDetail.quantity, TransactionDetail.price,
+                                     TransactionDetail.discount, TransactionDetail.subtotal),
+            TransactionDetail.detail_id, admin_detail_row),
+        'payments': (
+            lambda: db.session.query(Payment.payment_id, Payment.transaction_id, Payment.method, Payment.amount),
+            Payment.payment_id, admin_payment_row),
+    }
+
+    @app.route('/admin/data/<table>')
+    def admin_table_data(table):
+        # Newest first; ?after=<id of the last row shown>&limit=<n>
+        if auth.current_admin_id() is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        if table not in admin_tables:
+            return jsonify({'error': 'Unknown table'}), 404
+        query_factory, key, serialize = admin_tables[table]
+        try:
+            after, limit = parse_page_args(request.args)
+        except ListArgsError as e:
+            return jsonify({'error': str(e)}), 400
+        rows, next_cursor = keyset_page(query_factory(), key, after, limit, descending=True)
+        return jsonify({'rows': [serialize(r) for r in rows], 'next_cursor': next_cursor})
+
+    @app.route('/cache/stats')
+    def cache_stats():
+        return jsonify({'catalog': catalog_cache.stats(), 'analytics': analytics_cache.stats(),
+                        'receipts': receipt_cache.stats()})
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
     #------------------------------------------------------
     # Secret key for session
     app.secret_key = 'your-secret-key'
@@ -423,14 +956,13 @@ def initialize_routes(app):
     @app.route('/login', methods=['GET', 'POST'])
     def login():
         if request.method == 'POST':
-            username = request.form['username']
-            password = request.form['password']
-            user = User.query.filter_by(username=username).first()
-            if user and check_password_hash(user.password, password):
-                session['user_id'] = user.user_id
-                session['role'] = user.role  # Optionally store role in session
-                return redirect(url_for('admin_dashboard'))
-            return "Invalid credentials", 401
+            try:
+                user = auth.authenticate(request.form['username'], request.form['password'])
+            except AuthError as e:
+                return ("Invalid credentials" if e.status == 401 else str(e)), e.status, e.headers
+            session['user_id'] = user.user_id
+            session['role'] = user.role  # Optionally store role in session
+            return redirect(url_for('admin_dashboard'))
         return render_template('login.html')
 
     @app.route('/logout')
@@ -0,0 +1,68 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: without it the stdlib encoder is used
+    orjson = None
+
+# Serialization for list endpoints.
+#
+# List queries select only the columns they return (Core-style column tuples, no ORM
+# entities, no identity map) and turn each tuple into a dict with records(), or into
+# one array per column with columnar() for ?format=columnar, where every key is sent
+# once instead of once per row.
+#
+# FastJSONProvider encodes with orjson when it is installed and produces the same
+# JSON as Flask's provider (sorted keys, HTTP dates, Decimal as string).
+
+
+class FastJSONProvider(DefaultJSONProvider):
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME  # dates go through default()
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _encode(self, obj):
+        """UTF-8 JSON bytes, or None when orjson is missing or cannot encode obj (e.g. ints over 64 bits)."""
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        encoded = None if kwargs else self._encode(obj)
+        return super().dumps(obj, **kwargs) if encoded is None else encoded.decode()
+
+    def response(self, *args, **kwargs):
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        encoded = None if pretty else self._encode(self._prepare_response_obj(args, kwargs))
+        if encoded is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(encoded + b'\n', mimetype=self.mimetype)
+
+
+def install_json_provider(app):
+    if app.config.get('JSON_FAST_ENCODER', True):
+        app.json = FastJSONProvider(app)
+
+
+def column_names(columns):
+    """Names for selected columns; plain strings name values added to the row after the query."""
+    return [column if isinstance(column, str) else column.key for column in columns]
+
+
+def records(columns, rows):
+    """One dict per row tuple, keyed by the column names."""
+    names = column_names(columns)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def columnar(columns, rows):
+    """{'columns': [names], 'data': [[values of the first column], ...]}."""
+    names = column_names(columns)
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in names]
+    return {'columns': names, 'data': data}
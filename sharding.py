@@ -0,0 +1,65 @@
+import os
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+# Store sharding: with STORES configured, every store has its own SQLite database
+# (a SQLAlchemy bind named 'store:<id>') holding its copy of the catalog, its stock and
+# its sales, so stores write in parallel instead of queueing on one file. A request
+# selects its store with the X-Store-Id header (see stores.py) and the session sends
+# every statement there; without a store, statements go to the default (head-office)
+# database. Tables in HEAD_OFFICE_TABLES always live in the head office.
+
+HEAD_OFFICE_TABLES = {'job', 'store_daily_sales', 'store_daily_product_sales'}
+
+
+def store_bind_key(store_id):
+    return f'store:{store_id}'
+
+
+def configure_stores(app):
+    """Add a bind per store to SQLALCHEMY_BINDS; call before db.init_app."""
+    databases = dict(app.config.get('STORE_DATABASES') or {})
+    directory = app.config.get('STORE_DATABASE_DIR')
+    for store_id in app.config.get('STORES') or ():
+        databases.setdefault(store_id, 'sqlite:///' + os.path.join(directory, f'{store_id}.db'))
+    app.config['STORE_DATABASES'] = databases
+    if databases:
+        os.makedirs(directory, exist_ok=True)
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                          **{store_bind_key(s): uri for s, uri in databases.items()})
+
+
+def current_store():
+    """The store selected for this app context, or None for the head office."""
+    return g.get('store_id') if has_app_context() else None
+
+
+@contextmanager
+def store_context(store_id):
+    """Run the block against store_id's database (None: the head office); the caller owns the app context."""
+    from models import db
+    previous = g.get('store_id')
+    if store_id == previous:
+        yield
+        return
+    db.session.close()  # a session bound to one store must not carry over to the next
+    g.store_id = store_id
+    try:
+        yield
+    finally:
+        db.session.close()
+        g.store_id = previous
+
+
+class StoreSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        store_id = current_store() if bind is None else None
+        if store_id is not None:
+            table = sa.inspect(mapper).local_table if mapper is not None else getattr(clause, 'table', clause)
+            if getattr(table, 'name', None) not in HEAD_OFFICE_TABLES:
+                return self._db.engines[store_bind_key(store_id)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+from models import db
+
+
+def _pragma_statements(pragmas):
+    return [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+
+def configure_sqlite(app):
+    """Run the app's SQLITE_PRAGMAS on every new connection of its SQLite engines (one per store, see sharding.py)."""
+    statements = _pragma_statements(app.config.get('SQLITE_PRAGMAS') or {})
+    if not statements:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', set_sqlite_pragmas)
+
+
+def current_pragmas(names=('journal_mode', 'synchronous', 'busy_timeout', 'foreign_keys', 'cache_size', 'mmap_size')):
+    """Values actually in effect on a pooled connection, for diagnostics."""
+    return {name: db.session.execute(db.text(f'PRAGMA {name}')).scalar() for name in names}
@@ -0,0 +1,90 @@
+import random
+import time
+
+from sqlalchemy import update, bindparam
+from sqlalchemy.exc import OperationalError
+from models import db, Product
+
+# Every stock write goes through this module as a relative SQL update, so two
+# workers selling the same SKU can never overwrite each other's result.
+
+# session.info key collecting product ids whose stock changed; read after commit by catalog.py
+STOCK_TOUCHED = 'stock_touched'
+
+LOCK_RETRY_ATTEMPTS = 6
+LOCK_RETRY_BASE_DELAY = 0.02  # seconds, doubled on every attempt
+
+_product = Product.__table__
+
+_decrement_stmt = (
+    update(_product)
+    .where(_product.c.product_id == bindparam('pid'), _product.c.stock_quantity >= bindparam('qty'))
+    .values(stock_quantity=_product.c.stock_quantity - bindparam('qty'))
+)
+
+_adjust_stmt = (
+    update(_product)
+    .where(_product.c.product_id == bindparam('pid'))
+    .values(stock_quantity=_product.c.stock_quantity + bindparam('delta'))
+)
+
+
+class OutOfStockError(Exception):
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f"Not enough stock for product {product_id}")
+
+
+def is_database_locked(error):
+    return isinstance(error, OperationalError) and 'database is locked' in str(error.orig)
+
+
+def run_with_retry(work, attempts=None, base_delay=None):
+    """Run work() and retry with jittered exponential backoff while SQLite reports the database as locked.
+
+    work must be safe to re-run from scratch: the session is rolled back before every retry.
+    """
+    attempts = attempts or LOCK_RETRY_ATTEMPTS
+    base_delay = base_delay or LOCK_RETRY_BASE_DELAY
+    for attempt in range(attempts):
+        try:
+            return work()
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_database_locked(e) or attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def decrement_stock(quantities):
+    """Conditionally subtract {product_id: quantity}; raise OutOfStockError if any row would go negative.
+
+    Runs inside the caller's transaction, so the caller's rollback undoes partial decrements.
+    """
+    db.session.info.setdefault(STOCK_TOUCHED, set()).update(quantities)
+    params = [{'pid': product_id, 'qty': quantity} for product_id, quantity in quantities.items()]
+    if len(params) == 1:
+        if db.session.execute(_decrement_stmt, params[0]).rowcount != 1:
+            raise OutOfStockError(params[0]['pid'])
+        return
+    # One executemany for the basket; its rowcount is the number of rows that had enough stock.
+    # In a savepoint, so that a short basket can be undone to tell which product ran out.
+    savepoint = db.session.begin_nested()
+    if db.session.execute(_decrement_stmt, params).rowcount == len(params):
+        savepoint.commit()
+        return
+    savepoint.rollback()
+    stock = dict(db.session.query(Product.product_id, Product.stock_quantity)
+                 .filter(Product.product_id.in_(list(quantities))))
+    raise OutOfStockError(next(
+        (product_id for product_id, quantity in quantities.items() if (stock.get(product_id) or 0) < quantity),
+        params[0]['pid']
+    ))
+
+
+def adjust_stock(product_id, delta):
+    """Unconditionally add delta (positive or negative) to a product's stock."""
+    if product_id is None or not delta:
+        return
+    db.session.info.setdefault(STOCK_TOUCHED, set()).add(product_id)
+    db.session.execute(_adjust_stmt, {'pid': product_id, 'delta': delta})
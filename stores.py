@@ -0,0 +1,283 @@
+from datetime import datetime
+
+import click
+import sqlalchemy as sa
+from flask import current_app, g, jsonify, request
+from flask.cli import AppGroup
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import (
+    db, User, Category, Product, Transaction, DailySales, DailyProductSales, StoreDailySales, StoreDailyProductSales
+)
+from sharding import HEAD_OFFICE_TABLES, current_store, store_bind_key, store_context
+from cache import receipt_cache
+from product_search import ensure_search_index
+from stock import run_with_retry
+from money import to_amount, convert_to_cents
+
+# Stores and terminals (see sharding.py for the per-store databases).
+#
+# Every request may name its store and till with X-Store-Id / X-Terminal-Id; sales and
+# inventory logs are stamped with both. With STORES configured the store also selects
+# the database the request reads and writes, and must be one of STORES.
+#
+# The head office keeps the master catalog (users, categories, products), the job queue
+# and the consolidated per-store rollups: `flask stores init` creates the store databases
+# and copies the catalog into them, `flask stores consolidate` merges each store's daily
+# rollups into StoreDailySales / StoreDailyProductSales for chain-wide reports.
+#
+# Catalog changes made at the head office afterwards are pushed to every initialized
+# store right after they commit, so new cashiers and products work at the tills at once
+# and deleted users stop logging in there. If a push fails (a store database is down)
+# the error is logged and `flask stores init` brings the stores level again.
+
+STORE_ID_MAX_LENGTH = 20
+TERMINAL_ID_MAX_LENGTH = 50
+
+
+def store_ids():
+    return sorted(current_app.config.get('STORE_DATABASES') or ())
+
+
+def origin():
+    """(store_id, terminal_id) to stamp on the rows this request writes."""
+    return g.get('origin_store'), g.get('origin_terminal')
+
+
+def init_app(app):
+    @app.before_request
+    def _select_store():
+        store_id = request.headers.get('X-Store-Id') or None
+        terminal_id = request.headers.get('X-Terminal-Id') or None
+        sharded = bool(app.config.get('STORE_DATABASES'))
+        if store_id is not None:
+            if len(store_id) > STORE_ID_MAX_LENGTH:
+                return jsonify({'error': f'X-Store-Id must be at most {STORE_ID_MAX_LENGTH} characters'}), 400
+            if sharded and store_id not in app.config['STORE_DATABASES']:
+                return jsonify({'error': f'Unknown store {store_id}'}), 400
+        if terminal_id is not None and len(terminal_id) > TERMINAL_ID_MAX_LENGTH:
+            return jsonify({'error': f'X-Terminal-Id must be at most {TERMINAL_ID_MAX_LENGTH} characters'}), 400
+        g.origin_store, g.origin_terminal = store_id, terminal_id
+        if sharded:
+            g.store_id = store_id
+
+
+# ---------------- Store databases ----------------
+
+# In dependency order: rows are upserted in this order and deleted in reverse
+_CATALOG_COLUMNS = {
+    User: ('user_id', 'username', 'password', 'role', 'created_at'),
+    Category: ('category_id', 'category_name'),
+    Product: ('product_id', 'product_name', 'category_id', 'price', 'unit', 'sku', 'barcode', 'created_at'),
+}
+CATALOG_WRITES = 'store_catalog_writes'  # session.info key: {model: ids written at the head office}
+SYNC_BATCH = 500  # ids per IN (...) when reading the rows to push
+
+
+def _key(model):
+    return model.__mapper__.primary_key[0]
+
+
+def _catalog_rows(connection, model, ids=None):
+    columns = _CATALOG_COLUMNS[model]
+    query = select(*(getattr(model, c) for c in columns))
+    if ids is None:
+        return [dict(zip(columns, row)) for row in connection.execute(query)]
+    ids = sorted(ids)
+    return [dict(zip(columns, row)) for i in range(0, len(ids), SYNC_BATCH)
+            for row in connection.execute(query.where(_key(model).in_(ids[i:i + SYNC_BATCH])))]
+
+
+def _apply_catalog(connection, rows, deleted):
+    """Upsert rows and delete the ids in deleted ({model: ...}) in a store database, in the caller's transaction.
+
+    Deletes do what the head office's ORM delete did: a deleted user's sales keep no user, a
+    deleted category's products keep no category. A product this store has sold stays (the
+    head office refuses the same delete with a 409); returns the ids of those.
+    """
+    kept = []
+    for model in reversed(_CATALOG_COLUMNS):
+        ids = sorted(deleted.get(model, ()))
+        if model is User and ids:
+            connection.execute(update(Transaction).where(Transaction.user_id.in_(ids)).values(user_id=None))
+        elif model is Category and ids:
+            connection.execute(update(Product).where(Product.category_id.in_(ids)).values(category_id=None))
+        for row_id in ids:
+            try:
+                with connection.begin_nested():
+                    connection.execute(sa.delete(model).where(_key(model) == row_id))
+            except IntegrityError:
+                kept.append(row_id)
+    for model, columns in _CATALOG_COLUMNS.items():
+        if rows.get(model):
+            stmt = sqlite_insert(model.__table__)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[_key(model).name], set_={c: stmt.excluded[c] for c in columns if c != _key(model).name}
+            ), rows[model])
+    return kept
+
+
+def init_store(store_id):
+    """Create store_id's tables and copy the head-office catalog into it; returns {table: rows copied}.
+
+    Existing rows are updated in place except stock, which belongs to the store; new products start at 0.
+    Rows the head office no longer has are deleted (see _apply_catalog). A store database from before
+    integer-cents money is converted first (see money.py).
+    """
+    tables = [t for t in db.metadata.sorted_tables if t.name not in HEAD_OFFICE_TABLES]
+    engine = db.engines[store_bind_key(store_id)]
+    convert_to_cents(engine)
+    db.metadata.create_all(engine, tables=tables)
+    with db.engine.connect() as head_office:
+        catalog = {model: _catalog_rows(head_office, model) for model in _CATALOG_COLUMNS}
+    with store_context(store_id):
+        ensure_search_index()  # before the upserts: the FTS5 triggers index the copied names
+    with engine.begin() as connection:
+        deleted = {}
+        for model in _CATALOG_COLUMNS:
+            current = {row[_key(model).name] for row in catalog[model]}
+            deleted[model] = {row_id for (row_id,) in connection.execute(select(_key(model)))} - current
+        _apply_catalog(connection, catalog, deleted)
+    return {model.__tablename__: len(rows) for model, rows in catalog.items()}
+
+
+def sync_catalog(written):
+    """Push head-office rows ({model: ids} written since the last push) to every initialized store.
+
+    Ids the head office no longer has are deleted from the stores. Returns {store_id: product ids
+    kept because the store has sold them}.
+    """
+    with db.engine.connect() as head_office:
+        rows = {model: _catalog_rows(head_office, model, ids) for model, ids in written.items()}
+    deleted = {model: set(ids) - {row[_key(model).name] for row in rows[model]} for model, ids in written.items()}
+    kept = {}
+    for store_id in store_ids():
+        with db.engines[store_bind_key(store_id)].begin() as connection:
+            if not sa.inspect(connection).has_table(Product.__tablename__):
+                continue  # not initialized yet: `flask stores init` copies the whole catalog
+            kept[store_id] = _apply_catalog(connection, rows, deleted)
+    return kept
+
+
+def catalog_written(model, ids):
+    """Queue rows of model written with Core statements, which bypass the flush hook, for the stores."""
+    if current_store() is None and store_ids():
+        db.session.info.setdefault(CATALOG_WRITES, {}).setdefault(model, set()).update(ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_writes(session, flush_context):
+    if current_store() is not None or not store_ids():
+        return  # only the head office's catalog is pushed
+    for obj in session.new | session.dirty | session.deleted:
+        model = type(obj)
+        if model not in _CATALOG_COLUMNS:
+            continue
+        state = sa.inspect(obj)
+        if obj in session.dirty and not any(state.attrs[c].history.has_changes() for c in _CATALOG_COLUMNS[model]):
+            continue  # e.g. a stock change: stock belongs to each store
+        session.info.setdefault(CATALOG_WRITES, {}).setdefault(model, set()).add(
+            state.mapper.primary_key_from_instance(obj)[0])
+
+
+@event.listens_for(Session, 'after_commit')
+def _push_after_commit(session):
+    written = session.info.pop(CATALOG_WRITES, None)
+    if not written:
+        return
+    try:
+        sync_catalog(written)
+    except Exception:
+        # The head-office commit stands; `flask stores init` copies whatever was missed
+        current_app.logger.exception('Pushing catalog changes to the stores failed')
+    if User in written or Product in written:
+        receipt_cache.invalidate()  # store receipts print the names just pushed
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_catalog_writes(session):
+    session.info.pop(CATALOG_WRITES, None)
+
+
+def consolidate(start=None, end=None):
+    """Replace the head-office copy of every store's rollups for [start, end] (all days when omitted)."""
+    def in_range(column):
+        return [c for c in ((column >= start) if start else None, (column <= end) if end else None) if c is not None]
+
+    merged = {}
+    for store_id in store_ids():
+        with store_context(store_id):
+            daily = db.session.query(DailySales.sales_date, DailySales.total_sales, DailySales.transaction_count) \
+                .filter(*in_range(DailySales.sales_date)).all()
+            products = db.session.query(DailyProductSales.sales_date, DailyProductSales.product_id,
+                                        DailyProductSales.quantity_sold, DailyProductSales.revenue) \
+                .filter(*in_range(DailyProductSales.sales_date)).all()
+
+        def work():
+            for model, rows in ((StoreDailySales, daily), (StoreDailyProductSales, products)):
+                db.session.execute(db.delete(model).where(model.store_id == store_id, *in_range(model.sales_date)))
+                if rows:
+                    db.session.execute(insert(model), [dict(row._asdict(), store_id=store_id) for row in rows])
+            db.session.commit()
+        run_with_retry(work)
+        merged[store_id] = len(daily)
+    return merged
+
+
+def store_report(start, end, limit=10):
+    """Chain-wide sales for [start, end] from the consolidated rollups, per store and in total."""
+    stores = db.session.query(
+        StoreDailySales.store_id, func.sum(StoreDailySales.total_sales), func.sum(StoreDailySales.transaction_count)
+    ).filter(StoreDailySales.sales_date.between(start, end)).group_by(StoreDailySales.store_id) \
+        .order_by(StoreDailySales.store_id).all()
+    top = db.session.query(
+        StoreDailyProductSales.product_id, Product.product_name,
+        func.sum(StoreDailyProductSales.quantity_sold).label('quantity'), func.sum(StoreDailyProductSales.revenue)
+    ).outerjoin(Product, Product.product_id == StoreDailyProductSales.product_id).filter(
+        StoreDailyProductSales.sales_date.between(start, end)
+    ).group_by(StoreDailyProductSales.product_id).order_by(func.sum(StoreDailyProductSales.quantity_sold).desc()) \
+        .limit(limit).all()
+    return {
+        'start': str(start),
+        'end': str(end),
+        'stores': [{'store_id': s, 'total_sales': to_amount(total or 0), 'transactions': count or 0}
+                   for s, total, count in stores],
+        'total_sales': to_amount(sum(total or 0 for _, total, _ in stores)),
+        'transactions': sum(count or 0 for _, _, count in stores),
+        'top_products': [{'product_id': pid, 'product_name': name, 'quantity': quantity, 'revenue': to_amount(revenue)}
+                         for pid, name, quantity, revenue in top],
+        'consolidated_through': str(db.session.query(func.max(StoreDailySales.sales_date)).scalar() or '')
+    }
+
+
+stores_cli = AppGroup('stores', help='Per-store databases and head-office consolidation.')
+
+
+@stores_cli.command('list')
+def list_command():
+    """Show the configured stores and their databases."""
+    for store_id in store_ids():
+        click.echo(f"{store_id:<20} {current_app.config['STORE_DATABASES'][store_id]}")
+    click.echo(f'{len(store_ids())} stores.')
+
+
+@stores_cli.command('init')
+@click.argument('store', required=False)
+def init_command(store):
+    """Create the store databases (or just STORE) and copy the catalog into them; safe to re-run."""
+    for store_id in [store] if store else store_ids():
+        copied = init_store(store_id)
+        click.echo(f"{store_id}: {', '.join(f'{n} {t}' for t, n in copied.items())}")
+
+
+@stores_cli.command('consolidate')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']))
+def consolidate_command(start, end):
+    """Merge every store's daily rollups into the head-office database."""
+    merged = consolidate(start and start.date(), end and end.date())
+    for store_id, days in merged.items():
+        click.echo(f'{store_id}: {days} days')
+    click.echo(f'Consolidated at {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC.')